@@ -2,6 +2,8 @@
 ASGI config for buxta project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is the recommended entry point: the cart and catalog API views are
+async (see "Deployment (ASGI)" in the README).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
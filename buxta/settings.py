@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the middleware too
+    'home.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +56,8 @@ ROOT_URLCONF = 'buxta.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for the request metrics
+        'BACKEND': 'home.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -62,6 +65,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'home.caching.fragment_settings',
             ],
         },
     },
@@ -122,8 +126,90 @@ STATICFILES_DIRS = [
 # STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Book images are stored by content hash (home/storage.py), so identical
+# uploads share one file
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'book_images': {'BACKEND': 'home.storage.ContentAddressedStorage'},
+}
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-ALLOWED_HOSTS = ['*']
\ No newline at end of file
+ALLOWED_HOSTS = ['*']
+
+# Shop listing
+# Books per keyset page and how long the (approximate) total count is cached
+SHOP_PAGE_SIZE = 24
+SHOP_COUNT_CACHE_TIMEOUT = 300
+
+# Full-text search (see home/search.py)
+# 'auto' uses SQLite FTS5 when available, otherwise an in-process index
+SEARCH_BACKEND = 'auto'
+# Caps ranked storefront results; dashboard filters keep every match
+SEARCH_MAX_RESULTS = 1000
+SEARCH_INDEX_MAX_AGE = 300
+
+# Order numbers (see home/order_numbers.py)
+# Each process reserves ORDER_NUMBER_BLOCK_SIZE numbers per database round trip
+ORDER_NUMBER_ALLOCATOR = 'home.order_numbers.SequenceAllocator'
+ORDER_NUMBER_PREFIX = 'BX'
+ORDER_NUMBER_BLOCK_SIZE = 20
+
+# Dashboard header statistics (see home/stats.py), cached per panel
+DASHBOARD_STATS_TIMEOUT = 60
+
+# Per-request metrics (see home/instrumentation.py): Server-Timing headers
+# for staff (for everyone when DEBUG is on) and one JSON line per request on
+# the "buxta.requests" logger, logged as a warning when a request runs more
+# than REQUEST_QUERY_BUDGET queries
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_SERVER_TIMING = True
+REQUEST_QUERY_BUDGET = 30
+
+# Caches (see home/caching.py). Local memory is per process: with several
+# worker processes, signal-driven invalidation only reaches the process
+# that made the change, so point both aliases at a shared backend (Redis,
+# memcached) in that setup. Fragment keys are versioned by Book.updated_at
+# and stay correct across processes either way.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'buxta-default',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Used by {% cache %} blocks
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'buxta-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
+# Storefront lists (trending books, shop categories) and rendered book fragments
+STOREFRONT_CACHE_TIMEOUT = 300
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Background jobs (home/jobs.py), run by `manage.py run_worker`. With
+# JOBS_RUN_INLINE they run in the web process after the request's
+# transaction commits instead, which needs no worker but blocks the request.
+JOBS_RUN_INLINE = False
+JOB_MAX_ATTEMPTS = 5
+# Seconds before the first retry; doubled for each attempt after that
+JOB_RETRY_DELAY = 30
+# Seconds after which a running job is assumed lost with its worker
+JOB_LOCK_TIMEOUT = 600
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # Over-budget requests only; set to INFO to log every request
+        'buxta.requests': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -28,10 +28,12 @@ urlpatterns = [
     
     # Orders management
     path('orders/', admin_views.admin_orders, name='orders'),
+    path('orders/export/', admin_views.export_orders, name='export_orders'),
     path('orders/<uuid:order_id>/', admin_views.admin_order_detail, name='order_detail'),
     
     # Customers management
     path('customers/', admin_views.admin_customers, name='customers'),
+    path('customers/export/', admin_views.export_customers, name='export_customers'),
     
     # Authors management
     path('authors/', admin_views.admin_authors, name='authors'),
@@ -51,6 +53,7 @@ path('categories/<int:category_id>/delete/', admin_views.delete_category, name='
     # Reviews management
 path('reviews/', admin_views.admin_reviews, name='admin_reviews'),
 path('reviews/bulk/', admin_views.bulk_review_actions, name='bulk_review_actions'),
+path('reviews/export/', admin_views.export_reviews, name='export_reviews'),
 
     
     # Coupons management
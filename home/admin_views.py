@@ -5,9 +5,11 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.views.decorators.http import require_POST
-from django.db.models import Q, Sum, Count, Avg, F
+from django.db.models import Q, Sum, Count, Avg, F, Max, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from datetime import datetime, timedelta
 from decimal import Decimal
 
@@ -15,6 +17,8 @@ from .models import (
     Book, Author, Category, Publisher, Customer, Order, OrderItem,
     Review, Coupon, Cart, CartItem, OrderStatusHistory
 )
+from . import analytics, exports, media, ratings, stats
+from . import search as search_index
 
 
 @staff_member_required
@@ -22,21 +26,13 @@ def admin_dashboard(request):
     """Main admin dashboard with key metrics and recent activity."""
     
     # Calculate key metrics
-    total_revenue = Order.objects.filter(
-        status__in=['confirmed', 'processing', 'shipped', 'delivered']
-    ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
-    
-    total_orders = Order.objects.count()
-    total_books = Book.objects.filter(is_active=True).count()
-    active_customers = Customer.objects.count()
-    pending_orders = Order.objects.filter(status='pending').count()
-    pending_reviews = Review.objects.filter(is_approved=False).count()
+    metrics = stats.get('dashboard')
     
     # Get recent orders
     recent_orders = Order.objects.select_related('customer__user').order_by('-created_at')[:10]
     
     # Get top selling books
-    top_books = Book.objects.filter(is_active=True, is_bestseller=True)[:5]
+    top_books = Book.objects.filter(is_active=True, is_bestseller=True).select_related('cover').prefetch_related('authors')[:5]
     
     # Get low stock books
     low_stock_books = Book.objects.filter(
@@ -45,12 +41,7 @@ def admin_dashboard(request):
     )[:10]
     
     context = {
-        'total_revenue': total_revenue,
-        'total_orders': total_orders,
-        'total_books': total_books,
-        'active_customers': active_customers,
-        'pending_orders': pending_orders,
-        'pending_reviews': pending_reviews,
+        **metrics,
         'recent_orders': recent_orders,
         'top_books': top_books,
         'low_stock_books': low_stock_books,
@@ -117,8 +108,8 @@ def books_management(request):
                 return JsonResponse({'success': False, 'message': f'An error occurred: {str(e)}'})
 
     # GET request - display the books management page
-    books = Book.objects.select_related('publisher').prefetch_related(
-        'authors', 'categories', 'images'
+    books = Book.objects.select_related('publisher', 'cover').prefetch_related(
+        'authors', 'categories'
     ).order_by('-created_at')
     
     categories = Category.objects.filter(is_active=True).order_by('name')
@@ -126,21 +117,16 @@ def books_management(request):
     publishers = Publisher.objects.order_by('name')
     
     # Calculate statistics
-    active_books_count = books.filter(is_active=True).count()
-    low_stock_count = books.filter(
-        stock_quantity__lte=F('low_stock_threshold'), 
-        stock_quantity__gt=0
-    ).count()
-    out_of_stock_count = books.filter(stock_quantity=0).count()
+    book_stats = stats.get('books')
 
     context = {
         'books': books,
         'categories': categories,
         'authors': authors,
         'publishers': publishers,
-        'active_books_count': active_books_count,
-        'low_stock_count': low_stock_count,
-        'out_of_stock_count': out_of_stock_count,
+        'active_books_count': book_stats['active'],
+        'low_stock_count': book_stats['low_stock'],
+        'out_of_stock_count': book_stats['out_of_stock'],
     }
     return render(request, 'dashboard/books_management.html', context)
 
@@ -251,12 +237,15 @@ def delete_book(request, book_id):
     """Delete a book"""
     if request.method == 'POST':
         book = get_object_or_404(Book, id=book_id)
-        
-        # Delete associated images
-        for image in book.images.all():
-            if os.path.exists(image.image.path):
-                os.remove(image.image.path)
-        
+
+        # Order items protect the book; it has to be deactivated instead
+        if OrderItem.objects.filter(book=book).exists():
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Cannot delete a book that has been ordered. Deactivate it instead.'
+            })
+
+        # Image files go with the cascade (see media.bury)
         book.delete()
         return JsonResponse({
             'status': 'success',
@@ -317,7 +306,9 @@ def book_images_list(request, book_id):
             'id': img.id,
             'image_url': img.image.url,
             'alt_text': img.alt_text,
-            'is_primary': img.is_primary
+            'is_primary': img.is_primary,
+            'status': img.status,
+            'error': img.error,
         } for img in images]
     }
     return JsonResponse(data)
@@ -345,15 +336,18 @@ def upload_book_images(request, book_id):
                 alt_text=f"Image for {book.title}",
                 is_primary=False  # Additional images are not primary by default
             )
+            # Resizing and validation happen in the job worker; poll
+            # book_images_list for the status
             uploaded_images.append({
                 'id': img.id,
-                'image_url': img.image.url
+                'image_url': img.image.url,
+                'status': img.status,
             })
         
         return JsonResponse({
             'success': True, 
             'images': uploaded_images,
-            'message': f'{len(uploaded_images)} image(s) uploaded successfully'
+            'message': f'{len(uploaded_images)} image(s) uploaded, processing'
         })
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
@@ -395,10 +389,6 @@ def delete_image(request, book_id, image_id):
                 'message': 'Cannot delete the only image. Please upload a replacement first.'
             })
         
-        # Delete the file from storage
-        if os.path.exists(image.image.path):
-            os.remove(image.image.path)
-        
         # If deleting primary image, set another as primary
         if image.is_primary:
             next_image = book.images.exclude(id=image.id).first()
@@ -593,8 +583,6 @@ def handle_edit_book(request):
         # Delete old primary image if exists
         old_primary = book.images.filter(is_primary=True).first()
         if old_primary:
-            if os.path.exists(old_primary.image.path):
-                os.remove(old_primary.image.path)
             old_primary.delete()
         # Create new primary image
         BookImage.objects.create(
@@ -605,56 +593,83 @@ def handle_edit_book(request):
         )
 
     return JsonResponse({'success': True, 'message': 'Book updated successfully!'})
-@staff_member_required
-def admin_orders(request):
-    """Orders management page."""
-    
-    # Get filter parameters
-    search = request.GET.get('search', '')
-    status = request.GET.get('status', '')
-    date_from = request.GET.get('date_from', '')
-    date_to = request.GET.get('date_to', '')
+def _parse_day(value):
+    """A date from a YYYY-MM-DD filter, or None if it's blank or invalid"""
+    try:
+        return parse_date(value) if value else None
+    except ValueError:
+        return None
+
+
+def _with_item_counts(orders):
+    """Annotate item_count with a correlated subquery rather than a join"""
+    return orders.annotate(item_count=Coalesce(Subquery(
+        OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        .annotate(n=Count('id')).values('n')
+    ), 0))
+
+
+def _filtered_orders(request):
+    """The orders list's queryset and filter values, shared with its export"""
+    filters = {name: request.GET.get(name, '') for name in ('search', 'status', 'date_from', 'date_to')}
     
     # Base queryset
     orders = Order.objects.select_related('customer__user').order_by('-created_at')
     
     # Apply filters
-    if search:
-        orders = orders.filter(
-            Q(order_number__icontains=search) |
-            Q(customer__user__first_name__icontains=search) |
-            Q(customer__user__last_name__icontains=search) |
-            Q(customer__user__email__icontains=search)
-        )
+    if filters['search']:
+        orders = search_index.filter_queryset(orders, filters['search'])
     
-    if status:
-        orders = orders.filter(status=status)
+    if filters['status']:
+        orders = orders.filter(status=filters['status'])
     
-    if date_from:
-        orders = orders.filter(created_at__date__gte=date_from)
+    # Compare created_at against datetimes rather than its date so the
+    # (status, created_at) index can be used
+    start = _parse_day(filters['date_from'])
+    end = _parse_day(filters['date_to'])
+    if start:
+        orders = orders.filter(created_at__gte=analytics.day_range(start, start)[0])
+    if end:
+        orders = orders.filter(created_at__lt=analytics.day_range(end, end)[1])
     
-    if date_to:
-        orders = orders.filter(created_at__date__lte=date_to)
+    return orders, filters
+
+
+@staff_member_required
+def admin_orders(request):
+    """Orders management page."""
+    orders, current_filters = _filtered_orders(request)
     
     # Pagination
     paginator = Paginator(orders, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    # Item counts and the first two titles for just this page, in two queries
+    page_obj.object_list = list(_with_item_counts(page_obj.object_list).prefetch_related(
+        Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related('book').order_by('id')[:2],
+            to_attr='preview_items',
+        )
+    ))
+    
     context = {
         'page_obj': page_obj,
         'order_statuses': Order.ORDER_STATUS_CHOICES,
-        'current_filters': {
-            'search': search,
-            'status': status,
-            'date_from': date_from,
-            'date_to': date_to,
-        }
+        'current_filters': current_filters,
     }
     
     return render(request, 'dashboard/orders_list.html', context)
 
 
+@staff_member_required
+def export_orders(request):
+    """Stream the filtered orders list as CSV or JSON Lines."""
+    orders, _ = _filtered_orders(request)
+    return exports.export_response(request, _with_item_counts(orders), exports.ORDER_COLUMNS, 'orders')
+
+
 @staff_member_required
 def admin_order_detail(request, order_id):
     """Order detail and management page."""
@@ -692,27 +707,28 @@ def admin_order_detail(request, order_id):
     return render(request, 'dashboard/orders_detail.html', context)
 
 
-@staff_member_required
-def admin_customers(request):
-    """Customers management page."""
-    
-    search = request.GET.get('search', '')
-    
+def _filtered_customers(search):
+    """Customers matching ``search``, with their order statistics"""
     customers = Customer.objects.select_related('user')
     
     if search:
-        customers = customers.filter(
-            Q(user__first_name__icontains=search) |
-            Q(user__last_name__icontains=search) |
-            Q(user__email__icontains=search) |
-            Q(phone__icontains=search)
-        )
+        customers = search_index.filter_queryset(customers, search)
     
     # Add order statistics
-    customers = customers.annotate(
+    return customers.annotate(
         total_orders=Count('orders'),
-        total_spent=Sum('orders__total_amount')
+        total_spent=Sum('orders__total_amount'),
+        last_order_at=Max('orders__created_at'),
     )
+
+
+@staff_member_required
+def admin_customers(request):
+    """Customers management page."""
+    
+    search = request.GET.get('search', '')
+    
+    customers = _filtered_customers(search)
     
     paginator = Paginator(customers, 20)
     page_number = request.GET.get('page')
@@ -726,6 +742,13 @@ def admin_customers(request):
     return render(request, 'dashboard/customers_list.html', context)
 
 
+@staff_member_required
+def export_customers(request):
+    """Stream the filtered customers list as CSV or JSON Lines."""
+    customers = _filtered_customers(request.GET.get('search', '')).order_by('id')
+    return exports.export_response(request, customers, exports.CUSTOMER_COLUMNS, 'customers')
+
+
 @staff_member_required
 def admin_authors(request):
     """Authors management page."""
@@ -734,17 +757,10 @@ def admin_authors(request):
     authors = Author.objects.all().annotate(book_count=Count('books'))
     
     if search:
-        authors = authors.filter(
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search) |
-            Q(bio__icontains=search)
-        )
+        authors = search_index.filter_queryset(authors, search)
     
-    # Statistics
-    total_authors = authors.count()
-    authors_with_books = authors.filter(book_count__gt=0).count()
-    most_productive = authors.order_by('-book_count').first()
-    authors_without_books = authors.filter(book_count=0).count()
+    # Statistics, for the search results when searching
+    author_stats = stats.contributor_stats(authors) if search else stats.get('authors')
     
     paginator = Paginator(authors, 20)
     page_number = request.GET.get('page')
@@ -753,10 +769,10 @@ def admin_authors(request):
     context = {
         'page_obj': page_obj,
         'current_search': search,
-        'total_authors': total_authors,
-        'authors_with_books': authors_with_books,
-        'most_productive': most_productive,
-        'authors_without_books': authors_without_books,
+        'total_authors': author_stats['total'],
+        'authors_with_books': author_stats['with_books'],
+        'most_books': author_stats['most_books'],
+        'authors_without_books': author_stats['without_books'],
     }
     
     return render(request, 'dashboard/authors_list.html', context)
@@ -787,6 +803,7 @@ def add_edit_author(request, author_id=None):
         
         # Handle photo upload
         if 'photo' in request.FILES:
+            media.bury(author.photo.name)
             author.photo = request.FILES['photo']
         
         author.save()
@@ -996,7 +1013,7 @@ from django.utils.text import slugify
 from .models import Publisher
 
 @staff_member_required
-def admin_publishers(request):
+def admin_publishers(request, publisher_id=None):
     """Publishers management page (list + add/edit)."""
     if request.method == 'POST':
         # Check if it's an AJAX request
@@ -1070,7 +1087,7 @@ def admin_publishers(request):
                     })
                     
                 elif action == 'edit':
-                    publisher_id = request.POST.get('publisher_id')
+                    publisher_id = request.POST.get('publisher_id', publisher_id)
                     if not publisher_id:
                         return JsonResponse({
                             'success': False,
@@ -1173,7 +1190,7 @@ def admin_publishers(request):
             return redirect('publishers')
             
         elif action == 'edit':
-            publisher_id = request.POST.get('publisher_id')
+            publisher_id = request.POST.get('publisher_id', publisher_id)
             publisher = get_object_or_404(Publisher, id=publisher_id)
             publisher.name = request.POST.get('name')
             publisher.address = request.POST.get('address', '')
@@ -1192,25 +1209,18 @@ def admin_publishers(request):
     ).order_by('name')
     
     if search:
-        publishers = publishers.filter(
-            Q(name__icontains=search) |
-            Q(address__icontains=search) |
-            Q(email__icontains=search)
-        )
+        publishers = search_index.filter_queryset(publishers, search)
     
-    # Statistics
-    total_publishers = publishers.count()
-    publishers_with_books = publishers.filter(book_count__gt=0).count()
-    most_productive = publishers.order_by('-book_count').first()
-    publishers_without_books = publishers.filter(book_count=0).count()
+    # Statistics, for the search results when searching
+    publisher_stats = stats.contributor_stats(publishers) if search else stats.get('publishers')
     
     context = {
         'publishers': publishers,
         'current_search': search,
-        'total_publishers': total_publishers,
-        'publishers_with_books': publishers_with_books,
-        'most_productive': most_productive,
-        'publishers_without_books': publishers_without_books,
+        'total_publishers': publisher_stats['total'],
+        'publishers_with_books': publisher_stats['with_books'],
+        'most_books': publisher_stats['most_books'],
+        'publishers_without_books': publisher_stats['without_books'],
     }
     
     return render(request, 'dashboard/publishers_list.html', context)
@@ -1242,6 +1252,33 @@ def delete_publisher(request, publisher_id):
         })
 
 
+def _filtered_reviews(request):
+    """The reviews list's queryset and filter values, shared with its export"""
+    reviews = Review.objects.select_related('book', 'customer__user').all()
+    
+    # Filter by status
+    status_filter = request.GET.get('status', 'all')
+    if status_filter == 'pending':
+        reviews = reviews.filter(is_approved=False)
+    elif status_filter == 'approved':
+        reviews = reviews.filter(is_approved=True)
+    elif status_filter == 'verified':
+        reviews = reviews.filter(is_verified_purchase=True)
+    
+    # Filter by rating
+    rating_filter = request.GET.get('rating')
+    if rating_filter:
+        reviews = reviews.filter(rating=rating_filter)
+    
+    # Search functionality
+    search_query = request.GET.get('search', '').strip()
+    if search_query:
+        reviews = search_index.filter_queryset(reviews, search_query)
+    
+    # Order reviews
+    return reviews.order_by('-created_at'), status_filter, rating_filter, search_query
+
+
 @staff_member_required
 def admin_reviews(request):
     """Reviews management page (list + approve/reject/delete)."""
@@ -1308,54 +1345,18 @@ def admin_reviews(request):
                 })
 
     # GET request - list reviews with filters
-    reviews = Review.objects.select_related('book', 'customer__user').all()
-    
-    # Filter by status
-    status_filter = request.GET.get('status', 'all')
-    if status_filter == 'pending':
-        reviews = reviews.filter(is_approved=False)
-    elif status_filter == 'approved':
-        reviews = reviews.filter(is_approved=True)
-    elif status_filter == 'verified':
-        reviews = reviews.filter(is_verified_purchase=True)
-    
-    # Filter by rating
-    rating_filter = request.GET.get('rating')
-    if rating_filter:
-        reviews = reviews.filter(rating=rating_filter)
-    
-    # Search functionality
-    search_query = request.GET.get('search', '').strip()
-    if search_query:
-        reviews = reviews.filter(
-            Q(title__icontains=search_query) |
-            Q(content__icontains=search_query) |
-            Q(book__title__icontains=search_query) |
-            Q(customer__user__first_name__icontains=search_query) |
-            Q(customer__user__last_name__icontains=search_query)
-        )
-    
-    # Order reviews
-    reviews = reviews.order_by('-created_at')
+    reviews, status_filter, rating_filter, search_query = _filtered_reviews(request)
     
     # Calculate statistics
-    total_reviews = Review.objects.count()
-    pending_reviews = Review.objects.filter(is_approved=False).count()
-    approved_reviews = Review.objects.filter(is_approved=True).count()
-    verified_reviews = Review.objects.filter(is_verified_purchase=True).count()
-    
-    # Calculate average rating
-    avg_rating = Review.objects.filter(is_approved=True).aggregate(
-        avg_rating=Avg('rating')
-    )['avg_rating'] or 0
+    review_stats = stats.get('reviews')
     
     context = {
         'reviews': reviews,
-        'total_reviews': total_reviews,
-        'pending_reviews': pending_reviews,
-        'approved_reviews': approved_reviews,
-        'verified_reviews': verified_reviews,
-        'avg_rating': round(avg_rating, 1),
+        'total_reviews': review_stats['total'],
+        'pending_reviews': review_stats['pending'],
+        'approved_reviews': review_stats['approved'],
+        'verified_reviews': review_stats['verified'],
+        'avg_rating': round(review_stats['avg_rating'], 1),
         'status_filter': status_filter,
         'rating_filter': rating_filter,
         'search_query': search_query,
@@ -1364,6 +1365,13 @@ def admin_reviews(request):
     return render(request, 'dashboard/reviews_list.html', context)
 
 
+@staff_member_required
+def export_reviews(request):
+    """Stream the filtered reviews list as CSV or JSON Lines."""
+    reviews = _filtered_reviews(request)[0]
+    return exports.export_response(request, reviews, exports.REVIEW_COLUMNS, 'reviews')
+
+
 @staff_member_required
 def bulk_review_actions(request):
     """Handle bulk actions on reviews."""
@@ -1380,17 +1388,17 @@ def bulk_review_actions(request):
             
             reviews = Review.objects.filter(id__in=review_ids)
             
+            # Go through home.ratings so book rating aggregates follow the bulk change
             if action == 'approve':
-                reviews.update(is_approved=True)
+                ratings.set_approval(reviews, True)
                 message = f'{reviews.count()} reviews approved successfully!'
                 
             elif action == 'reject':
-                reviews.update(is_approved=False)
+                ratings.set_approval(reviews, False)
                 message = f'{reviews.count()} reviews rejected successfully!'
                 
             elif action == 'delete':
-                count = reviews.count()
-                reviews.delete()
+                count = ratings.delete_reviews(reviews)
                 message = f'{count} reviews deleted successfully!'
                 
             else:
@@ -1399,6 +1407,8 @@ def bulk_review_actions(request):
                     'message': 'Invalid action'
                 })
             
+            # Bulk updates skip the signals that refresh the header counts
+            stats.invalidate(Review)
             return JsonResponse({
                 'success': True,
                 'message': message
@@ -1443,32 +1453,42 @@ def admin_coupons(request):
 
 @staff_member_required
 def admin_api_sales_data(request):
-    """API endpoint for sales chart data."""
-    
-    period = request.GET.get('period', '7')  # 7, 30, or 90 days
-    days = int(period)
-    
-    end_date = timezone.now().date()
-    start_date = end_date - timedelta(days=days)
-    
-    # Get daily sales data
-    sales_data = []
-    current_date = start_date
-    
-    while current_date <= end_date:
-        daily_sales = Order.objects.filter(
-            created_at__date=current_date,
-            status__in=['confirmed', 'processing', 'shipped', 'delivered']
-        ).aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        sales_data.append({
-            'date': current_date.strftime('%Y-%m-%d'),
-            'sales': float(daily_sales)
-        })
-        
-        current_date += timedelta(days=1)
-    
-    return JsonResponse({'sales_data': sales_data})
+    """
+    API endpoint for sales chart data.
+
+    Query params: ``period`` (days back from today, default 7) or an explicit
+    ``start``/``end`` (YYYY-MM-DD), and ``granularity`` (day, week or month).
+    """
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in analytics.GRANULARITIES:
+        return JsonResponse({'error': 'granularity must be day, week or month'}, status=400)
+
+    try:
+        if request.GET.get('start') or request.GET.get('end'):
+            end_date = (datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+                        if request.GET.get('end') else timezone.localdate())
+            start_date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+        else:
+            days = int(request.GET.get('period', '7'))  # 7, 30, or 90 days
+            end_date = timezone.localdate()
+            start_date = end_date - timedelta(days=days)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid date range'}, status=400)
+
+    if start_date > end_date:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+    if analytics.bucket_count(start_date, end_date, granularity) > 1000:
+        return JsonResponse({'error': 'Date range too large for this granularity'}, status=400)
+
+    sales_data = analytics.sales_series(start_date, end_date, granularity)
+
+    return JsonResponse({
+        'sales_data': sales_data,
+        'totals': analytics.summarize(sales_data),
+        'granularity': granularity,
+        'start': start_date.strftime('%Y-%m-%d'),
+        'end': end_date.strftime('%Y-%m-%d'),
+    })
 
 
 @staff_member_required
@@ -0,0 +1,194 @@
+# home/analytics.py
+"""Sales reporting for the dashboard."""
+import threading
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import DailySalesRollup, Order, OrderItem
+
+# Orders that count as revenue
+REVENUE_STATUSES = ['confirmed', 'processing', 'shipped', 'delivered']
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def bucket_start(day, granularity):
+    """The first day of the bucket ``day`` falls in"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == 'week':
+        return day + timedelta(days=7)
+    if granularity == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def day_range(start, end):
+    """Aware [start, end + 1 day) datetimes for inclusive local dates"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def rebuild_rollups(start=None, end=None):
+    """
+    Recompute DailySalesRollup rows for ``start``..``end`` (inclusive dates,
+    or the whole order history when omitted) with three grouped queries.
+
+    Returns the number of days that have orders.
+    """
+    count = write_rollups(Order, OrderItem, DailySalesRollup, start, end)
+    # Imported here: stats reads lifetime_revenue() from this module
+    from . import stats
+    stats.invalidate(DailySalesRollup)
+    return count
+
+
+def write_rollups(order_model, item_model, rollup_model, start=None, end=None):
+    """
+    The work behind rebuild_rollups(), on the given models so the migration
+    that creates the rollup table can backfill it with historical ones.
+    """
+    orders = order_model.objects.all()
+    items = item_model.objects.filter(order__status__in=REVENUE_STATUSES)
+    rollups = rollup_model.objects.all()
+    if start is not None and end is not None:
+        # Compare created_at against a datetime range so its index can be used
+        range_start, range_end = day_range(start, end)
+        orders = orders.filter(created_at__gte=range_start, created_at__lt=range_end)
+        items = items.filter(order__created_at__gte=range_start, order__created_at__lt=range_end)
+        rollups = rollups.filter(date__gte=start, date__lte=end)
+
+    tz = timezone.get_current_timezone()
+    days = defaultdict(lambda: {
+        'revenue': Decimal('0'), 'order_count': 0, 'units_sold': 0,
+        'status_counts': {}, 'category_revenue': {},
+    })
+
+    status_rows = orders.annotate(
+        day=Trunc('created_at', 'day', output_field=DateField(), tzinfo=tz)
+    ).order_by().values('day', 'status').annotate(n=Count('id'), revenue=Sum('total_amount'))
+    for row in status_rows:
+        day = days[row['day']]
+        day['status_counts'][row['status']] = row['n']
+        if row['status'] in REVENUE_STATUSES:
+            day['revenue'] += row['revenue'] or 0
+            day['order_count'] += row['n']
+
+    items = items.annotate(
+        day=Trunc('order__created_at', 'day', output_field=DateField(), tzinfo=tz)
+    ).order_by()
+    for row in items.values('day').annotate(units=Sum('quantity')):
+        days[row['day']]['units_sold'] = row['units'] or 0
+    # An item in several categories counts towards each of them
+    for row in items.filter(book__categories__isnull=False).values(
+        'day', 'book__categories'
+    ).annotate(revenue=Sum('total')):
+        days[row['day']]['category_revenue'][str(row['book__categories'])] = str(row['revenue'])
+
+    with transaction.atomic():
+        rollups.exclude(date__in=list(days)).delete()
+        rollup_model.objects.bulk_create(
+            [rollup_model(date=day, **values) for day, values in days.items()],
+            update_conflicts=True,
+            unique_fields=['date'],
+            update_fields=['revenue', 'order_count', 'units_sold', 'status_counts',
+                           'category_revenue', 'updated_at'],
+            batch_size=500,
+        )
+    return len(days)
+
+
+_pending = threading.local()
+
+
+def schedule_refresh(day):
+    """
+    Refresh one day's rollup after the current transaction commits.
+
+    Saving an order and its items schedules the same day many times. Every
+    call registers a callback and the first of them to run for a still
+    pending day does the work, so a rolled back savepoint that took some of
+    the callbacks with it can't leave the day stale.
+    """
+    days = _pending.__dict__.setdefault('days', set())
+    days.add(day)
+
+    def refresh():
+        if day in days:
+            days.discard(day)
+            rebuild_rollups(day, day)
+
+    transaction.on_commit(refresh)
+
+
+def sales_series(start, end, granularity='day'):
+    """
+    Revenue, order count, units sold and average order value per bucket
+    between ``start`` and ``end`` (inclusive dates), read from the daily
+    rollup rather than the order table.
+
+    Buckets without orders are filled in with zeros.
+    """
+    rows = DailySalesRollup.objects.filter(date__gte=start, date__lte=end).values_list(
+        'date', 'revenue', 'order_count', 'units_sold'
+    )
+    buckets = defaultdict(lambda: [Decimal('0'), 0, 0])
+    for day, revenue, order_count, units_sold in rows:
+        bucket = buckets[bucket_start(day, granularity)]
+        bucket[0] += revenue
+        bucket[1] += order_count
+        bucket[2] += units_sold
+
+    series = []
+    day = bucket_start(start, granularity)
+    while day <= end:
+        sales, orders, units = buckets.get(day, (Decimal('0'), 0, 0))
+        series.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'sales': float(sales),
+            'orders': orders,
+            'units': units,
+            'average_order_value': float(sales / orders) if orders else 0.0,
+        })
+        day = next_bucket(day, granularity)
+    return series
+
+
+def lifetime_revenue():
+    return DailySalesRollup.objects.aggregate(total=Sum('revenue'))['total'] or Decimal('0')
+
+
+def summarize(series):
+    """Totals across a series returned by sales_series()"""
+    sales = sum(point['sales'] for point in series)
+    orders = sum(point['orders'] for point in series)
+    return {
+        'sales': round(sales, 2),
+        'orders': orders,
+        'units': sum(point['units'] for point in series),
+        'average_order_value': round(sales / orders, 2) if orders else 0.0,
+    }
+
+
+def bucket_count(start, end, granularity):
+    """How many buckets a range produces, without building it"""
+    if granularity == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    days = (end - start).days + 1
+    return days // 7 + 2 if granularity == 'week' else days
+
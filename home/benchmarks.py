@@ -0,0 +1,224 @@
+# home/benchmarks.py
+"""
+Request-level benchmarks for the storefront and dashboard.
+
+Each scenario issues real requests through the Django test client against
+the configured database (run seed_perf_data first) and records latency and
+query count per request. run() returns p50/p95 latency and mean/max query
+counts per scenario as a JSON-ready report, which can be saved as a
+baseline and compared against later runs with compare().
+"""
+import json
+import math
+import platform
+import statistics
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Book, Cart, CartItem, Category, Customer
+
+CHECKOUT_FORM = {
+    'billing_first_name': 'Bench', 'billing_last_name': 'Mark', 'billing_phone': '0700000000',
+    'billing_address_line_1': '1 Bench Road', 'billing_city': 'Nairobi', 'billing_state': 'Nairobi',
+    'billing_postal_code': '00100', 'billing_country': 'Kenya',
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Bench:
+    """Shared state for the scenarios: clients, a shopper and sample rows"""
+
+    def __init__(self):
+        self.books = list(
+            Book.objects.filter(is_active=True, stock_quantity__gte=20).order_by('id').values_list('id', 'slug')[:200]
+        )
+        if not self.books:
+            raise RuntimeError("No in-stock books to benchmark with; run seed_perf_data first")
+        self.category = Category.objects.filter(is_active=True, books__isnull=False).values_list('slug', flat=True).first()
+        self.search_term = Book.objects.filter(pk=self.books[0][0]).values_list('title', flat=True)[0].split()[0]
+        self.turn = 0
+
+        # A failing view is recorded by its status code instead of aborting the run
+        self.anonymous = Client(raise_request_exception=False)
+        self.shopper = Client(raise_request_exception=False)
+        user, _ = User.objects.get_or_create(username='bench-shopper', defaults={'email': 'bench@example.com'})
+        self.customer, _ = Customer.objects.get_or_create(user=user)
+        self.shopper.force_login(user)
+        staff, _ = User.objects.get_or_create(username='bench-staff', defaults={'is_staff': True})
+        self.staff = Client(raise_request_exception=False)
+        self.staff.force_login(staff)
+
+    def next_book(self):
+        self.turn += 1
+        return self.books[self.turn % len(self.books)]
+
+    def fill_cart(self, lines=3):
+        """Put ``lines`` books in the shopper's cart, outside the timed request"""
+        cart, _ = Cart.objects.get_or_create(customer=self.customer)
+        cart.items.all().delete()
+        book_ids = [self.next_book()[0] for _ in range(lines)]
+        books = Book.objects.in_bulk(book_ids)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, book=book, quantity=1, price=book.price) for book in books.values()
+        ])
+        return cart
+
+
+# name -> setup(bench) returning a zero-argument callable that makes the
+# timed request; setup work (filling carts) stays outside the timing
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+    return register
+
+
+def page(name, client_attr, url_name, query=''):
+    """Register a plain GET scenario"""
+    scenario(name)(lambda bench: (lambda: getattr(bench, client_attr).get(reverse(url_name) + query)))
+
+
+page('home', 'anonymous', 'home')
+page('shop', 'anonymous', 'shop')
+page('shop_api', 'anonymous', 'shop_api')
+
+
+@scenario('shop_category')
+def shop_category(bench):
+    return lambda: bench.anonymous.get(reverse('shop'), {'category': bench.category})
+
+
+@scenario('shop_search')
+def shop_search(bench):
+    return lambda: bench.anonymous.get(reverse('shop'), {'search': bench.search_term})
+
+
+@scenario('book_detail')
+def book_detail(bench):
+    url = reverse('book_detail', args=[bench.next_book()[1]])
+    return lambda: bench.anonymous.get(url)
+
+
+@scenario('cart_add')
+def cart_add(bench):
+    bench.fill_cart(0)
+    url = reverse('add_to_cart', args=[bench.next_book()[0]])
+    return lambda: bench.shopper.post(url)
+
+
+@scenario('cart_update')
+def cart_update(bench):
+    item = bench.fill_cart(1).items.get()
+    url = reverse('update_cart_item', args=[item.id])
+    return lambda: bench.shopper.post(url, json.dumps({'quantity': 2}), content_type='application/json')
+
+
+@scenario('cart_remove')
+def cart_remove(bench):
+    item = bench.fill_cart(1).items.get()
+    url = reverse('remove_from_cart', args=[item.id])
+    return lambda: bench.shopper.post(url)
+
+
+@scenario('cart_data')
+def cart_data(bench):
+    bench.fill_cart(3)
+    return lambda: bench.shopper.get(reverse('cart_data'))
+
+
+@scenario('checkout')
+def checkout(bench):
+    bench.fill_cart(3)
+    return lambda: bench.shopper.get(reverse('checkout'))
+
+
+@scenario('place_order')
+def place_order(bench):
+    bench.fill_cart(3)
+    return lambda: bench.shopper.post(reverse('place_order'), CHECKOUT_FORM)
+
+
+page('admin_dashboard', 'staff', 'dashboard')
+page('admin_sales_data', 'staff', 'api_sales_data', '?period=90')
+page('admin_books', 'staff', 'books')
+page('admin_orders', 'staff', 'orders')
+page('admin_customers', 'staff', 'customers')
+page('admin_authors', 'staff', 'authors')
+page('admin_publishers', 'staff', 'publishers')
+page('admin_categories', 'staff', 'categories')
+page('admin_reviews', 'staff', 'admin_reviews')
+
+
+def run_scenario(bench, setup, iterations, warmup=2):
+    latencies, queries, statuses = [], [], set()
+    for i in range(warmup + iterations):
+        request = setup(bench)
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+        if i >= warmup:
+            latencies.append(elapsed * 1000)
+            queries.append(len(ctx))
+            statuses.add(response.status_code)
+    return {
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'mean_queries': round(statistics.mean(queries), 1),
+        'max_queries': max(queries),
+        'statuses': sorted(statuses),
+    }
+
+
+def run(names=None, iterations=20, log=lambda message: None):
+    """Run the named scenarios (all by default) and return the report"""
+    bench = Bench()
+    results = {}
+    for name in names or SCENARIOS:
+        results[name] = run_scenario(bench, SCENARIOS[name], iterations)
+        log(f"{name:<20} p50 {results[name]['p50_ms']:>8.2f}ms  p95 {results[name]['p95_ms']:>8.2f}ms  "
+            f"queries {results[name]['mean_queries']:>6} (max {results[name]['max_queries']})")
+    return {
+        'created_at': timezone.now().isoformat(),
+        'iterations': iterations,
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'books': Book.objects.count(),
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, latency_tolerance=0.25):
+    """
+    Regressions of ``report`` against ``baseline``: any rise in max query
+    count, or a p95 more than ``latency_tolerance`` (a fraction) slower.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        if result['max_queries'] > before['max_queries']:
+            regressions.append(f"{name}: queries {before['max_queries']} -> {result['max_queries']}")
+        if result['p95_ms'] > before['p95_ms'] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+    return regressions
@@ -0,0 +1,65 @@
+# home/caching.py
+"""
+Storefront caching.
+
+Two layers, both on the backends configured in CACHES:
+
+* Object cache: whole query results the storefront shows on every page
+  (the home page's trending books, the shop's root categories), cached
+  for STOREFRONT_CACHE_TIMEOUT seconds in the default cache and dropped
+  by signals when books, images or categories change.
+
+* Fragment cache: book cards and the book detail body are {% cache %}
+  blocks in the "template_fragments" cache, keyed on book.cache_version.
+  That version is Book.updated_at, so instead of deleting fragments,
+  anything that changes what a book's fragments show bumps its
+  updated_at with touch_books(); the next render misses and old
+  versions age out.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import Book, Category
+
+TRENDING_KEY = 'storefront:trending'
+ROOT_CATEGORIES_KEY = 'storefront:root-categories'
+TRENDING_LIMIT = 8
+
+
+def trending_books():
+    """Featured books for the home page, newest first"""
+    return cache.get_or_set(TRENDING_KEY, lambda: list(
+        Book.objects.filter(is_active=True, is_featured=True)
+        .select_related('cover').order_by('-created_at')[:TRENDING_LIMIT]
+    ), settings.STOREFRONT_CACHE_TIMEOUT)
+
+
+def root_categories():
+    """Active top-level categories for the shop sidebar"""
+    return cache.get_or_set(ROOT_CATEGORIES_KEY, lambda: list(
+        Category.objects.filter(is_active=True, parent=None)
+    ), settings.STOREFRONT_CACHE_TIMEOUT)
+
+
+def invalidate(*keys):
+    """Drop cached lists once the transaction commits"""
+    keys = keys or (TRENDING_KEY, ROOT_CATEGORIES_KEY)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def touch_books(books):
+    """
+    Give books new fragment versions. ``books`` is a Book queryset or an
+    iterable of ids; one UPDATE either way, and no Book signals fire.
+    """
+    if not isinstance(books, QuerySet):
+        books = Book.objects.filter(pk__in=list(books))
+    return books.update(updated_at=timezone.now())
+
+
+def fragment_settings(request):
+    """Context processor: the timeout for {% cache %} blocks"""
+    return {'FRAGMENT_CACHE_TIMEOUT': settings.FRAGMENT_CACHE_TIMEOUT}
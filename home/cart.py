@@ -0,0 +1,219 @@
+# home/cart.py
+"""
+Cart service used by the storefront views.
+
+The cart is looked up once per request and memoized on it; its item count
+and subtotal come from Cart.get_summary() (one aggregate query), and every
+mutation below invalidates that summary so the next read is fresh.
+
+Carts are created lazily. Reads go through get_cart(), which never writes:
+a visitor who hasn't added anything has no Cart row and, if anonymous, no
+session either, and is treated as having an empty cart. Only the views
+that add to the cart call aget_or_create_cart().
+
+The cart AJAX endpoints are async views, so the functions they use are
+async too (the "a" prefixed ones, on Django's async ORM); the checkout
+pages are synchronous and use get_cart().
+"""
+import hashlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Cart, CartItem, Customer
+
+EMPTY_SUMMARY = {
+    'line_count': 0,
+    'last_modified': None,
+    'total_items': 0,
+    'subtotal': Decimal('0.00'),
+}
+
+
+class CartError(Exception):
+    """A cart change that can't be made, with a message for the shopper"""
+
+
+def get_cart(request):
+    """The visitor's existing cart, or None; never creates anything"""
+    if hasattr(request, '_cart'):
+        return request._cart
+
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(customer__user=request.user).order_by('id').first()
+    else:
+        session_key = request.session.session_key
+        cart = Cart.objects.filter(session_key=session_key).order_by('id').first() if session_key else None
+
+    request._cart = cart
+    return cart
+
+
+async def aget_cart(request):
+    """get_cart() for async views"""
+    if hasattr(request, '_cart'):
+        return request._cart
+
+    user = await request.auser()
+    if user.is_authenticated:
+        cart = await Cart.objects.filter(customer__user=user).order_by('id').afirst()
+    else:
+        session_key = request.session.session_key
+        cart = await Cart.objects.filter(session_key=session_key).order_by('id').afirst() if session_key else None
+
+    request._cart = cart
+    return cart
+
+
+async def aget_or_create_cart(request):
+    """The visitor's cart, creating it (and an anonymous session) on first use"""
+    cart = await aget_cart(request)
+    if cart is not None:
+        return cart
+
+    user = await request.auser()
+    if user.is_authenticated:
+        customer, _ = await Customer.objects.aget_or_create(user=user)
+        cart, created = await Cart.objects.aget_or_create(customer=customer)
+    else:
+        session_key = request.session.session_key
+        if not session_key:
+            await request.session.acreate()
+            session_key = request.session.session_key
+        cart, created = await Cart.objects.aget_or_create(session_key=session_key)
+
+    request._cart = cart
+    return cart
+
+
+def get_summary(cart):
+    """cart.get_summary(), or an empty cart's summary when there is no cart"""
+    return cart.get_summary() if cart is not None else dict(EMPTY_SUMMARY)
+
+
+async def aget_summary(cart):
+    return await cart.aget_summary() if cart is not None else dict(EMPTY_SUMMARY)
+
+
+async def aadd_book(cart, book):
+    """Add one copy of ``book``, raising CartError if it can't be added"""
+    if not book.is_in_stock:
+        raise CartError('This book is out of stock')
+
+    cart_item, created = await CartItem.objects.aget_or_create(
+        cart=cart,
+        book=book,
+        defaults={'price': book.price}
+    )
+    if not created:
+        if cart_item.quantity >= book.stock_quantity:
+            raise CartError('Maximum stock quantity reached')
+        cart_item.quantity += 1
+        await cart_item.asave(update_fields=['quantity', 'updated_at'])
+
+    cart.invalidate_summary()
+    return cart_item
+
+
+async def aset_quantity(cart, cart_item, quantity):
+    """
+    Change an item's quantity (its book must be loaded); zero or less
+    removes it.
+
+    Returns the item, or None if it was removed.
+    """
+    if quantity <= 0:
+        await aremove_item(cart, cart_item)
+        return None
+
+    if quantity > cart_item.book.stock_quantity:
+        raise CartError('Quantity exceeds available stock')
+
+    cart_item.quantity = quantity
+    await cart_item.asave(update_fields=['quantity', 'updated_at'])
+    cart.invalidate_summary()
+    return cart_item
+
+
+async def aremove_item(cart, cart_item):
+    await cart_item.adelete()
+    cart.invalidate_summary()
+
+
+async def asummary_payload(cart):
+    """The cart_count / cart_subtotal fields every cart AJAX response carries"""
+    summary = await aget_summary(cart)
+    return {
+        'cart_count': summary['total_items'],
+        'cart_subtotal': str(summary['subtotal']),
+    }
+
+
+def summary_etag(cart, summary):
+    """
+    ETag for the cart sidebar, derived from the cart's summary.
+
+    Any add, quantity change or removal changes the line count, quantities
+    or latest item timestamp, and with them the tag.
+    """
+    last_modified = summary['last_modified'].isoformat() if summary['last_modified'] else ''
+    raw = f"{cart.pk if cart else ''}:{summary['line_count']}:{summary['total_items']}:{summary['subtotal']}:{last_modified}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def items_with_covers(cart):
+    """Cart items with their book and its cover loaded in the same query"""
+    return cart.items.select_related('book__cover').order_by('created_at', 'id')
+
+
+def stale_carts(now=None):
+    """
+    Anonymous carts nobody can reach any more.
+
+    With database sessions that is a cart whose session has expired or been
+    deleted. Other session engines leave nothing to check against, so there
+    it is a cart with no activity for SESSION_COOKIE_AGE seconds.
+    """
+    now = now or timezone.now()
+    carts = Cart.objects.filter(customer__isnull=True)
+    if settings.SESSION_ENGINE in ('django.contrib.sessions.backends.db',
+                                   'django.contrib.sessions.backends.cached_db'):
+        live = Session.objects.filter(session_key=OuterRef('session_key'), expire_date__gt=now)
+        return carts.exclude(Exists(live))
+    cutoff = now - timedelta(seconds=settings.SESSION_COOKIE_AGE)
+    recent = CartItem.objects.filter(cart=OuterRef('pk'), updated_at__gte=cutoff)
+    return carts.filter(updated_at__lt=cutoff).exclude(Exists(recent))
+
+
+def purge_stale_carts(batch_size=500, dry_run=False, log=lambda message: None):
+    """
+    Delete stale_carts() and their items, ``batch_size`` carts per short
+    transaction, so no lock is held for long. Returns (carts, items) deleted,
+    or the counts that would be deleted when ``dry_run`` is set.
+    """
+    now = timezone.now()
+    if dry_run:
+        stale = stale_carts(now)
+        return stale.count(), CartItem.objects.filter(cart__in=stale).count()
+
+    carts = items = 0
+    last_id = 0
+    while True:
+        ids = list(
+            stale_carts(now).filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        last_id = ids[-1]
+        with transaction.atomic():
+            # Checked again inside the transaction, in case a visitor came back
+            _, deleted = stale_carts(now).filter(id__in=ids).delete()
+        carts += deleted.get(Cart._meta.label, 0)
+        items += deleted.get(CartItem._meta.label, 0)
+        log(f"  {carts} cart(s), {items} item(s) deleted so far")
+    return carts, items
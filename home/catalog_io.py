@@ -0,0 +1,456 @@
+# home/catalog_io.py
+"""
+Bulk catalog import and export (CSV or JSON Lines).
+
+One row per book, columns as in COLUMNS. Authors and categories are
+lists: JSON arrays in JSONL, "; "-separated in CSV. Authors are written
+"First Last"; publishers and categories by name.
+
+Import is an upsert keyed on isbn_13, or on slug for rows without one.
+Rows are read as a stream and written CHUNK_SIZE at a time: a handful of
+queries per chunk (bulk_create/bulk_update for books, one insert per M2M
+through table) instead of the ~8 per book the dashboard form takes.
+Authors, categories and publishers are resolved through in-memory
+dictionaries and created in bulk when missing.
+
+An empty cell (or a missing / null JSON key) leaves an existing book's
+value alone and gives a new book the model default. A row that fails
+validation, or whose write violates a constraint, is skipped and listed
+in the importer's errors; the rest of its chunk still goes in.
+
+Model signals don't fire for bulk writes, so each chunk's books are
+reindexed for search directly and the dashboard statistics and
+storefront lists are invalidated at the end.
+"""
+import csv
+import json
+import re
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import caching, search, stats
+from .models import Author, Book, Category, Publisher
+
+COLUMNS = [
+    'isbn_13', 'isbn_10', 'title', 'subtitle', 'slug', 'authors', 'publisher', 'categories',
+    'description', 'excerpt', 'format', 'condition', 'pages', 'language', 'dimensions', 'weight',
+    'publication_date', 'edition', 'price', 'compare_at_price', 'cost_price', 'stock_quantity',
+    'low_stock_threshold', 'meta_description', 'meta_keywords', 'is_active', 'is_featured',
+    'is_bestseller', 'is_new_arrival', 'is_on_sale',
+]
+LIST_COLUMNS = {'authors', 'categories'}
+DECIMAL_FIELDS = {'price', 'compare_at_price', 'cost_price', 'weight'}
+INTEGER_FIELDS = {'pages', 'stock_quantity', 'low_stock_threshold'}
+BOOLEAN_FIELDS = {'is_active', 'is_featured', 'is_bestseller', 'is_new_arrival', 'is_on_sale'}
+CHOICE_FIELDS = {'format': Book.BOOK_FORMATS, 'condition': Book.BOOK_CONDITIONS}
+# Every Book column an import row can set
+BOOK_FIELDS = [name for name in COLUMNS if name not in LIST_COLUMNS | {'publisher'}]
+
+CHUNK_SIZE = 1000
+LIST_SEPARATOR = ';'
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+
+
+class RowError(Exception):
+    """A row that can't be imported, with the reason"""
+
+
+def detect_format(path, default='csv'):
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if path.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+# =============================================================================
+# EXPORT
+# =============================================================================
+
+def book_row(book):
+    """The export row for a book with publisher, authors and categories loaded"""
+    row = {name: getattr(book, name) for name in BOOK_FIELDS}
+    row['authors'] = [author.full_name.strip() for author in book.authors.all()]
+    row['categories'] = [category.name for category in book.categories.all()]
+    row['publisher'] = book.publisher.name if book.publisher else None
+    return row
+
+
+def _serialize(value):
+    if isinstance(value, (Decimal, date)):
+        return str(value)
+    return value
+
+
+def export_books(stream, fmt='csv', queryset=None, chunk_size=2000):
+    """Write every book in ``queryset`` (all by default) to ``stream``; returns the count"""
+    books = (queryset if queryset is not None else Book.objects.all()).order_by('id')
+    books = books.select_related('publisher').prefetch_related('authors', 'categories')
+
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=COLUMNS)
+        writer.writeheader()
+    count = 0
+    # prefetch_related is honoured per chunk by iterator(chunk_size=...)
+    for book in books.iterator(chunk_size=chunk_size):
+        row = {name: _serialize(value) for name, value in book_row(book).items()}
+        if fmt == 'csv':
+            for name in LIST_COLUMNS:
+                row[name] = f'{LIST_SEPARATOR} '.join(row[name])
+            writer.writerow({name: '' if value is None else value for name, value in row.items()})
+        else:
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+# =============================================================================
+# IMPORT: PARSING
+# =============================================================================
+
+def read_rows(stream, fmt='csv'):
+    """Yield (line number, row dict or RowError) from a CSV or JSONL stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, RowError(f"Invalid JSON: {exc}")
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError("Expected a JSON object")
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _list(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        value = value.split(LIST_SEPARATOR)
+    return [item for item in (_text(v) for v in value) if item]
+
+
+def _isbn(value, length):
+    isbn = re.sub(r'[\s-]', '', value).upper()
+    pattern = r'\d{13}' if length == 13 else r'\d{9}[\dX]'
+    if not re.fullmatch(pattern, isbn):
+        raise RowError(f"isbn_{length} must be {length} digits, got {value!r}")
+    return isbn
+
+
+def _field_value(name, value):
+    if name in DECIMAL_FIELDS:
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            raise RowError(f"{name} is not a number: {value!r}")
+        if number < 0:
+            raise RowError(f"{name} can't be negative")
+        return number.quantize(Decimal('0.01'))
+    if name in INTEGER_FIELDS:
+        if not value.isdigit():
+            raise RowError(f"{name} must be a whole number, got {value!r}")
+        return int(value)
+    if name in BOOLEAN_FIELDS:
+        if value.lower() in TRUE_VALUES:
+            return True
+        if value.lower() in FALSE_VALUES:
+            return False
+        raise RowError(f"{name} must be true or false, got {value!r}")
+    if name == 'publication_date':
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise RowError(f"publication_date must be YYYY-MM-DD, got {value!r}")
+    if name in CHOICE_FIELDS:
+        for key, label in CHOICE_FIELDS[name]:
+            if value.lower() in (key, label.lower()):
+                return key
+        raise RowError(f"Unknown {name} {value!r}")
+    if name in ('isbn_13', 'isbn_10'):
+        return _isbn(value, int(name[5:]))
+
+    max_length = Book._meta.get_field(name).max_length
+    if max_length and len(value) > max_length:
+        raise RowError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+@dataclass(eq=False)
+class ParsedRow:
+    line: int
+    key: str
+    values: dict
+    authors: list = None
+    categories: list = None
+    publisher: str = None
+
+
+def parse_row(line, row):
+    """Validate a raw row into a ParsedRow, raising RowError"""
+    values = {}
+    for name in BOOK_FIELDS:
+        value = _text(row.get(name))
+        if value:
+            values[name] = _field_value(name, value)
+    if values.get('slug') and values['slug'] != slugify(values['slug']):
+        raise RowError(f"Invalid slug {values['slug']!r}")
+
+    key = values.get('isbn_13') or values.get('slug')
+    if not key:
+        raise RowError("Each row needs an isbn_13 or a slug")
+    return ParsedRow(
+        line=line,
+        key=key,
+        values=values,
+        authors=_list(row.get('authors')),
+        categories=_list(row.get('categories')),
+        publisher=_text(row.get('publisher')) or None,
+    )
+
+
+def split_author_name(name):
+    """'First Middle Last' or 'Last, First' -> (first, last)"""
+    if ',' in name:
+        last, first = (part.strip() for part in name.split(',', 1))
+        return first, last
+    first, _, last = name.rpartition(' ')
+    return (first, last) if first else (last, '')
+
+
+# =============================================================================
+# IMPORT: WRITING
+# =============================================================================
+
+class CatalogImporter:
+    """
+    Streams rows into the catalog. Keep one instance per import: its
+    lookup dictionaries are loaded once and grow as rows add names.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, update_existing=True, log=lambda message: None):
+        self.chunk_size = chunk_size
+        self.update_existing = update_existing
+        self.log = log
+        self.created = self.updated = self.skipped = 0
+        self.errors = []  # [(line, key, message)]
+        self.seen = set()
+
+        self.authors = {
+            (first.lower(), last.lower()): pk
+            for pk, first, last in Author.objects.values_list('id', 'first_name', 'last_name')
+        }
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list('id', 'name')}
+        self.category_slugs = set(Category.objects.values_list('slug', flat=True))
+        self.publishers = {name.lower(): pk for pk, name in Publisher.objects.values_list('id', 'name')}
+        self.new_author_ids = []
+        self.new_publisher_ids = []
+
+    def error(self, line, key, message):
+        self.errors.append((line, key or '', message))
+
+    def run(self, rows):
+        """Import (line, row) pairs as yielded by read_rows(); returns self"""
+        chunk = []
+        for line, row in rows:
+            chunk.append((line, row))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk)
+        self.finish()
+        return self
+
+    def import_chunk(self, chunk):
+        parsed = []
+        for line, row in chunk:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                item = parse_row(line, row)
+                if item.key in self.seen:
+                    raise RowError(f"Duplicate of an earlier row for {item.key}")
+            except RowError as exc:
+                self.error(line, row.get('isbn_13') or row.get('slug') if isinstance(row, dict) else '', str(exc))
+                continue
+            self.seen.add(item.key)
+            parsed.append(item)
+        if not parsed:
+            return
+
+        existing = self._existing_books(parsed)
+        new, changed = [], []
+        for item in parsed:
+            book = existing.get(item.key)
+            if book is None:
+                missing = [name for name in ('title', 'price') if name not in item.values]
+                if missing:
+                    self.error(item.line, item.key, f"New book needs {' and '.join(missing)}")
+                    continue
+                new.append(item)
+            elif self.update_existing:
+                changed.append((item, book))
+            else:
+                self.skipped += 1
+        if not new and not changed:
+            return
+
+        self._resolve_names(new + [item for item, _ in changed])
+        self._assign_slugs(new)
+        try:
+            with transaction.atomic():
+                self._write(new, changed)
+        except IntegrityError:
+            # Find the offending rows one at a time; the rest still go in
+            for item in new:
+                self._write_one([item], [])
+            for pair in changed:
+                self._write_one([], [pair])
+            return
+        self.created += len(new)
+        self.updated += len(changed)
+        self.log(f"  {self.created} created, {self.updated} updated, {len(self.errors)} error(s)")
+
+    def _write_one(self, new, changed):
+        item = (new or [changed[0][0]])[0]
+        try:
+            with transaction.atomic():
+                self._write(new, changed)
+        except IntegrityError as exc:
+            self.error(item.line, item.key, f"Rejected by the database: {exc}")
+            return
+        self.created += len(new)
+        self.updated += len(changed)
+
+    def _existing_books(self, parsed):
+        isbns = [item.key for item in parsed if item.values.get('isbn_13')]
+        slugs = [item.key for item in parsed if not item.values.get('isbn_13')]
+        books = {}
+        if isbns:
+            books.update((book.isbn_13, book) for book in Book.objects.filter(isbn_13__in=isbns))
+        if slugs:
+            books.update((book.slug, book) for book in Book.objects.filter(slug__in=slugs))
+        return books
+
+    def _resolve_names(self, items):
+        """Create the authors, categories and publishers this chunk names for the first time"""
+        authors, categories, publishers = {}, {}, {}
+        for item in items:
+            for name in item.authors or ():
+                first, last = split_author_name(name)
+                if (first.lower(), last.lower()) not in self.authors:
+                    authors[first.lower(), last.lower()] = Author(first_name=first, last_name=last)
+            for name in item.categories or ():
+                if name.lower() not in self.categories:
+                    categories[name.lower()] = name
+            if item.publisher and item.publisher.lower() not in self.publishers:
+                publishers[item.publisher.lower()] = Publisher(name=item.publisher)
+
+        with transaction.atomic():
+            for key, author in zip(authors, Author.objects.bulk_create(authors.values())):
+                self.authors[key] = author.pk
+                self.new_author_ids.append(author.pk)
+            for key, publisher in zip(publishers, Publisher.objects.bulk_create(publishers.values())):
+                self.publishers[key] = publisher.pk
+                self.new_publisher_ids.append(publisher.pk)
+            new_categories = []
+            for name in categories.values():
+                slug = base = slugify(name)[:90] or 'category'
+                n = 1
+                while slug in self.category_slugs:
+                    n += 1
+                    slug = f'{base}-{n}'
+                self.category_slugs.add(slug)
+                new_categories.append(Category(name=name, slug=slug))
+            for key, category in zip(categories, Category.objects.bulk_create(new_categories)):
+                self.categories[key] = category.pk
+
+    def _assign_slugs(self, new):
+        """Unique slugs from the titles of new books that didn't bring one"""
+        wanted = {item: slugify(item.values['title'])[:280] or 'book' for item in new if 'slug' not in item.values}
+        if not wanted:
+            return
+        taken = set(Book.objects.filter(slug__in=set(wanted.values())).values_list('slug', flat=True))
+        taken.update(item.values['slug'] for item in new if 'slug' in item.values)
+        for item, base in wanted.items():
+            slug = base
+            if slug in taken:
+                # Rare enough to look up the numbered variants per title
+                taken.update(Book.objects.filter(slug__startswith=f'{base}-').values_list('slug', flat=True))
+                slug = f'{base}-{item.values["isbn_13"]}' if item.values.get('isbn_13') else base
+                n = 1
+                while slug in taken:
+                    n += 1
+                    slug = f'{base}-{n}'
+            taken.add(slug)
+            item.values['slug'] = slug
+
+    def _write(self, new, changed):
+        now = timezone.now()
+        books = []
+        for item in new:
+            book = Book(**item.values)
+            book.publisher_id = self.publishers.get(item.publisher.lower()) if item.publisher else None
+            books.append(book)
+        Book.objects.bulk_create(books)
+
+        update_fields = {'updated_at'}
+        for item, book in changed:
+            for name, value in item.values.items():
+                setattr(book, name, value)
+            update_fields.update(item.values)
+            if item.publisher:
+                book.publisher_id = self.publishers[item.publisher.lower()]
+                update_fields.add('publisher')
+            # bulk_update doesn't apply auto_now; the new value also gives
+            # the book new fragment cache keys
+            book.updated_at = now
+        if changed:
+            Book.objects.bulk_update([book for _, book in changed], sorted(update_fields))
+
+        pairs = list(zip(new, books)) + changed
+        self._set_relations(Book.authors.through, 'author_id', pairs, 'authors', self._author_ids)
+        self._set_relations(Book.categories.through, 'category_id', pairs, 'categories', self._category_ids)
+        search.index_queryset(Book.objects.filter(pk__in=[book.pk for _, book in pairs]))
+
+    def _author_ids(self, names):
+        return [self.authors[tuple(part.lower() for part in split_author_name(name))] for name in names]
+
+    def _category_ids(self, names):
+        return [self.categories[name.lower()] for name in names]
+
+    def _set_relations(self, through, column, pairs, attr, resolve):
+        """Replace the M2M rows of every book whose row lists ``attr``"""
+        given = [(book, resolve(getattr(item, attr))) for item, book in pairs if getattr(item, attr) is not None]
+        if not given:
+            return
+        through.objects.filter(book_id__in=[book.pk for book, _ in given if book.pk]).delete()
+        through.objects.bulk_create([
+            through(book_id=book.pk, **{column: pk})
+            for book, pks in given
+            for pk in dict.fromkeys(pks)
+        ])
+
+    def finish(self):
+        for model, ids in ((Author, self.new_author_ids), (Publisher, self.new_publisher_ids)):
+            if ids:
+                search.index_queryset(model.objects.filter(pk__in=ids))
+        stats.invalidate(Book, Author, Publisher)
+        caching.invalidate()
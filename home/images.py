@@ -0,0 +1,141 @@
+# home/images.py
+"""
+Book image helpers: the denormalized Book.cover pointer and the fixed-size
+renditions list pages serve instead of full-size uploads.
+
+Uploads are saved as they arrive and processed by the job worker (see
+home/jobs.py): process_upload() checks the file really is an image,
+re-encodes it without its metadata at no more than MASTER_SIZE pixels,
+and renders the renditions.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from . import jobs, media
+from .models import Book, BookImage
+
+# name -> (field, width, height); covers are 2:3
+RENDITIONS = {
+    'card': ('card_image', 480, 720),
+    'thumb': ('thumb_image', 160, 240),
+}
+
+# WebP is much smaller for photos; fall back to JPEG if Pillow lacks it
+RENDITION_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+RENDITION_EXTENSION = '.webp' if RENDITION_FORMAT == 'WEBP' else '.jpg'
+
+# Uploads are stored re-encoded at most this many pixels on their longest side
+MASTER_SIZE = 1600
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+# Decoding more than this is refused rather than risking the worker's memory
+MAX_SOURCE_PIXELS = 50_000_000
+
+
+class InvalidImage(ValueError):
+    """An upload that isn't an image we accept"""
+
+
+def render(source, width, height):
+    """Encode ``source`` (a PIL image) cropped and scaled to width x height"""
+    return encode(ImageOps.fit(source, (width, height), Image.LANCZOS))
+
+
+def encode(image):
+    """Encode a PIL image in RENDITION_FORMAT; no metadata is carried over"""
+    buffer = BytesIO()
+    if RENDITION_FORMAT == 'WEBP':
+        image.save(buffer, 'WEBP', quality=82, method=4)
+    else:
+        image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    return ContentFile(buffer.getvalue())
+
+
+def load(book_image, validate=False):
+    """The upload as an upright PIL image in a mode RENDITION_FORMAT can take"""
+    with book_image.image.open('rb') as f:
+        source = Image.open(f)
+        if validate:
+            if source.format not in ACCEPTED_FORMATS:
+                raise InvalidImage(f"Unsupported image format {source.format or 'unknown'}")
+            if source.width * source.height > MAX_SOURCE_PIXELS:
+                raise InvalidImage(f"Image is too large ({source.width}x{source.height})")
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA') or RENDITION_FORMAT == 'JPEG':
+            source = source.convert('RGB')
+        source.load()
+    return source
+
+
+def generate_renditions(book_image, save=True, source=None):
+    """Create every rendition of a BookImage's upload"""
+    if source is None:
+        source = load(book_image)
+
+    stem = os.path.splitext(os.path.basename(book_image.image.name))[0]
+    replaced = []
+    for name, (field, width, height) in RENDITIONS.items():
+        content = render(source, width, height)
+        replaced.append(getattr(book_image, field).name)
+        getattr(book_image, field).save(f'{stem}_{name}{RENDITION_EXTENSION}', content, save=False)
+    media.bury(*replaced)
+
+    if save:
+        book_image.save(update_fields=[field for field, _, _ in RENDITIONS.values()])
+
+
+def process_upload(book_image):
+    """
+    Validate, re-encode and render a pending upload, leaving it ready or,
+    if the file isn't a usable image, failed with the reason.
+    """
+    try:
+        source = load(book_image, validate=True)
+    except (InvalidImage, OSError, Image.DecompressionBombError) as exc:
+        book_image.status = BookImage.FAILED
+        book_image.error = str(exc)[:255]
+        book_image.save(update_fields=['status', 'error'])
+        return
+
+    upload_name = book_image.image.name
+    master = source.copy()
+    master.thumbnail((MASTER_SIZE, MASTER_SIZE), Image.LANCZOS)
+    stem = os.path.splitext(os.path.basename(upload_name))[0]
+    book_image.image.save(f'{stem}{RENDITION_EXTENSION}', encode(master), save=False)
+    generate_renditions(book_image, save=False, source=source)
+
+    book_image.status = BookImage.READY
+    book_image.error = ''
+    book_image.save(update_fields=['image', 'status', 'error'] + [field for field, _, _ in RENDITIONS.values()])
+
+    if upload_name != book_image.image.name:
+        media.bury(upload_name)
+
+
+@jobs.handler('process_image')
+def process_image_job(image_id):
+    book_image = BookImage.objects.filter(pk=image_id, status=BookImage.PENDING).first()
+    # Deleted, or already processed by an earlier run of this job
+    if book_image is not None:
+        process_upload(book_image)
+
+
+def sync_cover(book_id):
+    """
+    Point the book's cover at its primary image (or its first image if none
+    is marked primary), skipping uploads that failed processing. Returns
+    the cover's id.
+    """
+    cover_id = (
+        BookImage.objects.filter(book_id=book_id).exclude(status=BookImage.FAILED)
+        .order_by('-is_primary', 'order', 'created_at')
+        .values_list('id', flat=True).first()
+    )
+    books = Book.objects.filter(pk=book_id)
+    books = books.exclude(cover_id=cover_id) if cover_id else books.filter(cover__isnull=False)
+    # Bump updated_at as well so anything keyed on it sees the new cover
+    books.update(cover_id=cover_id, updated_at=timezone.now())
+    return cover_id
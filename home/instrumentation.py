@@ -0,0 +1,211 @@
+# home/instrumentation.py
+"""
+Per-request query and latency metrics.
+
+RequestMetricsMiddleware times every request and, through a database
+execute wrapper, counts its queries and their time. Repeated SQL is
+reported by fingerprint, the usual sign of an N+1 loop. Template
+rendering is timed by InstrumentedDjangoTemplates, a drop-in replacement
+for the DjangoTemplates backend.
+
+The numbers go out as a Server-Timing header (visible in the browser's
+network panel), sent to staff users or everyone when DEBUG is on, and as
+one JSON log line on the "buxta.requests" logger. Requests over
+REQUEST_QUERY_BUDGET queries are logged as warnings; the others at INFO,
+which the default LOGGING setting leaves out.
+
+Recording a query costs a counter increment and two clock reads, so
+this is meant to stay on in production.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('buxta.requests')
+
+_current = ContextVar('request_metrics', default=None)
+
+# Placeholder lists vary with the number of ids; "IN (%s, %s)" and
+# "IN (%s, %s, %s)" are the same query for N+1 purposes
+_PLACEHOLDER_LIST = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fingerprint(sql):
+    """A short id for ``sql`` that ignores literal values and IN-list lengths"""
+    normalized = _LITERAL.sub('?', _PLACEHOLDER_LIST.sub('(...)', sql))
+    return hashlib.md5(normalized.encode()).hexdigest()[:12], normalized
+
+
+class RequestMetrics:
+    """Counters for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+    def duplicates(self, limit=5):
+        """[(fingerprint, count, sql)] for SQL run more than once, most repeated first"""
+        grouped = {}
+        for sql, count in self.statements.items():
+            key, normalized = fingerprint(sql)
+            entry = grouped.setdefault(key, [0, normalized])
+            entry[0] += count
+        repeated = [(key, count, sql) for key, (count, sql) in grouped.items() if count > 1]
+        repeated.sort(key=lambda item: -item[1])
+        return repeated[:limit]
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.statements[sql] += 1
+
+
+def wrap_connections(metrics):
+    """An ExitStack recording this thread's queries into ``metrics`` until closed"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+    return stack
+
+
+def current_metrics():
+    """The metrics of the request being handled, if it is instrumented"""
+    return _current.get()
+
+
+class RequestMetricsMiddleware:
+    """
+    Record query count, DB/template time and latency for every request.
+
+    Sync- and async-capable: under ASGI a sync-only middleware first in the
+    stack would run the whole chain, async views included, in a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'REQUEST_QUERY_BUDGET', None)
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timing = self.server_timing and (settings.DEBUG or self.is_staff(getattr(request, 'user', None)))
+        return self.finish(request, response, metrics, timing)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        # Connections belong to a thread, and the async ORM runs its queries
+        # on the request's sync_to_async thread, so wrap the ones there
+        stack = await sync_to_async(wrap_connections)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        timing = self.server_timing and (
+            settings.DEBUG or hasattr(request, 'auser') and self.is_staff(await request.auser())
+        )
+        return self.finish(request, response, metrics, timing)
+
+    @staticmethod
+    def is_staff(user):
+        # Timings reveal how a page is built; only staff get them outside DEBUG
+        return user is not None and user.is_staff
+
+    def finish(self, request, response, metrics, timing):
+        total = time.perf_counter() - metrics.started
+        if timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.query_count} queries"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+        self.log(request, response, metrics, total)
+        return response
+
+    def log(self, request, response, metrics, total):
+        over_budget = self.query_budget is not None and metrics.query_count > self.query_budget
+        level = logging.WARNING if over_budget else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+
+        match = request.resolver_match
+        duplicates = metrics.duplicates()
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': metrics.query_count,
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'template_ms': round(metrics.template_time * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+            'duplicate_queries': [
+                {'fingerprint': key, 'count': count, 'sql': sql[:200]}
+                for key, count, sql in duplicates
+            ],
+        }
+        if over_budget:
+            record['query_budget'] = self.query_budget
+        logger.log(level, json.dumps(record))
+
+
+class InstrumentedTemplate(Template):
+    """A Django template whose render time is added to the request's metrics"""
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates that times top-level template rendering"""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
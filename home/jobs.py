@@ -0,0 +1,129 @@
+# home/jobs.py
+"""
+A small job queue kept in the database.
+
+Code that wants work done outside the request calls enqueue(kind, ...)
+with JSON-serializable keyword arguments; the run_worker command claims
+pending jobs and runs the function registered for their kind with
+@handler(kind) on a thread pool. A job that raises is retried with
+exponential backoff until JOB_MAX_ATTEMPTS, then left as failed with its
+traceback. Jobs whose worker died mid-run are handed out again after
+JOB_LOCK_TIMEOUT seconds, so handlers must be safe to run twice.
+
+With JOBS_RUN_INLINE each job runs in the enqueuing process as soon as
+its transaction commits, for development without a worker.
+"""
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function that runs jobs of ``kind``"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, **payload):
+    """Queue a job; it becomes visible to workers when the transaction commits"""
+    job = Job.objects.create(kind=kind, payload=payload)
+    if settings.JOBS_RUN_INLINE:
+        transaction.on_commit(lambda: work_batch('inline', ids=[job.pk]))
+    return job
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale():
+    """Hand back jobs that have been running longer than JOB_LOCK_TIMEOUT"""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.PENDING, locked_by='', locked_at=None
+    )
+
+
+def claim(worker, limit, ids=None):
+    """Mark up to ``limit`` due jobs as running for ``worker`` and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(status=Job.PENDING, run_after__lte=now).order_by('id')
+        if ids is not None:
+            due = due.filter(pk__in=ids)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        picked = list(due.values_list('id', flat=True)[:limit])
+        # The status condition keeps two workers from both taking a job
+        # on backends without SKIP LOCKED
+        Job.objects.filter(pk__in=picked, status=Job.PENDING).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(pk__in=picked, status=Job.RUNNING, locked_by=worker, locked_at=now))
+
+
+def run_job(job):
+    """Run one claimed job; True if it succeeded"""
+    try:
+        HANDLERS[job.kind](**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < settings.JOB_MAX_ATTEMPTS:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.PENDING, locked_by='', locked_at=None, last_error=error,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, locked_by='', last_error=error)
+        return False
+    Job.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def _run_in_thread(job):
+    # Each pool thread has its own connection; don't leave it open between jobs
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def work_batch(worker, limit=None, ids=None, pool=None):
+    """Claim and run one batch of jobs; returns [(job, succeeded)]"""
+    claimed = claim(worker, limit or len(ids), ids)
+    results = pool.map(_run_in_thread, claimed) if pool else map(run_job, claimed)
+    return list(zip(claimed, results))
+
+
+def run_worker(concurrency=4, once=False, poll_interval=2.0, log=lambda message: None):
+    """
+    Process jobs until interrupted, or with ``once`` until none are due.
+    Image work is mostly Pillow, which releases the GIL, so threads scale
+    about as well as processes here without the fork and connection cost.
+    """
+    worker = worker_name()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix='job') as pool:
+        while True:
+            requeue_stale()
+            batch = work_batch(worker, concurrency, pool=pool)
+            for job, succeeded in batch:
+                log(f"{job.kind} #{job.pk}: {'done' if succeeded else 'failed (attempt %d)' % job.attempts}")
+            if not batch:
+                if once:
+                    return
+                time.sleep(poll_interval)
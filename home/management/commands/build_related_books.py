@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home import recommendations
+
+
+class Command(BaseCommand):
+    help = "Precompute the top-N related books for every active book"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=12, help="Neighbours stored per book")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = recommendations.build(top_n=options['top'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {written} related-book rows in {time.monotonic() - started:.1f}s"
+        ))
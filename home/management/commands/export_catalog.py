@@ -0,0 +1,28 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from home import catalog_io
+from home.models import Book
+
+
+class Command(BaseCommand):
+    help = "Export the catalog as CSV or JSON Lines, in the format import_catalog reads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file; standard output by default")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension, else csv")
+        parser.add_argument('--active-only', action='store_true', help="Leave out inactive books")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Books fetched per query")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or catalog_io.detect_format(path)
+        books = Book.objects.filter(is_active=True) if options['active_only'] else Book.objects.all()
+
+        if path == '-':
+            catalog_io.export_books(sys.stdout, fmt, books, options['chunk_size'])
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            count = catalog_io.export_books(stream, fmt, books, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} book(s) to {path}"))
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from home import media
+
+
+class Command(BaseCommand):
+    help = "Delete tombstoned media files, then find and delete files under books/, authors/ and categories/ that no row uses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24, help="Hours an unreferenced file must be old to count as orphaned")
+        parser.add_argument('--batch-size', type=int, default=media.TOMBSTONE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="List orphaned files without deleting anything")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        log = self.stdout.write if options['verbosity'] > 1 else (lambda message: None)
+
+        removed = 0
+        if not options['dry_run']:
+            removed = media.process_tombstones(options['batch_size'], log=log)
+
+        orphans = 0
+        for name in media.find_orphans(timedelta(hours=options['min_age']), batch_size=options['batch_size']):
+            orphans += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+                log(f"  deleted {name}")
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} tombstoned file(s). {verb} {orphans} orphaned file(s) "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home import images
+from home.models import BookImage
+
+
+class Command(BaseCommand):
+    help = "Create card and thumbnail renditions for book images that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate existing renditions too")
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        queryset = BookImage.objects.exclude(image='').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(card_image='')
+
+        done = failed = 0
+        for book_image in queryset.iterator(chunk_size=options['chunk_size']):
+            try:
+                images.generate_renditions(book_image)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f"Image {book_image.pk} ({book_image.image.name}): {exc}")
+                continue
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {done} image(s), {failed} failed, in {time.monotonic() - started:.1f}s"
+        ))
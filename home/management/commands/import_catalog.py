@@ -0,0 +1,57 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from home import catalog_io
+
+
+class Command(BaseCommand):
+    help = "Import books from a CSV or JSON Lines file, creating or updating them in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Defaults to the file extension, else csv")
+        parser.add_argument('--chunk-size', type=int, default=catalog_io.CHUNK_SIZE, help="Rows written per transaction")
+        parser.add_argument('--skip-existing', action='store_true', help="Leave books that are already in the catalog alone")
+        parser.add_argument('--errors', metavar='PATH', help="Write rejected rows to this CSV file")
+        parser.add_argument('--dry-run', action='store_true', help="Validate and write everything, then roll back")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or catalog_io.detect_format(path)
+        log = self.stdout.write if options['verbosity'] > 1 else (lambda message: None)
+        started = time.monotonic()
+
+        importer = catalog_io.CatalogImporter(
+            options['chunk_size'], update_existing=not options['skip_existing'], log=log
+        )
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        except OSError as exc:
+            raise CommandError(exc)
+        with stream, transaction.atomic():
+            importer.run(catalog_io.read_rows(stream, fmt))
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as report:
+                writer = csv.writer(report)
+                writer.writerow(['line', 'key', 'error'])
+                writer.writerows(importer.errors)
+        else:
+            for line, key, message in importer.errors[:20]:
+                self.stderr.write(f"line {line} {key}: {message}")
+            if len(importer.errors) > 20:
+                self.stderr.write(f"... and {len(importer.errors) - 20} more; use --errors to get them all")
+
+        verb = "Would import" if options['dry_run'] else "Imported"
+        summary = (
+            f"{verb} {importer.created + importer.updated} book(s) in {time.monotonic() - started:.1f}s: "
+            f"{importer.created} created, {importer.updated} updated, {importer.skipped} skipped, "
+            f"{len(importer.errors)} rejected"
+        )
+        self.stdout.write(self.style.WARNING(summary) if importer.errors else self.style.SUCCESS(summary))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home import cart
+
+
+class Command(BaseCommand):
+    help = "Delete anonymous carts whose session has expired, with their items, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Carts deleted per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        log = self.stdout.write if options['verbosity'] > 1 else (lambda message: None)
+        carts, items = cart.purge_stale_carts(options['batch_size'], options['dry_run'], log=log)
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {carts} stale cart(s) and {items} item(s) in {time.monotonic() - started:.1f}s"
+        ))
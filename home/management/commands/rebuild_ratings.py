@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from home import ratings
+from home.models import Book
+
+
+class Command(BaseCommand):
+    help = "Recompute Book rating aggregates from approved reviews and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drifted books, don't rewrite them (exits 1 on drift)",
+        )
+        parser.add_argument('--book', type=int, action='append', help="Limit to these book IDs")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        books = Book.objects.all()
+        if options['book']:
+            books = books.filter(id__in=options['book'])
+
+        fix = not options['check']
+        drifted = 0
+        for book, expected_sum, expected_count in ratings.rebuild(
+            books, fix=fix, chunk_size=options['chunk_size']
+        ):
+            drifted += 1
+            self.stdout.write(
+                f"#{book.id} {book.title}: stored {book.rating_sum}/{book.rating_count} "
+                f"(avg {book.avg_rating}), expected {expected_sum}/{expected_count} "
+                f"(avg {ratings.average(expected_sum, expected_count)})"
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Rating aggregates are consistent"))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {drifted} book(s)"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{drifted} book(s) have drifted rating aggregates"))
+            raise SystemExit(1)
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import analytics
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair the DailySalesRollup table from orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="First day to rebuild (YYYY-MM-DD); default: all history")
+        parser.add_argument('--end', help="Last day to rebuild (YYYY-MM-DD); default: --start")
+
+    def handle(self, *args, **options):
+        start = end = None
+        try:
+            if options['start']:
+                start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+                end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else start
+            elif options['end']:
+                raise CommandError("--end requires --start")
+        except ValueError as e:
+            raise CommandError(f"Invalid date: {e}")
+
+        days = analytics.rebuild_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollup for {days} day(s) with orders"))
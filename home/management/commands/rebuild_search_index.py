@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from home import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for books, authors, publishers, customers, orders and reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type', dest='doc_types', action='append', choices=sorted(search.DOCUMENT_TYPES),
+            help="Only rebuild this document type (repeatable)",
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        counts = search.rebuild(options['doc_types'], chunk_size=options['chunk_size'])
+        for doc_type, count in counts.items():
+            self.stdout.write(f"{doc_type}: {count} document(s)")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home import media
+
+
+class Command(BaseCommand):
+    help = "Move book image files uploaded before content-addressed storage to their hashed, sharded names"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        log = self.stdout.write if options['verbosity'] > 1 else (lambda message: None)
+        changed = media.rehash_book_images(options['batch_size'], log=log)
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved the files of {changed} image(s) in {time.monotonic() - started:.1f}s; "
+            f"the old files are removed by the job worker"
+        ))
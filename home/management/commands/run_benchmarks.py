@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark storefront and dashboard views (p50/p95 latency and query counts)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*', metavar='scenario',
+            help=f"Scenarios to run (default: all): {', '.join(benchmarks.SCENARIOS)}",
+        )
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--save', metavar='FILE', help="Write the report to FILE as a baseline")
+        parser.add_argument(
+            '--compare', metavar='FILE',
+            help="Compare against a saved baseline (exits 1 on regressions)",
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="Allowed p95 slowdown against the baseline, as a fraction",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options['scenarios']) - set(benchmarks.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+
+        try:
+            report = benchmarks.run(options['scenarios'], options['iterations'], log=self.stdout.write)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {options['save']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = benchmarks.compare(report, baseline, options['tolerance'])
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.WARNING(line))
+                raise SystemExit(1)
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from home import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (image processing) until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Jobs run at once, one thread each")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once no jobs are due instead of waiting for more")
+
+    def handle(self, *args, **options):
+        log = self.stdout.write if options['verbosity'] > 0 else (lambda message: None)
+        log(f"Worker {jobs.worker_name()} started with {options['concurrency']} thread(s)")
+        try:
+            jobs.run_worker(options['concurrency'], options['once'], options['poll_interval'], log=log)
+        except KeyboardInterrupt:
+            log("Stopped")
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import perfdata
+from home.models import Book
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic dataset for performance testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help="Multiplier on the base counts (1.0 = 1,000 books, 2,000 orders)",
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--replace', action='store_true', help="Delete previously generated data first")
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0:
+            raise CommandError("--scale must be positive")
+
+        if Book.objects.filter(slug__startswith='perf-').exists():
+            if not options['replace']:
+                raise CommandError("Generated data already exists; use --replace to regenerate it")
+            self.stdout.write(f"Deleted {perfdata.clear()} existing rows")
+
+        started = time.monotonic()
+        counts = perfdata.generate(
+            scale=options['scale'], seed=options['seed'],
+            batch_size=options['batch_size'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {counts['books']} books and {counts['orders']} orders "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,170 @@
+# home/media.py
+"""
+Deferred deletion of uploaded files.
+
+Nothing deletes files inside a request. When a row with files is deleted
+(by a view, a queryset delete or a cascade) or a file is replaced, its
+names are written to MediaTombstone in the same transaction, so a rolled
+back delete leaves its files alone. A process_tombstones job removes
+them from storage later, in batches, skipping any name a row still uses.
+Content-addressed storage hands out an existing name for an identical
+upload; it cancels that name's tombstones first (keep()), and the two
+sides lock each other out so the file can't be deleted underneath it.
+
+Files that were never tombstoned (deleted before this existed, or left
+behind by a failed upload) are found by the gc_media command, which
+compares MEDIA_DIRECTORIES in storage against every file field.
+"""
+import re
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import caching, jobs
+from .models import Author, BookImage, Category, Job, MediaTombstone
+from .storage import book_image_storage
+
+# Models whose rows own uploaded files, with those fields
+FILE_FIELDS = {
+    BookImage: ['image', 'card_image', 'thumb_image'],
+    Author: ['photo'],
+    Category: ['image'],
+}
+MEDIA_DIRECTORIES = ['books/', 'authors/', 'categories/']
+TOMBSTONE_BATCH_SIZE = 500
+HASHED_NAME = re.compile(r'/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def file_names(instance):
+    """The names of every file ``instance`` refers to"""
+    return [
+        getattr(instance, field).name for field in FILE_FIELDS[type(instance)]
+        if getattr(instance, field)
+    ]
+
+
+def bury(*names):
+    """Schedule files for deletion once the current transaction commits"""
+    names = [name for name in names if name]
+    if not names:
+        return
+    MediaTombstone.objects.bulk_create([MediaTombstone(name=name) for name in names])
+    # One queued job covers every tombstone written before it runs
+    if not Job.objects.filter(kind='process_tombstones', status=Job.PENDING).exists():
+        jobs.enqueue('process_tombstones')
+
+
+def referenced(names):
+    """Those of ``names`` that some row's file field still points at"""
+    names = list(names)
+    used = set()
+    for model, fields in FILE_FIELDS.items():
+        for field in fields:
+            used.update(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    return used
+
+
+def keep(name):
+    """Cancel any pending deletion of ``name``, which a new row is about to use"""
+    MediaTombstone.objects.filter(name=name).delete()
+
+
+@jobs.handler('process_tombstones')
+def process_tombstones(batch_size=TOMBSTONE_BATCH_SIZE, storage=None, log=lambda message: None):
+    """Delete the files of every tombstone, a batch at a time; returns the number removed"""
+    storage = storage or default_storage
+    removed = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = MediaTombstone.objects.filter(pk__gt=last_id).order_by('pk')
+            if connection.features.has_select_for_update_skip_locked:
+                batch = batch.select_for_update(skip_locked=True)
+            batch = list(batch[:batch_size])
+            if not batch:
+                return removed
+            last_id = batch[-1].pk
+            # Deleting the tombstones before checking references holds their
+            # row locks (the write lock on SQLite) until the files are gone,
+            # so a save() that reuses one of the names in the meantime waits
+            # in keep() and then finds the file missing and writes it again
+            MediaTombstone.objects.filter(pk__in=[tombstone.pk for tombstone in batch]).delete()
+            in_use = referenced(tombstone.name for tombstone in batch)
+            for name in {tombstone.name for tombstone in batch} - in_use:
+                storage.delete(name)
+                removed += 1
+        log(f"  {removed} file(s) removed")
+
+
+def stored_files(storage=None, directories=MEDIA_DIRECTORIES):
+    """Yield the name of every file under ``directories`` in storage"""
+    storage = storage or default_storage
+    pending = [directory.rstrip('/') for directory in directories]
+    while pending:
+        directory = pending.pop()
+        if not storage.exists(directory):
+            continue
+        subdirectories, files = storage.listdir(directory)
+        pending.extend(f'{directory}/{name}' for name in subdirectories)
+        for name in files:
+            yield f'{directory}/{name}'
+
+
+def find_orphans(min_age=timedelta(hours=24), storage=None, batch_size=TOMBSTONE_BATCH_SIZE):
+    """
+    Yield stored files no row refers to. Files younger than ``min_age``
+    are left out: an upload is written to storage before its row commits.
+    """
+    storage = storage or default_storage
+    cutoff = timezone.now() - min_age
+    batch = []
+
+    def orphans_in(names):
+        in_use = referenced(names)
+        for name in names:
+            if name not in in_use and storage.get_modified_time(name) < cutoff:
+                yield name
+
+    for name in stored_files(storage):
+        batch.append(name)
+        if len(batch) >= batch_size:
+            yield from orphans_in(batch)
+            batch = []
+    yield from orphans_in(batch)
+
+
+def rehash_book_images(batch_size=200, log=lambda message: None):
+    """
+    Move BookImage files saved before content-addressed storage to their
+    hashed names; the old files are buried. Returns the number of rows changed.
+    """
+    storage = book_image_storage()
+    fields = FILE_FIELDS[BookImage]
+    changed = 0
+    last_pk = 0
+    while True:
+        batch = list(BookImage.objects.only('pk', 'book_id', *fields).filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not batch:
+            return changed
+        last_pk = batch[-1].pk
+
+        moved, old_names = [], []
+        for book_image in batch:
+            for field in fields:
+                file = getattr(book_image, field)
+                if not file or HASHED_NAME.search(file.name):
+                    continue
+                old_names.append(file.name)
+                with storage.open(file.name, 'rb') as content:
+                    file.name = storage.save(file.name, content)
+                if not moved or moved[-1] is not book_image:
+                    moved.append(book_image)
+        if moved:
+            BookImage.objects.bulk_update(moved, fields)
+            # Cached fragments hold the old URLs
+            caching.touch_books({book_image.book_id for book_image in moved})
+            bury(*old_names)
+            changed += len(moved)
+            log(f"  {changed} image(s) moved")
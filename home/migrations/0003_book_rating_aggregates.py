@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    Book = apps.get_model('home', 'Book')
+    Review = apps.get_model('home', 'Review')
+    rows = Review.objects.filter(is_approved=True).order_by().values('book_id').annotate(
+        total=models.Sum('rating'), n=models.Count('id')
+    )
+    for row in rows:
+        Book.objects.filter(id=row['book_id']).update(
+            rating_sum=row['total'],
+            rating_count=row['n'],
+            avg_rating=(Decimal(row['total']) / row['n']).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0002_book_active_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+FTS_TABLE = 'home_searchdocument_fts'
+
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, keywords, body,
+        content='home_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER home_searchdocument_ai AFTER INSERT ON home_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, keywords, body)
+        VALUES (new.id, new.title, new.keywords, new.body);
+    END""",
+    f"""CREATE TRIGGER home_searchdocument_ad AFTER DELETE ON home_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, keywords, body)
+        VALUES ('delete', old.id, old.title, old.keywords, old.body);
+    END""",
+    f"""CREATE TRIGGER home_searchdocument_au AFTER UPDATE ON home_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, keywords, body)
+        VALUES ('delete', old.id, old.title, old.keywords, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, keywords, body)
+        VALUES (new.id, new.title, new.keywords, new.body);
+    END""",
+]
+
+
+def has_fts5(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def create_fts_table(apps, schema_editor):
+    # Without FTS5 home.search falls back to its in-process index
+    if has_fts5(schema_editor):
+        for statement in FTS_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS home_searchdocument_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0003_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=20)),
+                ('doc_id', models.CharField(max_length=64)),
+                ('title', models.TextField(blank=True, help_text='Highest-weight text: titles, names, ISBNs, order numbers')),
+                ('keywords', models.TextField(blank=True, help_text='Medium-weight text: subtitles, authors, categories')),
+                ('body', models.TextField(blank=True, help_text='Low-weight text: descriptions, bios, review content')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('doc_type', 'doc_id')},
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:32
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    from home.analytics import write_rollups
+    write_rollups(
+        apps.get_model('home', 'Order'),
+        apps.get_model('home', 'OrderItem'),
+        apps.get_model('home', 'DailySalesRollup'),
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0005_related_books'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('units_sold', models.PositiveIntegerField(default=0)),
+                ('status_counts', models.JSONField(default=dict, help_text='Orders per status, e.g. {"pending": 3}')),
+                ('category_revenue', models.JSONField(default=dict, help_text='Item revenue per category ID')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
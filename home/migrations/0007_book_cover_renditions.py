@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_covers(apps, schema_editor):
+    Book = apps.get_model('home', 'Book')
+    BookImage = apps.get_model('home', 'BookImage')
+    first_image = BookImage.objects.filter(book=models.OuterRef('pk')).order_by(
+        '-is_primary', 'order', 'created_at'
+    ).values('id')[:1]
+    Book.objects.update(cover=models.Subquery(first_image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0006_daily_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover',
+            field=models.ForeignKey(blank=True, editable=False, help_text='Denormalized primary image, kept in sync by home/images.py', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='home.bookimage'),
+        ),
+        migrations.AddField(
+            model_name='bookimage',
+            name='card_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='books/renditions/'),
+        ),
+        migrations.AddField(
+            model_name='bookimage',
+            name='thumb_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='books/renditions/'),
+        ),
+        migrations.RunPython(backfill_covers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:08
+
+import home.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0012_media_tombstones'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookimage',
+            name='card_image',
+            field=models.ImageField(blank=True, editable=False, storage=home.storage.book_image_storage, upload_to='books/renditions/'),
+        ),
+        migrations.AlterField(
+            model_name='bookimage',
+            name='image',
+            field=models.ImageField(storage=home.storage.book_image_storage, upload_to='books/'),
+        ),
+        migrations.AlterField(
+            model_name='bookimage',
+            name='thumb_image',
+            field=models.ImageField(blank=True, editable=False, storage=home.storage.book_image_storage, upload_to='books/renditions/'),
+        ),
+        migrations.AddIndex(
+            model_name='bookimage',
+            index=models.Index(fields=['image'], name='bookimage_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookimage',
+            index=models.Index(fields=['card_image'], name='bookimage_card_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookimage',
+            index=models.Index(fields=['thumb_image'], name='bookimage_thumb_image_idx'),
+        ),
+    ]
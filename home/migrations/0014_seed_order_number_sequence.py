@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Orders placed before the sequence existed got "BX" + 8 random digits
+LEGACY_PREFIX = 'BX'
+FIRST_ORDER_NUMBER = 100000
+
+
+def seed_sequence(apps, schema_editor):
+    """
+    Start the order sequence above every legacy number, so sequential
+    numbers can never run into one however many orders are placed.
+    """
+    Order = apps.get_model('home', 'Order')
+    NumberSequence = apps.get_model('home', 'NumberSequence')
+
+    highest = FIRST_ORDER_NUMBER - 1
+    numbers = Order.objects.filter(order_number__startswith=LEGACY_PREFIX).values_list('order_number', flat=True)
+    for number in numbers.iterator(chunk_size=2000):
+        digits = number[len(LEGACY_PREFIX):]
+        if digits.isdigit():
+            highest = max(highest, int(digits))
+
+    sequence, created = NumberSequence.objects.get_or_create(name='order', defaults={'next_value': highest + 1})
+    if not created and sequence.next_value <= highest:
+        sequence.next_value = highest + 1
+        sequence.save(update_fields=['next_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0013_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_sequence, migrations.RunPython.noop),
+    ]
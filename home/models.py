@@ -1,11 +1,16 @@
 # models.py
 from django.db import models
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 import uuid
 from decimal import Decimal
 
+from .storage import book_image_storage
+
 # =============================================================================
 # CATALOG MODELS
 # =============================================================================
@@ -97,6 +102,10 @@ class Book(models.Model):
     authors = models.ManyToManyField(Author, related_name='books')
     publisher = models.ForeignKey(Publisher, on_delete=models.SET_NULL, null=True, blank=True)
     categories = models.ManyToManyField(Category, related_name='books')
+    cover = models.ForeignKey(
+        'BookImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        editable=False, help_text="Denormalized primary image, kept in sync by home/images.py"
+    )
     
     # Content Details
     description = models.TextField()
@@ -133,6 +142,11 @@ class Book(models.Model):
     is_new_arrival = models.BooleanField(default=False)
     is_on_sale = models.BooleanField(default=False)
     
+    # Rating aggregates (denormalized from approved reviews, see home/ratings.py)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=Decimal('0.00'), editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -144,6 +158,7 @@ class Book(models.Model):
             models.Index(fields=['isbn_13']),
             models.Index(fields=['is_active', 'is_featured']),
             models.Index(fields=['price']),
+            models.Index(fields=['is_active', '-created_at', '-id'], name='book_active_created_idx'),
         ]
 
     def __str__(self):
@@ -168,31 +183,83 @@ class Book(models.Model):
 
     @property
     def average_rating(self):
-        reviews = self.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return reviews.aggregate(models.Avg('rating'))['rating__avg']
-        return 0
+        return self.avg_rating
 
     @property
     def review_count(self):
-        return self.reviews.filter(is_approved=True).count()
+        return self.rating_count
+
+    @property
+    def cache_version(self):
+        """Part of every fragment cache key for this book (see home/caching.py)"""
+        return int(self.updated_at.timestamp() * 1000000)
 
 
 class BookImage(models.Model):
     """Multiple images for books"""
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='books/')
+    # Content-addressed: rows with identical images share a file (see home/storage.py)
+    image = models.ImageField(upload_to='books/', storage=book_image_storage)
+    # Fixed-size renditions generated by the job worker (see home/images.py)
+    card_image = models.ImageField(upload_to='books/renditions/', storage=book_image_storage, blank=True, editable=False)
+    thumb_image = models.ImageField(upload_to='books/renditions/', storage=book_image_storage, blank=True, editable=False)
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
     order = models.PositiveIntegerField(default=0)
+    # New uploads are pending until the job worker has validated and processed them
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['order', 'created_at']
+        # Looked up by name before a shared file is deleted (see home/media.py)
+        indexes = [
+            models.Index(fields=['image'], name='bookimage_image_idx'),
+            models.Index(fields=['card_image'], name='bookimage_card_image_idx'),
+            models.Index(fields=['thumb_image'], name='bookimage_thumb_image_idx'),
+        ]
 
     def __str__(self):
         return f"Image for {self.book.title}"
 
+    @property
+    def card_url(self):
+        """Book-card sized image, falling back to the original upload"""
+        return (self.card_image or self.image).url
+
+    @property
+    def thumb_url(self):
+        """Small thumbnail for lists and the cart, falling back to the original upload"""
+        return (self.thumb_image or self.card_image or self.image).url
+
+
+class RelatedBook(models.Model):
+    """Precomputed "related books" neighbours (built by home/recommendations.py)"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='related_books')
+    related = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        unique_together = ['book', 'related']
+        indexes = [
+            models.Index(fields=['book', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.related_id} (#{self.rank})"
+
 
 # =============================================================================
 # CUSTOMER & REVIEW MODELS
@@ -271,6 +338,24 @@ class Review(models.Model):
     def __str__(self):
         return f"Review by {self.customer.full_name} for {self.book.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields() & {'book_id', 'rating', 'is_approved'}:
+            instance.snapshot_rating()
+        return instance
+
+    def snapshot_rating(self):
+        """Remember what this review currently contributes to its book's rating"""
+        self._rating_snapshot = (self.book_id, self.rating_contribution)
+
+    @property
+    def rating_contribution(self):
+        """(sum, count) this review adds to Book.rating_sum / rating_count"""
+        if self.is_approved and self.rating is not None:
+            return (self.rating, 1)
+        return (0, 0)
+
 
 class Wishlist(models.Model):
     """Customer wishlists"""
@@ -296,22 +381,68 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Anonymous carts are looked up by session on every cart request
+            models.Index(fields=['session_key'], name='cart_session_key_idx'),
+        ]
+
     def __str__(self):
         if self.customer:
             return f"Cart for {self.customer.full_name}"
         return f"Anonymous Cart ({self.session_key[:8]}...)"
 
+    @staticmethod
+    def _summary_aggregates():
+        return {
+            'line_count': Count('id'),
+            'last_modified': Max('updated_at'),
+            'total_items': Coalesce(Sum('quantity'), 0),
+            'subtotal': Coalesce(
+                Sum(F('quantity') * F('price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+                Decimal('0.00'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        }
+
+    def _remember_summary(self, summary):
+        # Not every backend returns the computed sum at the field's scale
+        summary['subtotal'] = summary['subtotal'].quantize(Decimal('0.01'))
+        self._summary = summary
+        return summary
+
+    def get_summary(self):
+        """
+        Item count, subtotal and change markers (line_count, last_modified)
+        from one aggregate query, memoized on this instance until
+        invalidate_summary() is called.
+        """
+        summary = self.__dict__.get('_summary')
+        if summary is None:
+            summary = self._remember_summary(self.items.aggregate(**self._summary_aggregates()))
+        return summary
+
+    async def aget_summary(self):
+        """get_summary() for async views"""
+        summary = self.__dict__.get('_summary')
+        if summary is None:
+            summary = self._remember_summary(await self.items.aaggregate(**self._summary_aggregates()))
+        return summary
+
+    def invalidate_summary(self):
+        self.__dict__.pop('_summary', None)
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.get_summary()['total_items']
 
     @property
     def subtotal(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.get_summary()['subtotal']
 
     @property
     def is_empty(self):
-        return not self.items.exists()
+        return self.total_items == 0
 
 
 class CartItem(models.Model):
@@ -402,16 +533,18 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.order_number}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            # Generate order number (you can customize this format)
-            import random
-            import string
-            self.order_number = f"BX{''.join(random.choices(string.digits, k=8))}"
+            from .order_numbers import next_order_number
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
     @property
@@ -429,7 +562,7 @@ class Order(models.Model):
         """Generate WhatsApp message with order details"""
         items_text = "\n".join([
             f"• {item.book.title} x {item.quantity} - KSh {item.total}"
-            for item in self.items.all()
+            for item in self.items.select_related('book')
         ])
         
         message = f"""📚 *BOOKSTORE ORDER REQUEST*
@@ -458,6 +591,7 @@ Phone: {self.shipping_phone}
 {self.billing_postal_code}, {self.billing_country}
 
 Please process this order and contact customer for payment details."""
+        return message
 
 
 class OrderItem(models.Model):
@@ -492,6 +626,41 @@ class OrderStatusHistory(models.Model):
         return f"Order #{self.order.order_number} - {self.get_status_display()}"
 
 
+class NumberSequence(models.Model):
+    """
+    A named counter handed out in blocks by home/order_numbers.py.
+
+    next_value is the first number no process has reserved yet.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} (next {self.next_value})"
+
+
+class DailySalesRollup(models.Model):
+    """
+    One day of sales, maintained from Order/OrderItem changes (home/analytics.py).
+
+    Revenue, order and unit figures only count confirmed-and-later orders;
+    status_counts covers every order placed that day.
+    """
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    order_count = models.PositiveIntegerField(default=0)
+    units_sold = models.PositiveIntegerField(default=0)
+    status_counts = models.JSONField(default=dict, help_text="Orders per status, e.g. {\"pending\": 3}")
+    category_revenue = models.JSONField(default=dict, help_text="Item revenue per category ID")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"Sales for {self.date}"
+
+
 # =============================================================================
 # COUPON/DISCOUNT MODELS
 # =============================================================================
@@ -542,4 +711,76 @@ class CouponUsage(models.Model):
         unique_together = ['coupon', 'order']
 
     def __str__(self):
-        return f"{self.coupon.code} used by {self.customer.full_name}"
\ No newline at end of file
+        return f"{self.coupon.code} used by {self.customer.full_name}"
+
+
+# =============================================================================
+# SEARCH MODELS
+# =============================================================================
+
+class SearchDocument(models.Model):
+    """
+    Flattened, weighted text for one searchable object (see home/search.py).
+
+    On SQLite an FTS5 table mirrors these rows through triggers; other
+    backends build their index from this table.
+    """
+    doc_type = models.CharField(max_length=20)
+    doc_id = models.CharField(max_length=64)
+    title = models.TextField(blank=True, help_text="Highest-weight text: titles, names, ISBNs, order numbers")
+    keywords = models.TextField(blank=True, help_text="Medium-weight text: subtitles, authors, categories")
+    body = models.TextField(blank=True, help_text="Low-weight text: descriptions, bios, review content")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['doc_type', 'doc_id']
+
+    def __str__(self):
+        return f"{self.doc_type}:{self.doc_id}"
+
+
+# =============================================================================
+# BACKGROUND JOBS
+# =============================================================================
+
+class Job(models.Model):
+    """
+    A queued unit of background work (see home/jobs.py). Finished jobs are
+    deleted; failed ones stay for inspection.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class MediaTombstone(models.Model):
+    """An uploaded file whose row is gone, waiting to be removed from storage (see home/media.py)"""
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,117 @@
+# home/order_numbers.py
+"""
+Order number allocation.
+
+Numbers come from the NumberSequence table rather than random digits, so
+they can't collide. To keep checkout off the sequence row, each process
+reserves a block of ORDER_NUMBER_BLOCK_SIZE numbers at a time and hands
+them out from memory. Numbers are increasing within a process; across
+processes they interleave by block, and numbers from a block a process
+didn't use before exiting are skipped.
+
+The allocator class is set by ORDER_NUMBER_ALLOCATOR; anything with a
+next_number() method returning a unique string will do.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .models import NumberSequence
+
+# Six-digit numbers on a fresh database. Where orders with the legacy
+# random BX + 8 digit numbers exist, migration 0014 starts the sequence
+# above the highest of them instead, so the two can never collide.
+FIRST_ORDER_NUMBER = 100000
+
+
+def reserve(name, count, start=1):
+    """
+    Reserve ``count`` numbers from sequence ``name``; returns the first.
+
+    The UPDATE comes first so the row is locked before it's read.
+    """
+    with transaction.atomic():
+        updated = NumberSequence.objects.filter(name=name).update(next_value=F('next_value') + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    NumberSequence.objects.create(name=name, next_value=start + count)
+                return start
+            except IntegrityError:
+                # Another process created it first
+                NumberSequence.objects.filter(name=name).update(next_value=F('next_value') + count)
+        return NumberSequence.objects.values_list('next_value', flat=True).get(name=name) - count
+
+
+class SequenceAllocator:
+    """Hands out ``prefix`` + number from per-process blocks of a sequence"""
+
+    def __init__(self, name='order', prefix=None, block_size=None, start=FIRST_ORDER_NUMBER):
+        self.name = name
+        self.prefix = settings.ORDER_NUMBER_PREFIX if prefix is None else prefix
+        self.block_size = block_size or settings.ORDER_NUMBER_BLOCK_SIZE
+        self.start = start
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = os.getpid()
+
+    def _has_block(self):
+        if self._pid != os.getpid():
+            # A forked worker must not reuse its parent's block
+            self._next = self._end = 0
+            self._pid = os.getpid()
+        return self._next < self._end
+
+    def _refill(self):
+        self._next = reserve(self.name, self.block_size, self.start)
+        self._end = self._next + self.block_size
+
+    def prefetch(self):
+        """Reserve a block now if needed; a no-op inside a transaction"""
+        with self._lock:
+            if not self._has_block() and not connection.in_atomic_block:
+                self._refill()
+
+    def next_number(self):
+        with self._lock:
+            if not self._has_block():
+                if connection.in_atomic_block:
+                    # A block reserved inside the caller's transaction would
+                    # be released again if it rolled back, while this process
+                    # went on handing it out. Take a single number instead:
+                    # it is released together with the order that used it.
+                    return f"{self.prefix}{reserve(self.name, 1, self.start)}"
+                self._refill()
+            number = self._next
+            self._next += 1
+        return f"{self.prefix}{number}"
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = import_string(settings.ORDER_NUMBER_ALLOCATOR)()
+        return _allocator
+
+
+def next_order_number():
+    return get_allocator().next_number()
+
+
+def prefetch():
+    """
+    Make sure the next order number can be handed out from memory. Call it
+    before opening a transaction that will create an order.
+    """
+    allocator = get_allocator()
+    if hasattr(allocator, 'prefetch'):
+        allocator.prefetch()
@@ -0,0 +1,102 @@
+# home/orders.py
+"""
+Order placement.
+
+place_order() turns a cart into an order inside one transaction with a
+fixed number of queries however many items the cart holds: the cart's
+books are locked, stock is checked and decremented in a single guarded
+UPDATE, and the order items are bulk-inserted.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from . import order_numbers, stats
+from .models import Book, Order, OrderItem
+
+
+class OrderError(Exception):
+    """An order that can't be placed, with a message for the shopper"""
+
+
+def _out_of_stock(book):
+    return OrderError(f"Sorry, only {book.stock_quantity} copies of '{book.title}' are available")
+
+
+def _decrement_stock(quantities):
+    """
+    Take ``{book_id: quantity}`` out of stock in one UPDATE.
+
+    Each row only matches while it still has enough stock, so a short
+    row count means another order got there first.
+    """
+    enough = Q()
+    for book_id, quantity in quantities.items():
+        enough |= Q(pk=book_id, stock_quantity__gte=quantity)
+    return Book.objects.filter(enough).update(
+        stock_quantity=F('stock_quantity') - Case(
+            *[When(pk=book_id, then=Value(quantity)) for book_id, quantity in quantities.items()],
+            default=Value(0),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def place_order(cart, customer, **addresses):
+    """
+    Create a pending order from ``cart`` and empty it.
+
+    ``addresses`` are the Order billing_*/shipping_* fields. Raises
+    OrderError if the cart is empty or a book no longer has the stock.
+    """
+    # Take the order number from a block reserved outside the transaction
+    order_numbers.prefetch()
+    with transaction.atomic():
+        items = list(cart.items.all())
+        if not items:
+            raise OrderError("Your cart is empty")
+
+        quantities = {}
+        for item in items:
+            quantities[item.book_id] = quantities.get(item.book_id, 0) + item.quantity
+
+        # Lock the rows so concurrent checkouts of the same books queue up
+        books = Book.objects.select_for_update().in_bulk(list(quantities))
+        for item in items:
+            item.book = books[item.book_id]
+            if quantities[item.book_id] > item.book.stock_quantity:
+                raise _out_of_stock(item.book)
+
+        if _decrement_stock(quantities) != len(quantities):
+            # Only reachable where select_for_update is a no-op (SQLite)
+            raise OrderError("Some of the books in your cart just sold out, please review your cart")
+
+        subtotal = sum((item.price * item.quantity for item in items), Decimal('0.00'))
+        order = Order.objects.create(
+            customer=customer,
+            subtotal=subtotal,
+            shipping_cost=Decimal('0.00'),  # Free shipping for now
+            tax_amount=Decimal('0.00'),     # No tax for now
+            total_amount=subtotal,
+            status='pending',
+            **addresses,
+        )
+        # bulk_create skips OrderItem.save(), so total is computed here
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                book=item.book,
+                quantity=item.quantity,
+                price=item.price,
+                total=item.price * item.quantity,
+            ) for item in items
+        ])
+
+        cart.items.all().delete()
+        cart.invalidate_summary()
+        # The stock UPDATE bypasses the signals that refresh stock counters
+        stats.invalidate(Book)
+
+    return order
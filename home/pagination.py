@@ -0,0 +1,145 @@
+# home/pagination.py
+import base64
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Largest BigAutoField value
+MAX_ID = 2 ** 63 - 1
+
+
+class InvalidCursor(Exception):
+    """Raised when a cursor string can't be decoded"""
+
+
+def encode_cursor(created_at, pk):
+    """Encode a (created_at, id) position as an opaque URL-safe token"""
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into a (created_at, id) tuple"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+        # An id out of the database's range would fail in the query instead
+        if created_at is None or not 0 < pk <= MAX_ID:
+            raise ValueError(cursor)
+        return created_at, pk
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset"""
+
+    def __init__(self, object_list, next_cursor, cursor=None, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+        # Only known up front when paginating a precomputed list
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+
+class KeysetPaginator:
+    """
+    Paginate newest-first on (created_at, id).
+
+    Each page is a single indexed range scan: instead of OFFSET, the query
+    resumes strictly after the last row of the previous page, so page 1000
+    costs the same as page 1.
+    """
+
+    def __init__(self, queryset, per_page=None):
+        self.queryset = queryset.order_by('-created_at', '-id')
+        self.per_page = per_page or getattr(settings, 'SHOP_PAGE_SIZE', 24)
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=pk)
+            )
+
+        # Fetch one extra row to learn whether another page exists
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.created_at, last.id)
+
+        return KeysetPage(rows, next_cursor, cursor)
+
+
+class RankedPaginator:
+    """
+    Paginate an already-ranked list of primary keys, e.g. search results.
+
+    Ranked lists are capped (SEARCH_MAX_RESULTS), so the cursor is simply an
+    offset into the list; only the page's rows are fetched from the database.
+    """
+
+    def __init__(self, queryset, ids, per_page=None):
+        self.queryset = queryset
+        self.ids = ids
+        self.per_page = per_page or getattr(settings, 'SHOP_PAGE_SIZE', 24)
+
+    def get_page(self, cursor=None):
+        offset = 0
+        if cursor:
+            try:
+                offset = int(cursor)
+            except ValueError:
+                raise InvalidCursor(cursor)
+            if offset < 0:
+                raise InvalidCursor(cursor)
+
+        page_ids = self.ids[offset:offset + self.per_page]
+        objects = self.queryset.in_bulk(page_ids)
+        rows = [objects[pk] for pk in page_ids if pk in objects]
+
+        next_offset = offset + self.per_page
+        next_cursor = str(next_offset) if next_offset < len(self.ids) else None
+        return KeysetPage(rows, next_cursor, cursor, total=len(self.ids))
+
+
+def estimated_count(queryset, key_parts, timeout=None):
+    """
+    Cached row count for a filtered queryset.
+
+    Totals are only shown as a hint, so a value up to
+    SHOP_COUNT_CACHE_TIMEOUT seconds old is acceptable and saves a full
+    COUNT(*) on every request.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'SHOP_COUNT_CACHE_TIMEOUT', 300)
+    digest = hashlib.md5(repr(key_parts).encode()).hexdigest()
+    cache_key = f'shop:count:{digest}'
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
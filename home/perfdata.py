@@ -0,0 +1,256 @@
+# home/perfdata.py
+"""
+Deterministic synthetic catalog, customer and order data for benchmarks.
+
+generate() writes everything with bulk_create, so model signals don't
+fire; the denormalized data they would maintain (covers, ratings, search
+index, sales rollup, related books) is rebuilt at the end instead.
+
+Rows are recognisable by a "perf-" prefix (book and category slugs,
+usernames), publisher names starting "Perf " and PERF_AUTHOR_WEBSITE on
+authors, which is how clear() finds them again.
+"""
+import math
+import random
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from PIL import Image
+
+from . import analytics, images, order_numbers, ratings, recommendations, search, stats
+from .models import (
+    Author, Book, BookImage, Cart, CartItem, Category, Customer, Order, OrderItem,
+    Publisher, Review,
+)
+from .storage import book_image_storage
+
+# Row counts at scale 1.0
+BASE_COUNTS = {
+    'categories': 30,
+    'publishers': 25,
+    'authors': 250,
+    'books': 1000,
+    'customers': 500,
+    'orders': 2000,
+    'reviews': 3000,
+    'carts': 100,
+}
+
+PERF_AUTHOR_WEBSITE = 'https://example.com/perf-author'
+
+FIRST_NAMES = ['Amina', 'Brian', 'Chloe', 'David', 'Esther', 'Felix', 'Grace', 'Hassan', 'Ivy',
+               'James', 'Kamau', 'Lena', 'Moses', 'Njeri', 'Omar', 'Priya', 'Quinn', 'Rose',
+               'Samuel', 'Tariq', 'Uma', 'Victor', 'Wanjiru', 'Xavier', 'Yusuf', 'Zawadi']
+LAST_NAMES = ['Achieng', 'Baker', 'Chege', 'Dube', 'Evans', 'Fischer', 'Gitau', 'Hughes',
+              'Irungu', 'Jensen', 'Kariuki', 'Lopez', 'Mwangi', 'Nakamura', 'Otieno', 'Patel',
+              'Quist', 'Rossi', 'Silva', 'Tanaka', 'Usman', 'Varga', 'Wekesa', 'Yilmaz']
+WORDS = ['river', 'shadow', 'garden', 'empire', 'silent', 'golden', 'winter', 'stone', 'city',
+         'secret', 'ocean', 'fire', 'glass', 'hidden', 'journey', 'lantern', 'memory', 'north',
+         'orchard', 'promise', 'quiet', 'savanna', 'thunder', 'valley', 'wild', 'harbor',
+         'crown', 'echo', 'forest', 'horizon', 'island', 'kingdom', 'light', 'moon', 'night']
+GENRES = ['Fiction', 'Mystery', 'Romance', 'Fantasy', 'Science Fiction', 'History', 'Biography',
+          'Business', 'Self Help', 'Poetry', 'Children', 'Travel', 'Cooking', 'Science', 'Art']
+
+ORDER_STATUSES = ['pending', 'confirmed', 'processing', 'shipped', 'delivered', 'delivered',
+                  'delivered', 'cancelled']
+
+
+def scaled_counts(scale):
+    return {name: max(1, math.ceil(count * scale)) for name, count in BASE_COUNTS.items()}
+
+
+def clear():
+    """Delete previously generated rows; returns the number deleted"""
+    deleted = 0
+    perf_users = User.objects.filter(username__startswith='perf-')
+    with transaction.atomic():
+        for queryset in (
+            Order.objects.filter(customer__user__in=perf_users),
+            Book.objects.filter(slug__startswith='perf-'),
+            perf_users,
+            Author.objects.filter(website=PERF_AUTHOR_WEBSITE),
+            Publisher.objects.filter(name__startswith='Perf '),
+            Category.objects.filter(slug__startswith='perf-'),
+        ):
+            deleted += queryset.delete()[0]
+    return deleted
+
+
+def _placeholder_image():
+    """Store one cover image and its renditions for every generated book to share"""
+    storage = book_image_storage()
+    buffer = BytesIO()
+    Image.new('RGB', (600, 900), (96, 125, 139)).save(buffer, 'JPEG', quality=80)
+    # Content-addressed, so after the first run these find the stored files
+    names = {'image': storage.save('books/placeholder.jpg', ContentFile(buffer.getvalue()))}
+
+    source = Image.new('RGB', (600, 900), (96, 125, 139))
+    for name, (field, width, height) in images.RENDITIONS.items():
+        names[field] = storage.save(f'books/renditions/placeholder{images.RENDITION_EXTENSION}',
+                                    images.render(source, width, height))
+    return names
+
+
+def _spread(rng, now, days):
+    """A random moment within the last ``days`` days"""
+    return now - timedelta(seconds=rng.randrange(days * 86400))
+
+
+def generate(scale=1.0, seed=42, batch_size=1000, log=lambda message: None):
+    """
+    Create a dataset of scaled_counts(scale) rows; the same seed and scale
+    always produce the same data. Returns the counts.
+    """
+    rng = random.Random(seed)
+    counts = scaled_counts(scale)
+    now = timezone.now()
+
+    def bulk(model, objs):
+        created = model.objects.bulk_create(objs, batch_size=batch_size)
+        log(f"  {model.__name__}: {len(created)}")
+        return created
+
+    def backdate(model, objs, days):
+        # auto_now_add overrides created_at on insert, so spread it afterwards
+        for obj in objs:
+            obj.created_at = _spread(rng, now, days)
+        model.objects.bulk_update(objs, ['created_at'], batch_size=batch_size)
+
+    with transaction.atomic():
+        categories = bulk(Category, [
+            Category(name=f"{GENRES[i % len(GENRES)]} {i // len(GENRES) + 1} (perf)", slug=f'perf-category-{i}')
+            for i in range(counts['categories'])
+        ])
+        publishers = bulk(Publisher, [
+            Publisher(name=f"Perf {rng.choice(WORDS).title()} Press {i}", founded_year=rng.randint(1900, 2020))
+            for i in range(counts['publishers'])
+        ])
+        authors = bulk(Author, [
+            Author(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                   bio=' '.join(rng.choices(WORDS, k=30)), website=PERF_AUTHOR_WEBSITE)
+            for _ in range(counts['authors'])
+        ])
+
+        books = []
+        for i in range(counts['books']):
+            title = ' '.join(rng.choices(WORDS, k=rng.randint(2, 4))).title()
+            price = Decimal(rng.randint(300, 4000))
+            books.append(Book(
+                title=title,
+                slug=f'perf-{i}',
+                isbn_13=f'{9790000000000 + seed * 1000000 + i}'[:13],
+                description=' '.join(rng.choices(WORDS, k=80)),
+                publisher=rng.choice(publishers),
+                pages=rng.randint(80, 900),
+                publication_date=(now - timedelta(days=rng.randrange(20 * 365))).date(),
+                price=price,
+                compare_at_price=price + 500 if rng.random() < 0.2 else None,
+                stock_quantity=0 if rng.random() < 0.05 else rng.randint(1, 200),
+                is_featured=rng.random() < 0.05,
+                is_bestseller=rng.random() < 0.05,
+                is_active=rng.random() < 0.97,
+            ))
+        books = bulk(Book, books)
+        backdate(Book, books, 3 * 365)
+
+        bulk(Book.authors.through, [
+            Book.authors.through(book_id=book.id, author_id=author.id)
+            for book in books
+            for author in rng.sample(authors, k=min(len(authors), rng.choice([1, 1, 1, 2])))
+        ])
+        bulk(Book.categories.through, [
+            Book.categories.through(book_id=book.id, category_id=category.id)
+            for book in books
+            for category in rng.sample(categories, k=min(len(categories), rng.randint(1, 3)))
+        ])
+
+        files = _placeholder_image()
+        bulk(BookImage, [
+            BookImage(book=book, is_primary=True, status=BookImage.READY,
+                      alt_text=f"Cover for {book.title}", **files)
+            for book in books
+        ])
+        Book.objects.filter(slug__startswith='perf-').update(cover=Subquery(
+            BookImage.objects.filter(book=OuterRef('pk'), is_primary=True).values('id')[:1]
+        ))
+
+        password = make_password(None)
+        users = bulk(User, [
+            User(username=f'perf-{seed}-{i}', email=f'perf-{seed}-{i}@example.com', password=password,
+                 first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES))
+            for i in range(counts['customers'])
+        ])
+        customers = bulk(Customer, [Customer(user=user, phone=f'07{rng.randrange(10 ** 8):08d}') for user in users])
+
+        # Skewed popularity so best sellers, co-purchases and reviews cluster
+        weights = [1 / (rank + 1) for rank in range(len(books))]
+        first_number = order_numbers.reserve('order', counts['orders'], order_numbers.FIRST_ORDER_NUMBER)
+        orders, items = [], []
+        for i in range(counts['orders']):
+            customer = rng.choice(customers)
+            user = customer.user
+            chosen = {book.id: book for book in rng.choices(books, weights=weights, k=rng.randint(1, 4))}
+            lines = [(book, rng.randint(1, 3)) for book in chosen.values()]
+            subtotal = sum(book.price * quantity for book, quantity in lines)
+            address = {
+                'first_name': user.first_name, 'last_name': user.last_name,
+                'address_line_1': f"{rng.randint(1, 999)} {rng.choice(WORDS).title()} Road",
+                'city': 'Nairobi', 'state': 'Nairobi', 'postal_code': f'{rng.randint(100, 999)}00',
+                'country': 'Kenya', 'phone': customer.phone,
+            }
+            order = Order(
+                order_number=f"{settings.ORDER_NUMBER_PREFIX}{first_number + i}",
+                customer=customer,
+                status=rng.choice(ORDER_STATUSES),
+                subtotal=subtotal,
+                total_amount=subtotal,
+                **{f'billing_{key}': value for key, value in address.items()},
+                **{f'shipping_{key}': value for key, value in address.items()},
+            )
+            orders.append(order)
+            items.extend(
+                OrderItem(order=order, book=book, quantity=quantity, price=book.price, total=book.price * quantity)
+                for book, quantity in lines
+            )
+        orders = bulk(Order, orders)
+        backdate(Order, orders, 365)
+        bulk(OrderItem, items)
+
+        reviews = {}
+        for _ in range(counts['reviews']):
+            book = rng.choices(books, weights=weights)[0]
+            customer = rng.choice(customers)
+            reviews[book.id, customer.id] = Review(
+                book=book, customer=customer,
+                rating=rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 6, 8])[0],
+                title=' '.join(rng.choices(WORDS, k=3)).capitalize(),
+                content=' '.join(rng.choices(WORDS, k=40)),
+                is_approved=rng.random() < 0.85,
+                is_verified_purchase=rng.random() < 0.5,
+            )
+        reviews = bulk(Review, list(reviews.values()))
+        backdate(Review, reviews, 365)
+
+        carts = bulk(Cart, [Cart(customer=customer) for customer in rng.sample(customers, k=min(len(customers), counts['carts']))])
+        bulk(CartItem, [
+            CartItem(cart=cart, book=book, quantity=rng.randint(1, 2), price=book.price)
+            for cart in carts
+            for book in {b.id: b for b in rng.choices(books, weights=weights, k=rng.randint(1, 4))}.values()
+        ])
+
+    log("Rebuilding denormalized data...")
+    for _ in ratings.rebuild(Book.objects.filter(slug__startswith='perf-')):
+        pass
+    search.rebuild()
+    analytics.rebuild_rollups()
+    recommendations.build()
+    stats.invalidate(*{model for _, models in stats.PANELS.values() for model in models})
+    return counts
@@ -0,0 +1,164 @@
+# home/ratings.py
+"""
+Incremental maintenance of Book.rating_sum / rating_count / avg_rating.
+
+Only approved reviews count towards a book's rating. Every change is applied
+as a delta in a single UPDATE, so a review write never has to re-aggregate
+the book's whole review set.
+"""
+import threading
+from contextlib import contextmanager
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Book, Review
+
+_state = threading.local()
+
+
+@contextmanager
+def signals_suspended():
+    """
+    Silence the per-review signal handlers while a bulk helper below applies
+    its own grouped deltas, so a change is never counted twice.
+    """
+    previous = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+def apply_delta(book_id, sum_delta, count_delta):
+    """Shift one book's stored aggregates by (sum_delta, count_delta)"""
+    if not book_id or (not sum_delta and not count_delta):
+        return
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    Book.objects.filter(id=book_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        # New cache version, so fragments show the new rating (see caching.py)
+        updated_at=timezone.now(),
+        # UPDATE expressions see the old row, so the average is computed from
+        # the same shifted values rather than from the columns being written
+        avg_rating=Case(
+            When(rating_count__lte=-count_delta, then=Value(Decimal('0.00'))),
+            default=Cast(new_sum, FloatField()) / new_count,
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        ),
+    )
+
+
+def apply_deltas(deltas):
+    """Apply a {book_id: (sum_delta, count_delta)} mapping"""
+    for book_id, (sum_delta, count_delta) in deltas.items():
+        apply_delta(book_id, sum_delta, count_delta)
+
+
+def review_saved(review):
+    """Apply the difference between a review's previous and current contribution"""
+    old_book_id, (old_sum, old_count) = getattr(review, '_rating_snapshot', (None, (0, 0)))
+    new_sum, new_count = review.rating_contribution
+
+    if old_book_id == review.book_id:
+        apply_delta(review.book_id, new_sum - old_sum, new_count - old_count)
+    else:
+        apply_delta(old_book_id, -old_sum, -old_count)
+        apply_delta(review.book_id, new_sum, new_count)
+    review.snapshot_rating()
+
+
+def review_deleted(review):
+    """Remove a deleted review's contribution"""
+    book_id, (old_sum, old_count) = getattr(
+        review, '_rating_snapshot', (review.book_id, review.rating_contribution)
+    )
+    apply_delta(book_id, -old_sum, -old_count)
+
+
+def _grouped(reviews):
+    """{book_id: (rating_sum, review_count)} for a review queryset, in one query"""
+    rows = reviews.order_by().values('book_id').annotate(
+        total=Sum('rating'), n=Count('id')
+    )
+    return {row['book_id']: (row['total'] or 0, row['n']) for row in rows}
+
+
+def set_approval(reviews, approved):
+    """
+    Bulk approve/reject a review queryset, keeping book ratings in step.
+
+    Returns the number of reviews whose status actually changed.
+    """
+    changing = reviews.exclude(is_approved=approved)
+    with transaction.atomic():
+        deltas = _grouped(changing)
+        if not approved:
+            deltas = {book_id: (-s, -n) for book_id, (s, n) in deltas.items()}
+        updated = changing.update(is_approved=approved)
+        apply_deltas(deltas)
+    return updated
+
+
+def delete_reviews(reviews):
+    """Bulk delete a review queryset, keeping book ratings in step"""
+    with transaction.atomic():
+        deltas = _grouped(reviews.filter(is_approved=True))
+        with signals_suspended():
+            deleted, _ = reviews.delete()
+        apply_deltas({book_id: (-s, -n) for book_id, (s, n) in deltas.items()})
+    return deleted
+
+
+def rebuild(books=None, fix=True, chunk_size=2000):
+    """
+    Recompute aggregates from the review table and report drift.
+
+    Yields (book, expected_sum, expected_count) for every book whose stored
+    values disagree; when ``fix`` is true those books are rewritten.
+    """
+    books = (books if books is not None else Book.objects.all()).order_by('id')
+    books = books.only('id', 'title', 'rating_sum', 'rating_count', 'avg_rating')
+
+    last_id = 0
+    while True:
+        chunk = list(books.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        actual = _grouped(Review.objects.filter(
+            is_approved=True, book_id__in=[book.id for book in chunk]
+        ))
+        drifted = []
+        for book in chunk:
+            expected_sum, expected_count = actual.get(book.id, (0, 0))
+            expected_avg = average(expected_sum, expected_count)
+            # The database rounds the average itself, so allow a last-digit difference
+            if (book.rating_sum != expected_sum or book.rating_count != expected_count
+                    or abs(book.avg_rating - expected_avg) > Decimal('0.01')):
+                yield book, expected_sum, expected_count
+                book.rating_sum = expected_sum
+                book.rating_count = expected_count
+                book.avg_rating = expected_avg
+                drifted.append(book)
+
+        if fix and drifted:
+            Book.objects.bulk_update(drifted, ['rating_sum', 'rating_count', 'avg_rating'])
+
+
+def average(rating_sum, rating_count):
+    """The avg_rating value stored for a given sum and count"""
+    if not rating_count:
+        return Decimal('0.00')
+    return (Decimal(rating_sum) / rating_count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
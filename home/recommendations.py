@@ -0,0 +1,148 @@
+# home/recommendations.py
+"""
+Offline "related books" engine.
+
+A batch job scores every active book against its candidate neighbours and
+stores the top N in RelatedBook, so book_detail serves recommendations with
+one indexed lookup. Scores combine:
+
+- shared authors (strongest signal)
+- co-purchases: books bought together in the same order
+- shared categories, damped for large categories so a broad category
+  like "Fiction" counts for less than a narrow one
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .models import Book, OrderItem, RelatedBook
+
+AUTHOR_WEIGHT = 3.0
+CO_PURCHASE_WEIGHT = 2.0
+CATEGORY_WEIGHT = 1.0
+
+# Only the most popular books of a category are considered as category
+# neighbours, which keeps the job linear in catalog size
+CATEGORY_CANDIDATES = 200
+
+# Orders with more distinct books than this say little about any one pair
+MAX_ORDER_BOOKS = 50
+
+EXCLUDED_ORDER_STATUSES = ['cancelled', 'refunded']
+
+
+def _group(pairs):
+    """{key: [values]} from (key, value) pairs"""
+    groups = defaultdict(list)
+    for key, value in pairs:
+        groups[key].append(value)
+    return groups
+
+
+def load_graph(active_ids):
+    """Read the book/author/category/order relations the scorer needs"""
+    book_authors = _group(
+        Book.authors.through.objects.filter(book_id__in=active_ids)
+        .values_list('book_id', 'author_id').iterator(chunk_size=5000)
+    )
+    book_categories = _group(
+        Book.categories.through.objects.filter(book_id__in=active_ids)
+        .values_list('book_id', 'category_id').iterator(chunk_size=5000)
+    )
+
+    co_purchases = defaultdict(Counter)
+    popularity = Counter()
+    order_books = _group(
+        OrderItem.objects.exclude(order__status__in=EXCLUDED_ORDER_STATUSES)
+        .values_list('order_id', 'book_id').iterator(chunk_size=5000)
+    )
+    for books in order_books.values():
+        books = [book_id for book_id in set(books) if book_id in active_ids]
+        popularity.update(books)
+        if len(books) > MAX_ORDER_BOOKS:
+            continue
+        for book_id in books:
+            for other_id in books:
+                if other_id != book_id:
+                    co_purchases[book_id][other_id] += 1
+
+    return book_authors, book_categories, co_purchases, popularity
+
+
+def score_all(active_ids, top_n):
+    """Yield (book_id, [(related_id, score), ...]) best first, for every active book"""
+    book_authors, book_categories, co_purchases, popularity = load_graph(active_ids)
+
+    author_books = defaultdict(list)
+    for book_id, author_ids in book_authors.items():
+        for author_id in author_ids:
+            author_books[author_id].append(book_id)
+
+    category_books = defaultdict(list)
+    for book_id, category_ids in book_categories.items():
+        for category_id in category_ids:
+            category_books[category_id].append(book_id)
+    category_sizes = {category_id: len(books) for category_id, books in category_books.items()}
+    # Newest-first ids as the popularity tie-breaker
+    category_candidates = {
+        category_id: sorted(books, key=lambda b: (-popularity[b], -b))[:CATEGORY_CANDIDATES]
+        for category_id, books in category_books.items()
+    }
+
+    for book_id in active_ids:
+        scores = Counter()
+
+        for author_id in book_authors.get(book_id, ()):
+            for other_id in author_books[author_id]:
+                scores[other_id] += AUTHOR_WEIGHT
+
+        for other_id, count in co_purchases.get(book_id, {}).items():
+            scores[other_id] += CO_PURCHASE_WEIGHT * math.log1p(count)
+
+        for category_id in book_categories.get(book_id, ()):
+            weight = CATEGORY_WEIGHT / math.log2(1 + category_sizes[category_id])
+            for other_id in category_candidates[category_id]:
+                scores[other_id] += weight
+
+        scores.pop(book_id, None)
+        # Break score ties towards best sellers, then newer books
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -popularity[item[0]], -item[0]))
+        yield book_id, ranked[:top_n]
+
+
+def build(top_n=12, chunk_size=1000):
+    """Recompute and store neighbours for every active book; returns rows written"""
+    active_ids = set(Book.objects.filter(is_active=True).values_list('id', flat=True))
+    RelatedBook.objects.exclude(book_id__in=active_ids).delete()
+
+    written = 0
+    batch = {}
+
+    def flush():
+        nonlocal written
+        with transaction.atomic():
+            RelatedBook.objects.filter(book_id__in=list(batch)).delete()
+            rows = RelatedBook.objects.bulk_create([
+                RelatedBook(book_id=book_id, related_id=related_id, rank=rank, score=score)
+                for book_id, neighbours in batch.items()
+                for rank, (related_id, score) in enumerate(neighbours)
+            ], batch_size=chunk_size)
+        written += len(rows)
+        batch.clear()
+
+    for book_id, neighbours in score_all(active_ids, top_n):
+        batch[book_id] = neighbours
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+    return written
+
+
+def related_books(book, limit=4):
+    """Precomputed neighbours of ``book`` that are still active, best first"""
+    neighbours = RelatedBook.objects.filter(
+        book=book, related__is_active=True
+    ).select_related('related__cover').order_by('rank')[:limit]
+    return [neighbour.related for neighbour in neighbours]
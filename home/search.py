@@ -0,0 +1,551 @@
+# home/search.py
+"""
+Ranked full-text search for the storefront and the dashboard.
+
+Every searchable object is flattened into a SearchDocument row with three
+weighted text columns (title > keywords > body). Rows are kept current by
+the signal handlers in home/signals.py and can be rebuilt with
+``manage.py rebuild_search_index``.
+
+Queries go through a pluggable backend chosen by settings.SEARCH_BACKEND:
+
+- ``'fts5'``   SQLite FTS5 table mirroring SearchDocument, ranked with bm25
+- ``'memory'`` in-process inverted index loaded from SearchDocument
+- ``'auto'``   FTS5 when the table exists, otherwise the in-process index
+- or a dotted path to a class implementing the same interface
+
+A backend's search() returns ranked ids, capped by the caller (the
+storefront asks for SEARCH_MAX_RESULTS); its matches() returns every
+match as a subquery, for the dashboard filters.
+
+Until a type has any documents (a database that predates the index and
+hasn't run ``rebuild_search_index`` yet) queries fall back to icontains
+lookups on the model itself.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BigIntegerField, Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+
+from .models import (
+    Author, Book, Customer, Order, Publisher, Review, SearchDocument,
+)
+
+FTS_TABLE = 'home_searchdocument_fts'
+
+# Relative weight of the title / keywords / body columns
+FIELD_WEIGHTS = (10.0, 4.0, 1.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lowercase, accent-folded word tokens"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text.lower())
+
+
+# =============================================================================
+# DOCUMENT TYPES
+# =============================================================================
+
+def _join(*parts):
+    return ' '.join(part for part in parts if part)
+
+
+def _book_document(book):
+    return (
+        _join(book.title, book.isbn_10, book.isbn_13),
+        _join(
+            book.subtitle,
+            *(author.full_name for author in book.authors.all()),
+            *(category.name for category in book.categories.all()),
+        ),
+        book.description,
+    )
+
+
+def _author_document(author):
+    return (author.full_name, '', author.bio)
+
+
+def _publisher_document(publisher):
+    return (publisher.name, publisher.email, publisher.address)
+
+
+def _customer_document(customer):
+    user = customer.user
+    return (
+        _join(user.first_name, user.last_name, user.username),
+        _join(user.email, customer.phone),
+        '',
+    )
+
+
+def _order_document(order):
+    user = order.customer.user if order.customer_id else None
+    return (
+        # Index the bare digits too so "12345678" finds "BX12345678"
+        _join(order.order_number, order.order_number.removeprefix(settings.ORDER_NUMBER_PREFIX)),
+        _join(
+            user.first_name if user else '',
+            user.last_name if user else '',
+            user.email if user else '',
+            order.billing_first_name,
+            order.billing_last_name,
+            order.billing_phone,
+        ),
+        '',
+    )
+
+
+def _review_document(review):
+    user = review.customer.user
+    return (
+        review.title,
+        _join(review.book.title, user.first_name, user.last_name),
+        review.content,
+    )
+
+
+class DocumentType:
+    def __init__(self, name, model, build, fields, select_related=(), prefetch_related=()):
+        self.name = name
+        self.model = model
+        self.build = build
+        # Model fields searched with icontains while the index is empty
+        self.fields = fields
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+
+    def queryset(self):
+        queryset = self.model.objects.all()
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+
+DOCUMENT_TYPES = {
+    doc.name: doc for doc in [
+        DocumentType('book', Book, _book_document,
+                     ('title', 'subtitle', 'isbn_10', 'isbn_13'),
+                     prefetch_related=('authors', 'categories')),
+        DocumentType('author', Author, _author_document, ('first_name', 'last_name')),
+        DocumentType('publisher', Publisher, _publisher_document, ('name', 'email')),
+        DocumentType('customer', Customer, _customer_document,
+                     ('user__first_name', 'user__last_name', 'user__username', 'user__email', 'phone'),
+                     select_related=('user',)),
+        DocumentType('order', Order, _order_document,
+                     ('order_number', 'billing_first_name', 'billing_last_name', 'billing_phone',
+                      'customer__user__email'),
+                     select_related=('customer__user',)),
+        DocumentType('review', Review, _review_document, ('title', 'content', 'book__title'),
+                     select_related=('book', 'customer__user')),
+    ]
+}
+
+MODEL_DOC_TYPES = {doc.model: doc.name for doc in DOCUMENT_TYPES.values()}
+
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+class FTS5Backend:
+    """SQLite FTS5 over SearchDocument, ranked with bm25()"""
+
+    def __init__(self):
+        self._available = {}
+
+    def is_available(self):
+        if connection.vendor != 'sqlite':
+            return False
+        name = str(connection.settings_dict['NAME'])
+        if name not in self._available:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+                )
+                self._available[name] = cursor.fetchone() is not None
+        return self._available[name]
+
+    def search(self, doc_type, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Every term must match; the trailing * makes each term a prefix match
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT d.doc_id FROM {FTS_TABLE} f "
+                f"JOIN home_searchdocument d ON d.id = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND d.doc_type = %s "
+                f"ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s",
+                [match, doc_type, *FIELD_WEIGHTS, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def matches(self, doc_type, query, pk_field):
+        """
+        Every match as a subquery of primary keys, for ``pk__in``; the
+        database filters with it directly, so nothing is capped
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        doc_id = 'CAST(d.doc_id AS INTEGER)' if pk_field.get_internal_type().endswith('AutoField') else 'd.doc_id'
+        return RawSQL(
+            f"SELECT {doc_id} FROM {FTS_TABLE} f "
+            f"JOIN home_searchdocument d ON d.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND d.doc_type = %s",
+            [match, doc_type],
+        )
+
+    def documents_changed(self, doc_type, documents):
+        """Nothing to do: triggers keep the FTS table in step"""
+
+    def documents_removed(self, doc_type, doc_ids):
+        """Nothing to do: triggers keep the FTS table in step"""
+
+    def reset(self, doc_type=None):
+        """Nothing to do: triggers keep the FTS table in step"""
+
+
+class _MemoryIndex:
+    def __init__(self):
+        self.postings = defaultdict(dict)   # term -> {doc_id: weighted tf}
+        self.doc_terms = {}                 # doc_id -> set of terms
+        self.vocabulary = []
+        self.vocabulary_dirty = False
+        self.loaded_at = time.monotonic()
+
+    def add(self, doc_id, fields):
+        self.remove(doc_id)
+        scores = defaultdict(float)
+        for weight, text in zip(FIELD_WEIGHTS, fields):
+            for term in tokenize(text):
+                scores[term] += weight
+        for term, score in scores.items():
+            if term not in self.postings:
+                self.vocabulary_dirty = True
+            self.postings[term][doc_id] = score
+        self.doc_terms[doc_id] = set(scores)
+
+    def remove(self, doc_id):
+        for term in self.doc_terms.pop(doc_id, ()):
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                self.vocabulary_dirty = True
+
+    def expand(self, term):
+        """All indexed terms starting with ``term``"""
+        if self.vocabulary_dirty:
+            self.vocabulary = sorted(self.postings)
+            self.vocabulary_dirty = False
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + '\uffff')
+        return self.vocabulary[start:end]
+
+    def search(self, terms, limit):
+        total = len(self.doc_terms) or 1
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for candidate in self.expand(term):
+                postings = self.postings[candidate]
+                idf = math.log(1 + total / len(postings))
+                # Whole-word matches outrank prefix matches
+                boost = 1.0 if candidate == term else 0.5
+                for doc_id, tf in postings.items():
+                    term_scores[doc_id] += tf * idf * boost
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return []
+        if limit is None:
+            return list(scores)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [doc_id for doc_id, _ in ranked[:limit]]
+
+
+class InMemoryBackend:
+    """
+    Inverted index held in this process, loaded lazily from SearchDocument.
+
+    Writes made in this process are applied immediately; the index is
+    reloaded after settings.SEARCH_INDEX_MAX_AGE seconds to pick up writes
+    made by other worker processes.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.RLock()
+
+    def is_available(self):
+        return True
+
+    def _index(self, doc_type):
+        max_age = getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+        index = self._indexes.get(doc_type)
+        if index is None or time.monotonic() - index.loaded_at > max_age:
+            index = _MemoryIndex()
+            rows = SearchDocument.objects.filter(doc_type=doc_type).values_list(
+                'doc_id', 'title', 'keywords', 'body'
+            )
+            for doc_id, *fields in rows.iterator(chunk_size=2000):
+                index.add(doc_id, fields)
+            self._indexes[doc_type] = index
+        return index
+
+    def search(self, doc_type, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            return self._index(doc_type).search(terms, limit)
+
+    def matches(self, doc_type, query, pk_field):
+        """
+        Every match as a SearchDocument subquery, so the filter never
+        inlines one parameter per matching row. Each term must occur in
+        one of the columns; unlike search() this is a plain substring
+        match without accent folding.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        documents = SearchDocument.objects.filter(doc_type=doc_type)
+        for term in terms:
+            documents = documents.filter(
+                Q(title__icontains=term) | Q(keywords__icontains=term) | Q(body__icontains=term)
+            )
+        if pk_field.get_internal_type().endswith('AutoField'):
+            return documents.values_list(Cast('doc_id', BigIntegerField()))
+        return documents.values_list('doc_id')
+
+    def documents_changed(self, doc_type, documents):
+        with self._lock:
+            index = self._indexes.get(doc_type)
+            if index is not None:
+                for doc in documents:
+                    index.add(doc.doc_id, (doc.title, doc.keywords, doc.body))
+
+    def documents_removed(self, doc_type, doc_ids):
+        with self._lock:
+            index = self._indexes.get(doc_type)
+            if index is not None:
+                for doc_id in doc_ids:
+                    index.remove(doc_id)
+
+    def reset(self, doc_type=None):
+        with self._lock:
+            if doc_type is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(doc_type, None)
+
+
+class AutoBackend:
+    """FTS5 when its table exists in the current database, otherwise in-memory"""
+
+    def __init__(self):
+        self.fts5 = FTS5Backend()
+        self.memory = InMemoryBackend()
+
+    def _backend(self):
+        return self.fts5 if self.fts5.is_available() else self.memory
+
+    def is_available(self):
+        return True
+
+    def search(self, doc_type, query, limit):
+        return self._backend().search(doc_type, query, limit)
+
+    def matches(self, doc_type, query, pk_field):
+        return self._backend().matches(doc_type, query, pk_field)
+
+    def documents_changed(self, doc_type, documents):
+        self.memory.documents_changed(doc_type, documents)
+
+    def documents_removed(self, doc_type, doc_ids):
+        self.memory.documents_removed(doc_type, doc_ids)
+
+    def reset(self, doc_type=None):
+        self.memory.reset(doc_type)
+
+
+BACKENDS = {
+    'auto': AutoBackend,
+    'fts5': FTS5Backend,
+    'memory': InMemoryBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+                backend_class = BACKENDS.get(name) or import_string(name)
+                _backend = backend_class()
+    return _backend
+
+
+# =============================================================================
+# INDEXING
+# =============================================================================
+
+def index_objects(objects, doc_type=None):
+    """Upsert the search documents for a batch of model instances"""
+    objects = list(objects)
+    if not objects:
+        return
+    doc_type = doc_type or MODEL_DOC_TYPES[type(objects[0])]
+    build = DOCUMENT_TYPES[doc_type].build
+
+    documents = []
+    for obj in objects:
+        title, keywords, body = build(obj)
+        documents.append(SearchDocument(
+            doc_type=doc_type, doc_id=str(obj.pk),
+            title=title or '', keywords=keywords or '', body=body or '',
+        ))
+    SearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['doc_type', 'doc_id'],
+        update_fields=['title', 'keywords', 'body', 'updated_at'],
+    )
+    get_backend().documents_changed(doc_type, documents)
+
+
+def index_queryset(queryset, doc_type=None, chunk_size=500):
+    """Reindex every object in a queryset, in chunks"""
+    doc_type = doc_type or MODEL_DOC_TYPES[queryset.model]
+    document = DOCUMENT_TYPES[doc_type]
+    queryset = queryset.select_related(*document.select_related).order_by('pk')
+
+    batch = []
+    # prefetch_related is honoured per chunk by iterator(chunk_size=...)
+    for obj in queryset.prefetch_related(*document.prefetch_related).iterator(chunk_size=chunk_size):
+        batch.append(obj)
+        if len(batch) >= chunk_size:
+            index_objects(batch, doc_type)
+            batch = []
+    index_objects(batch, doc_type)
+
+
+def remove_objects(doc_type, pks):
+    doc_ids = [str(pk) for pk in pks]
+    SearchDocument.objects.filter(doc_type=doc_type, doc_id__in=doc_ids).delete()
+    get_backend().documents_removed(doc_type, doc_ids)
+
+
+def schedule_index(queryset, doc_type=None):
+    """Reindex a queryset once the current transaction commits"""
+    transaction.on_commit(lambda: index_queryset(queryset, doc_type))
+
+
+def schedule_remove(doc_type, pk):
+    transaction.on_commit(lambda: remove_objects(doc_type, [pk]))
+
+
+def rebuild(doc_types=None, chunk_size=500):
+    """Drop and rebuild the documents for the given types; returns counts"""
+    counts = {}
+    for name in doc_types or DOCUMENT_TYPES:
+        with transaction.atomic():
+            SearchDocument.objects.filter(doc_type=name).delete()
+            get_backend().reset(name)
+            index_queryset(DOCUMENT_TYPES[name].queryset(), name, chunk_size)
+        counts[name] = SearchDocument.objects.filter(doc_type=name).count()
+    return counts
+
+
+# =============================================================================
+# QUERYING
+# =============================================================================
+
+# Types seen with at least one document; an index never empties once built
+_indexed_types = set()
+
+
+def is_indexed(doc_type):
+    if doc_type not in _indexed_types:
+        if not SearchDocument.objects.filter(doc_type=doc_type).exists():
+            return False
+        _indexed_types.add(doc_type)
+    return True
+
+
+def _fallback_filter(queryset, query, doc_type):
+    """Every term in one of the type's fields, for an unbuilt index"""
+    for term in query.split():
+        condition = Q()
+        for field in DOCUMENT_TYPES[doc_type].fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def search_ids(doc_type, query, limit=None):
+    """Primary keys matching ``query``, best match first"""
+    limit = limit or getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+    document = DOCUMENT_TYPES[doc_type]
+    if not is_indexed(doc_type):
+        if not query.split():
+            return []
+        matched = _fallback_filter(document.model.objects.all(), query, doc_type)
+        return list(matched.order_by('pk').values_list('pk', flat=True)[:limit])
+    doc_ids = get_backend().search(doc_type, query, limit)
+    pk_field = document.model._meta.pk
+    return [pk_field.to_python(doc_id) for doc_id in doc_ids]
+
+
+def filter_queryset(queryset, query, doc_type=None, ranked=False):
+    """
+    Narrow ``queryset`` to objects matching ``query``.
+
+    By default every match is kept and the queryset keeps its own
+    ordering, so dashboard lists, their counts and their exports are
+    exhaustive. With ``ranked`` the result is ordered best match first and,
+    like the storefront search, capped at SEARCH_MAX_RESULTS.
+    """
+    doc_type = doc_type or MODEL_DOC_TYPES[queryset.model]
+    if not ranked:
+        if not is_indexed(doc_type):
+            return _fallback_filter(queryset, query, doc_type)
+        pk_field = DOCUMENT_TYPES[doc_type].model._meta.pk
+        return queryset.filter(pk__in=get_backend().matches(doc_type, query, pk_field))
+
+    ids = search_ids(doc_type, query)
+    queryset = queryset.filter(pk__in=ids)
+    if ids:
+        queryset = queryset.order_by(Case(
+            *(When(pk=pk, then=position) for position, pk in enumerate(ids)),
+            output_field=IntegerField(),
+        ))
+    return queryset
@@ -0,0 +1,229 @@
+# home/signals.py
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, caching, images, jobs, media, ratings, search, stats
+from .models import Author, Book, BookImage, Category, Customer, Order, OrderItem, Publisher, Review
+
+
+# =============================================================================
+# RATING AGGREGATES
+# =============================================================================
+
+@receiver(post_save, sender=Review)
+def update_book_rating_on_save(sender, instance, raw=False, **kwargs):
+    """Keep the book's denormalized rating in step with review edits"""
+    if raw or ratings.is_suspended():
+        return
+    ratings.review_saved(instance)
+
+
+@receiver(post_delete, sender=Review)
+def update_book_rating_on_delete(sender, instance, **kwargs):
+    """Remove a deleted review from its book's denormalized rating"""
+    if ratings.is_suspended():
+        return
+    ratings.review_deleted(instance)
+
+
+# =============================================================================
+# SEARCH INDEX
+# =============================================================================
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Review)
+def reindex_on_save(sender, instance, raw=False, **kwargs):
+    """Reindex a searchable object, plus documents that embed its text"""
+    if raw:
+        return
+    search.schedule_index(sender.objects.filter(pk=instance.pk))
+    if sender is Book:
+        search.schedule_index(instance.reviews.all())
+    elif sender is Author:
+        search.schedule_index(instance.books.all())
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_books(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        search.schedule_index(instance.books.all())
+
+
+@receiver(post_save, sender=User)
+def reindex_customer_user(sender, instance, raw=False, created=False, **kwargs):
+    """Customer, order and review documents carry the user's name and email"""
+    if raw or created:
+        return
+    search.schedule_index(Customer.objects.filter(user=instance))
+    search.schedule_index(Order.objects.filter(customer__user=instance))
+    search.schedule_index(Review.objects.filter(customer__user=instance))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.categories.through)
+def reindex_book_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.schedule_index(Book.objects.filter(pk=instance.pk))
+    elif pk_set:
+        search.schedule_index(Book.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Review)
+def remove_from_index(sender, instance, **kwargs):
+    search.schedule_remove(search.MODEL_DOC_TYPES[sender], instance.pk)
+
+
+# =============================================================================
+# SALES ROLLUP
+# =============================================================================
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def refresh_rollup_for_order(sender, instance, raw=False, **kwargs):
+    if not raw and instance.created_at:
+        analytics.schedule_refresh(timezone.localdate(instance.created_at))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_rollup_for_item(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        created_at = instance.order.created_at
+    except Order.DoesNotExist:
+        # Deleted along with its order, which schedules the refresh itself
+        return
+    analytics.schedule_refresh(timezone.localdate(created_at))
+
+
+# =============================================================================
+# BOOK IMAGES
+# =============================================================================
+
+@receiver(post_save, sender=BookImage)
+def queue_image_processing(sender, instance, created=False, raw=False, **kwargs):
+    """Hand new uploads to the job worker, whichever view they came from"""
+    if raw or not created or not instance.image or instance.status != BookImage.PENDING:
+        return
+    jobs.enqueue('process_image', image_id=instance.pk)
+
+
+@receiver(post_delete, sender=BookImage)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Category)
+def bury_deleted_files(sender, instance, **kwargs):
+    """Files are removed after commit by the job worker, however the row was deleted"""
+    media.bury(*media.file_names(instance))
+
+
+@receiver(post_save, sender=BookImage)
+@receiver(post_delete, sender=BookImage)
+def update_book_cover(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep Book.cover pointing at the primary image as images change"""
+    if raw or (update_fields and not {'is_primary', 'order', 'status'} & set(update_fields)):
+        return
+    images.sync_cover(instance.book_id)
+
+
+# =============================================================================
+# DASHBOARD STATISTICS
+# =============================================================================
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Publisher)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Review)
+def invalidate_stats(sender, raw=False, **kwargs):
+    if not raw:
+        stats.invalidate(sender)
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def invalidate_author_stats(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        stats.invalidate(Author)
+
+
+# =============================================================================
+# STOREFRONT CACHE
+# =============================================================================
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_trending_books(sender, raw=False, **kwargs):
+    if not raw:
+        caching.invalidate(caching.TRENDING_KEY)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories(sender, instance, raw=False, **kwargs):
+    """Category names show on book pages as well as in the shop sidebar"""
+    if raw:
+        return
+    caching.invalidate(caching.ROOT_CATEGORIES_KEY)
+    caching.touch_books(Book.objects.filter(categories=instance))
+
+
+@receiver(post_save, sender=BookImage)
+@receiver(post_delete, sender=BookImage)
+def refresh_book_for_image(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    caching.invalidate(caching.TRENDING_KEY)
+    caching.touch_books([instance.book_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_book_for_review(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.touch_books([instance.book_id])
+
+
+@receiver(post_save, sender=Author)
+def refresh_author_books(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        caching.touch_books(Book.objects.filter(authors=instance))
+
+
+@receiver(post_save, sender=Publisher)
+def refresh_publisher_books(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        caching.touch_books(Book.objects.filter(publisher=instance))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.categories.through)
+def refresh_books_for_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    """Adding an author or category to a book doesn't save the book itself"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            caching.touch_books([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        caching.touch_books(pk_set)
+    elif action == 'pre_clear':
+        # pk_set isn't given for a clear; the books are gone after it
+        caching.touch_books(instance.books.all())
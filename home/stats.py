@@ -0,0 +1,103 @@
+# home/stats.py
+"""
+Header statistics for the dashboard pages.
+
+Each page's counters come from one aggregate() per model, using
+Count(filter=Q(...)) for the individual numbers. The unfiltered results
+are cached for DASHBOARD_STATS_TIMEOUT seconds. Signals drop a panel as
+soon as one of the models it reads from changes (see signals.py), and
+code that writes with bulk update() calls invalidate() itself.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Q
+
+from . import analytics
+from .models import Author, Book, Customer, DailySalesRollup, Order, Publisher, Review
+
+CACHE_PREFIX = 'stats:'
+
+# name -> (compute function, models it reads)
+PANELS = {}
+
+
+def panel(name, *models):
+    """Register a cached statistics panel that depends on ``models``"""
+    def register(compute):
+        PANELS[name] = (compute, models)
+        return compute
+    return register
+
+
+def get(name):
+    """A panel's statistics, from the cache when possible"""
+    compute, _ = PANELS[name]
+    return cache.get_or_set(CACHE_PREFIX + name, compute, settings.DASHBOARD_STATS_TIMEOUT)
+
+
+def invalidate(*models):
+    """Drop every panel reading from ``models`` once the transaction commits"""
+    keys = [
+        CACHE_PREFIX + name
+        for name, (_, panel_models) in PANELS.items()
+        if any(model in panel_models for model in models)
+    ]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def contributor_stats(queryset):
+    """Counts for authors or publishers annotated with book_count"""
+    return queryset.aggregate(
+        total=Count('id'),
+        with_books=Count('id', filter=Q(book_count__gt=0)),
+        without_books=Count('id', filter=Q(book_count=0)),
+        most_books=Max('book_count', default=0),
+    )
+
+
+@panel('dashboard', Order, Book, Customer, Review, DailySalesRollup)
+def dashboard_stats():
+    orders = Order.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(status='pending')),
+    )
+    return {
+        'total_revenue': analytics.lifetime_revenue(),
+        'total_orders': orders['total'],
+        'pending_orders': orders['pending'],
+        'total_books': Book.objects.filter(is_active=True).count(),
+        'active_customers': Customer.objects.count(),
+        'pending_reviews': Review.objects.filter(is_approved=False).count(),
+    }
+
+
+@panel('books', Book)
+def book_stats():
+    return Book.objects.aggregate(
+        active=Count('id', filter=Q(is_active=True)),
+        low_stock=Count('id', filter=Q(stock_quantity__lte=F('low_stock_threshold'), stock_quantity__gt=0)),
+        out_of_stock=Count('id', filter=Q(stock_quantity=0)),
+    )
+
+
+@panel('reviews', Review)
+def review_stats():
+    return Review.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=Q(is_approved=False)),
+        approved=Count('id', filter=Q(is_approved=True)),
+        verified=Count('id', filter=Q(is_verified_purchase=True)),
+        avg_rating=Avg('rating', filter=Q(is_approved=True), default=0),
+    )
+
+
+@panel('authors', Author, Book)
+def author_stats():
+    return contributor_stats(Author.objects.annotate(book_count=Count('books')))
+
+
+@panel('publishers', Publisher, Book)
+def publisher_stats():
+    return contributor_stats(Publisher.objects.annotate(book_count=Count('book')))
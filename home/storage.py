@@ -0,0 +1,82 @@
+# home/storage.py
+"""
+Content-addressed file storage for book images.
+
+A file is stored under the SHA-256 of its bytes, sharded two directory
+levels deep below the directory its field uploads to:
+
+    books/3f/a2/3fa2...c9.jpg
+
+so no directory holds more than a few hundred entries even with millions
+of files, and saving content that is already stored writes nothing and
+returns the existing name. Rows sharing a file simply hold the same
+name. The reference count is the number of rows holding it, which the
+deferred deletion in home/media.py checks (over indexed columns) before
+removing a file, so a file goes when its last row does. Reusing a name
+cancels its pending deletion (media.keep()). Concurrent saves of the same
+content each write a temporary file and move it into place, so they end
+up with one file under one name.
+
+It is a FileSystemStorage over MEDIA_ROOT, like the default storage, so
+names from either resolve to the same files.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.files.utils import validate_file_name
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        """<directory of name>/<aa>/<bb>/<sha256><extension of name>"""
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4], digest + extension).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        # Identical content is already there under this name
+        if self.exists(name):
+            from . import media
+            # It may be waiting for deletion. keep() cancels that, or waits
+            # for a deletion already under way, after which it's gone
+            media.keep(name)
+            if self.exists(name):
+                return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        """A hashed name only ever holds its own content, so it is never renamed"""
+        validate_file_name(name, allow_relative_path=True)
+        if max_length is not None and len(name) > max_length:
+            raise SuspiciousFileOperation(f'Storage can not find an available filename for "{name}".')
+        return name
+
+    def _save(self, name, content):
+        # Each save writes its own partial file and atomically moves it into
+        # place; a concurrent save of the same content replaces identical bytes
+        partial = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+
+def book_image_storage():
+    """Storage for BookImage files; a callable so migrations don't pin the backend"""
+    return storages['book_images']
@@ -1,3 +1,1191 @@
-from django.test import TestCase
+# home/tests.py
+"""
+Tests for the home app.
 
-# Create your tests here.
+Most TestCases cover one feature each: storefront and dashboard caching,
+the async cart, catalog import, image jobs, covers and media cleanup,
+search, exports, request metrics, benchmarks, pagination, ratings,
+recommendations, the sales rollup, order placement and numbering, and
+stale cart purging.
+
+QueryCountTests guards query counts. Every named URL in home/urls.py
+and home/admin_urls.py is requested against perfdata datasets of two
+sizes. A view's query count must be the same on both (a count that grows
+with the data is an N+1 loop) and within the budget recorded for it in
+query_budgets.json.
+
+Adding a URL means adding it to the manifest. The entry says which
+client makes the request and with what; strings like "book.id" in args,
+data and session are read from the fixtures built by build_fixtures().
+"""
+import base64
+import importlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+from unittest import mock
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    admin_urls, analytics, benchmarks, catalog_io, exports, jobs, media, pagination, perfdata, ratings,
+    recommendations, search, urls,
+)
+from . import cart as cart_service
+from . import order_numbers
+from . import orders as order_service
+from .models import (
+    Author, Book, BookImage, Cart, CartItem, Category, Customer, DailySalesRollup, Job, MediaTombstone,
+    NumberSequence, Order, OrderItem, Publisher, RelatedBook, Review,
+)
+
+BUDGETS = json.loads(Path(__file__).with_name('query_budgets.json').read_text())
+
+# About 10 books, then 1,000
+SCALES = (0.01, 1.0)
+
+
+def url_names(patterns):
+    return {pattern.name for pattern in patterns if isinstance(pattern, URLPattern) and pattern.name}
+
+
+def upload(name):
+    buffer = BytesIO()
+    Image.new('RGB', (60, 90), (96, 125, 139)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+def build_fixtures():
+    """
+    The rows the manifest refers to, chosen to be the busiest of their kind
+    so that anything per-row in a view shows up as growth between scales.
+    """
+    books = Book.objects.filter(is_active=True).annotate(reviews_total=Count('reviews')).order_by('-reviews_total', 'id')
+    book, other_book = books[:2]
+    Book.objects.filter(pk__in=[book.pk, other_book.pk]).update(stock_quantity=100, is_bestseller=True)
+
+    user, _ = User.objects.get_or_create(username='query-shopper')
+    customer, _ = Customer.objects.get_or_create(user=user)
+    cart, _ = Cart.objects.get_or_create(customer=customer)
+    cart.items.all().delete()
+    in_cart = Book.objects.filter(is_active=True).exclude(pk=other_book.pk).order_by('id')[:3]
+    Book.objects.filter(pk__in=[b.pk for b in in_cart]).update(stock_quantity=100)
+    CartItem.objects.bulk_create([CartItem(cart=cart, book=b, quantity=1, price=b.price) for b in in_cart])
+
+    # Pending, so that approving it has something to do at either scale
+    review = Review.objects.filter(book=book).order_by('id').first()
+    Review.objects.filter(pk=review.pk).update(is_approved=False)
+
+    return {
+        'book': book,
+        'other_book': other_book,
+        'image': book.cover,
+        'cart_item': cart.items.order_by('id').first(),
+        'order': Order.objects.annotate(item_count=Count('items')).order_by('-item_count', 'created_at').first(),
+        'author': Author.objects.annotate(book_count=Count('books')).order_by('-book_count', 'id').first(),
+        'category': Category.objects.annotate(book_count=Count('books')).order_by('-book_count', 'id').first(),
+        'publisher': Publisher.objects.annotate(book_count=Count('book')).order_by('-book_count', 'id').first(),
+        'review': review,
+    }
+
+
+def resolve(value, fixtures):
+    """``"book.id"`` -> fixtures['book'].id; anything else unchanged"""
+    if isinstance(value, str) and value.split('.')[0] in fixtures:
+        name, attr = value.split('.', 1)
+        return str(getattr(fixtures[name], attr))
+    return value
+
+
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        # The metrics middleware would log a line per request
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root, REQUEST_METRICS_ENABLED=False))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        staff = User.objects.create(username='query-staff', is_staff=True)
+        cls.counts = {scale: {} for scale in SCALES}
+        for scale in SCALES:
+            # Uploads are stored by content, so each scale starts without them
+            shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+            perfdata.clear()
+            perfdata.generate(scale=scale)
+            fixtures = build_fixtures()
+            clients = {'anonymous': Client(), 'shopper': Client(), 'staff': Client()}
+            clients['shopper'].force_login(User.objects.get(username='query-shopper'))
+            clients['staff'].force_login(staff)
+            for name, entry in BUDGETS.items():
+                if 'skip' not in entry:
+                    cls.counts[scale][name] = cls.measure(clients[entry['client']], name, entry, fixtures)
+
+    @staticmethod
+    def measure(client, name, entry, fixtures):
+        """(status code, query count) of one request, rolled back afterwards"""
+        url = reverse(name, args=[resolve(arg, fixtures) for arg in entry.get('args', [])])
+        if 'session' in entry:
+            session = client.session
+            session.update({key: resolve(value, fixtures) for key, value in entry['session'].items()})
+            session.save()
+
+        kwargs = {}
+        if 'json' in entry:
+            kwargs.update(data=json.dumps(entry['json']), content_type='application/json')
+        else:
+            data = {key: resolve(value, fixtures) for key, value in entry.get('data', {}).items()}
+            data.update({field: upload(f'{field}.jpg') for field in entry.get('files', [])})
+            kwargs['data'] = data
+        if entry.get('ajax'):
+            kwargs['headers'] = {'X-Requested-With': 'XMLHttpRequest'}
+
+        # Cold caches, so cached views are counted at their worst
+        for backend in caches.all():
+            backend.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, entry.get('method', 'get'))(url, **kwargs)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            transaction.set_rollback(True)
+        return response.status_code, len(queries)
+
+    def test_every_url_has_a_budget(self):
+        names = url_names(urls.urlpatterns) | url_names(admin_urls.urlpatterns)
+        self.assertEqual(sorted(names - set(BUDGETS)), [], "URLs missing from query_budgets.json")
+        self.assertEqual(sorted(set(BUDGETS) - names), [], "query_budgets.json entries for unknown URLs")
+
+    def test_views_respond_as_expected(self):
+        for name, (status, _) in self.counts[SCALES[-1]].items():
+            with self.subTest(name):
+                if 'status' in BUDGETS[name]:
+                    self.assertEqual(status, BUDGETS[name]['status'])
+                else:
+                    self.assertLess(status, 400)
+
+    def test_query_counts_do_not_grow_with_data(self):
+        small, large = SCALES
+        for name, (_, queries) in self.counts[large].items():
+            with self.subTest(name):
+                self.assertEqual(queries, self.counts[small][name][1],
+                                 f"{name}: {self.counts[small][name][1]} queries at scale {small}, {queries} at {large}")
+
+    def test_query_counts_within_budget(self):
+        for name, (_, queries) in self.counts[SCALES[-1]].items():
+            with self.subTest(name):
+                self.assertLessEqual(queries, BUDGETS[name]['queries'])
+
+
+class StorefrontCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root, REQUEST_METRICS_ENABLED=False))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        perfdata.generate(scale=0.01)
+        Book.objects.filter(pk=Book.objects.filter(is_active=True).first().pk).update(is_featured=True)
+        cls.book = Book.objects.filter(is_active=True, is_featured=True).order_by('-created_at').first()
+
+    def setUp(self):
+        for backend in caches.all():
+            backend.clear()
+
+    def warm_queries(self, url):
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_anonymous_pages_come_from_cache(self):
+        self.assertEqual(self.warm_queries(reverse('home')), 0)
+        # The book itself and its related books are still looked up
+        self.assertLessEqual(self.warm_queries(self.book.get_absolute_url()), 2)
+
+    def test_book_changes_reach_cached_pages(self):
+        url = self.book.get_absolute_url()
+        self.client.get(reverse('home'))
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.price = Decimal('123.45')
+            self.book.save()
+        self.assertContains(self.client.get(reverse('home')), 'Ksh123.45')
+        self.assertContains(self.client.get(url), 'Ksh123.45')
+
+    def test_review_changes_reach_the_detail_page(self):
+        url = self.book.get_absolute_url()
+        self.client.get(url)
+        Review.objects.create(book=self.book, customer=Customer.objects.first(), rating=5,
+                              title='Cached title check', content='Fine', is_approved=True)
+        self.assertContains(self.client.get(url), 'Cached title check')
+
+
+class DashboardStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='stats-staff', is_staff=True)
+        cls.customer = Customer.objects.create(user=User.objects.create(username='stats-buyer'))
+        cls.book = Book.objects.create(title='Counted', slug='counted', description='x', price=Decimal('10.00'))
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client.force_login(self.staff)
+
+    def dashboard(self):
+        return self.client.get(reverse('dashboard')).context
+
+    def test_cached_stats_see_new_orders_and_reviews(self):
+        self.assertEqual((self.dashboard()['total_orders'], self.dashboard()['pending_reviews']), (0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(customer=self.customer, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'))
+        self.assertEqual(self.dashboard()['pending_orders'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, customer=self.customer, rating=5, title='Great', content='x')
+        context = self.dashboard()
+        self.assertEqual((context['total_orders'], context['pending_reviews']), (1, 1))
+
+
+class LazyCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Lazy Cart', slug='lazy-cart', description='x',
+                                       price=Decimal('10.00'), stock_quantity=5)
+
+    def test_reading_without_a_cart_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('cart_data'))
+        self.assertEqual(response.json()['is_empty'], True)
+        self.assertEqual([q['sql'] for q in queries if not q['sql'].startswith('SELECT')], [])
+        self.assertNotIn('sessionid', response.cookies)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_first_add_creates_the_cart(self):
+        self.client.get(reverse('cart_data'))
+        response = self.client.post(reverse('add_to_cart', args=[self.book.id]))
+        self.assertEqual(response.json()['cart_count'], 1)
+        self.assertEqual(Cart.objects.get().items.count(), 1)
+        self.assertEqual(self.client.get(reverse('cart_data')).json()['total_items'], 1)
+
+
+class AsyncCartTests(TestCase):
+    """The cart and catalog endpoints run as async views through an async middleware chain"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Async Cart', slug='async-cart', description='x',
+                                       price=Decimal('12.50'), stock_quantity=5)
+
+    async def test_cart_round_trip(self):
+        client = AsyncClient()
+        response = await client.post(reverse('add_to_cart', args=[self.book.id]))
+        self.assertEqual(response.json()['cart_subtotal'], '12.50')
+        # Timings are for staff, or everyone under DEBUG
+        self.assertNotIn('Server-Timing', response.headers)
+
+        response = await client.get(reverse('cart_data'))
+        self.assertEqual(response.json()['items'][0]['book_slug'], 'async-cart')
+        etag = response.headers['ETag']
+        response = await client.get(reverse('cart_data'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        item = await CartItem.objects.aget(book=self.book)
+        response = await client.post(reverse('update_cart_item', args=[item.id]),
+                                     {'quantity': 3}, content_type='application/json')
+        self.assertEqual(response.json()['item_total'], '37.50')
+        response = await client.get(reverse('cart_data'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        response = await client.post(reverse('remove_from_cart', args=[item.id]))
+        self.assertEqual(response.json()['cart_count'], 0)
+
+    @override_settings(DEBUG=True)
+    async def test_catalog_book(self):
+        response = await AsyncClient().get(reverse('catalog_book', args=['async-cart']))
+        self.assertEqual(response.json()['title'], 'Async Cart')
+        # Queries made through the async ORM are counted too
+        self.assertIn('desc="3 queries"', response.headers['Server-Timing'])
+        response = await AsyncClient().get(reverse('catalog_book', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogImportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        # perfdata writes a placeholder image and its renditions
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        perfdata.generate(scale=0.01)
+
+    def import_text(self, text, fmt='csv', chunk_size=catalog_io.CHUNK_SIZE):
+        importer = catalog_io.CatalogImporter(chunk_size)
+        return importer.run(catalog_io.read_rows(io.StringIO(text), fmt))
+
+    def test_export_round_trips(self):
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt):
+                exported = io.StringIO()
+                count = catalog_io.export_books(exported, fmt)
+                importer = self.import_text(exported.getvalue(), fmt, chunk_size=4)
+                self.assertEqual((importer.created, importer.updated, importer.errors), (0, count, []))
+                again = io.StringIO()
+                catalog_io.export_books(again, fmt)
+                self.assertEqual(again.getvalue(), exported.getvalue())
+
+    def test_new_rows_and_rejected_rows(self):
+        importer = self.import_text(
+            "isbn_13,title,price,authors,categories,publisher\n"
+            "978-1-23456-789-7,Imported Book,12.50,\"Ada Lovelace; Smith, John\",Imported Category,Imported Press\n"
+            "9781234567880,Bad Price,abc,,,\n"
+            "9781234567897,Duplicate,3,,,\n"
+        )
+        self.assertEqual(importer.created, 1)
+        self.assertEqual([(line, message.split(':')[0]) for line, _, message in importer.errors],
+                         [(3, 'price is not a number'), (4, 'Duplicate of an earlier row for 9781234567897')])
+        book = Book.objects.get(isbn_13='9781234567897')
+        self.assertEqual(book.slug, 'imported-book')
+        self.assertEqual(book.publisher.name, 'Imported Press')
+        self.assertEqual(sorted(a.full_name for a in book.authors.all()), ['Ada Lovelace', 'John Smith'])
+        self.assertEqual([c.slug for c in book.categories.all()], ['imported-category'])
+
+
+class ImageJobTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=media_root, REQUEST_METRICS_ENABLED=False))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Queued Images', slug='queued-images', description='x', price=Decimal('10.00'))
+        cls.staff = User.objects.create(username='image-staff', is_staff=True)
+
+    def upload(self, *files):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('upload_book_images', args=[self.book.id]), {'images': list(files)})
+        return response.json()
+
+    def test_upload_is_processed_by_the_worker(self):
+        buffer = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        Image.new('RGB', (3000, 4500), (96, 125, 139)).save(buffer, 'JPEG', exif=exif)
+        data = self.upload(SimpleUploadedFile('big.jpg', buffer.getvalue(), content_type='image/jpeg'))
+        self.assertEqual(data['images'][0]['status'], BookImage.PENDING)
+        self.assertEqual(Job.objects.get().kind, 'process_image')
+
+        upload_path = BookImage.objects.get().image.path
+        [(_, succeeded)] = jobs.work_batch('test', 10)
+        self.assertTrue(succeeded)
+        image = BookImage.objects.get()
+        self.assertEqual(image.status, BookImage.READY)
+        self.assertTrue(image.thumb_image)
+        with Image.open(image.image.path) as stored:
+            self.assertEqual(max(stored.size), 1600)
+            self.assertEqual(len(stored.getexif()), 0)
+
+        # The original upload is removed by a follow-up job
+        self.assertTrue(os.path.exists(upload_path))
+        self.assertEqual([job.kind for job, _ in jobs.work_batch('test', 10)], ['process_tombstones'])
+        self.assertFalse(os.path.exists(upload_path))
+        self.assertFalse(Job.objects.exists())
+
+    def test_files_that_are_not_images_fail(self):
+        self.upload(SimpleUploadedFile('fake.jpg', b'not an image', content_type='image/jpeg'))
+        jobs.work_batch('test', 10)
+        image = BookImage.objects.get()
+        self.assertEqual(image.status, BookImage.FAILED)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).cover_id, None)
+
+    def test_failing_jobs_are_retried_then_kept(self):
+        jobs.handler('explode')(lambda: 1 / 0)
+        self.addCleanup(jobs.HANDLERS.pop, 'explode')
+        job = Job.objects.create(kind='explode')
+        for _ in range(5):
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            [(_, succeeded)] = jobs.work_batch('test', 10)
+            self.assertFalse(succeeded)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 5))
+        self.assertIn('ZeroDivisionError', job.last_error)
+
+
+class CoverSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Covered', slug='covered', description='x', price=Decimal('10.00'))
+
+    def add_image(self, name, **kwargs):
+        kwargs.setdefault('status', BookImage.READY)
+        return BookImage.objects.create(book=self.book, image=f'books/{name}.jpg', **kwargs)
+
+    def cover(self):
+        return Book.objects.values_list('cover_id', flat=True).get(pk=self.book.pk)
+
+    def test_cover_follows_the_primary_image(self):
+        first = self.add_image('first')
+        self.assertEqual(self.cover(), first.pk)
+        primary = self.add_image('primary', order=1, is_primary=True)
+        self.assertEqual(self.cover(), primary.pk)
+        self.add_image('failed', is_primary=True, status=BookImage.FAILED)
+        self.assertEqual(self.cover(), primary.pk)
+
+    def test_setting_the_primary_image_moves_the_cover(self):
+        first, second = self.add_image('first', is_primary=True), self.add_image('second', order=1)
+        self.assertEqual(self.cover(), first.pk)
+        self.client.force_login(User.objects.create(username='cover-staff', is_staff=True))
+        response = self.client.post(reverse('set_primary_image', args=[self.book.pk, second.pk]))
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.cover(), second.pk)
+
+    def test_deleting_the_cover_falls_back_to_the_next_image(self):
+        primary, other = self.add_image('primary', is_primary=True), self.add_image('other')
+        primary.delete()
+        self.assertEqual(self.cover(), other.pk)
+        other.delete()
+        self.assertIsNone(self.cover())
+
+
+class MediaDeletionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, REQUEST_METRICS_ENABLED=False))
+        super().setUpClass()
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Buried', slug='buried', description='x', price=Decimal('10.00'))
+        self.image = BookImage.objects.create(book=self.book, image=upload('cover.jpg'), status=BookImage.READY)
+        self.path = self.image.image.path
+
+    def test_files_outlive_the_request_until_the_job_runs(self):
+        self.client.force_login(User.objects.create(username='media-staff', is_staff=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_book', args=[self.book.id]))
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+        self.assertTrue(os.path.exists(self.path))
+        jobs.work_batch('test', 10)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_identical_uploads_share_one_sharded_file(self):
+        other = BookImage.objects.create(book=self.book, image=upload('copy.JPG'), status=BookImage.READY)
+        self.assertEqual(other.image.name, self.image.image.name)
+        self.assertRegex(other.image.name, r'^books/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+    def test_concurrent_identical_saves_leave_one_file(self):
+        storage = self.image.image.storage
+        checks = [False]
+        # The other save hasn't finished when this one first checks for the file
+        with mock.patch.object(storage, 'exists', side_effect=lambda name: checks.pop() if checks
+                               else os.path.exists(storage.path(name))):
+            name = storage.save('books/race.jpg', upload('race.jpg'))
+        self.assertEqual(name, self.image.image.name)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), [os.path.basename(self.path)])
+
+    def test_shared_files_are_kept(self):
+        BookImage.objects.create(book=self.book, image=self.image.image.name, status=BookImage.READY)
+        self.image.delete()
+        self.assertEqual(media.process_tombstones(), 0)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_ordered_books_are_refused_and_keep_their_files(self):
+        customer = Customer.objects.create(user=User.objects.create(username='media-buyer'))
+        order = Order.objects.create(customer=customer, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'))
+        OrderItem.objects.create(order=order, book=self.book, quantity=1, price=Decimal('10.00'))
+        self.client.force_login(User.objects.create(username='media-staff', is_staff=True))
+        response = self.client.post(reverse('delete_book', args=[self.book.id]))
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertTrue(BookImage.objects.filter(pk=self.image.pk).exists())
+        self.assertFalse(MediaTombstone.objects.exists())
+
+    def test_reupload_cancels_a_pending_deletion(self):
+        self.image.delete()
+        other = BookImage.objects.create(book=self.book, image=upload('again.jpg'), status=BookImage.READY)
+        self.assertEqual(other.image.path, self.path)
+        self.assertFalse(MediaTombstone.objects.exists())
+        media.process_tombstones()
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_reupload_rewrites_a_file_deleted_while_it_waited(self):
+        self.image.delete()
+        # The deletion job gets the tombstone's lock first and removes the
+        # file before the upload's row exists
+        with mock.patch.object(media, 'keep', side_effect=lambda name: media.process_tombstones()):
+            other = BookImage.objects.create(book=self.book, image=upload('again.jpg'), status=BookImage.READY)
+        self.assertEqual(other.image.path, self.path)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_orphans_are_found_once_old_enough(self):
+        orphan = Path(self.media_root, 'authors', 'lost.jpg')
+        orphan.parent.mkdir(parents=True, exist_ok=True)
+        orphan.write_bytes(b'x')
+        self.assertEqual(list(media.find_orphans()), [])
+        self.assertEqual(list(media.find_orphans(min_age=timedelta(0))), ['authors/lost.jpg'])
+
+
+class SearchFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Publisher.objects.bulk_create([Publisher(name=f'Acme Press {n}') for n in range(5)])
+        Publisher.objects.create(name='Other House')
+        search.index_queryset(Publisher.objects.all())
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_dashboard_filters_are_not_capped(self):
+        matched = search.filter_queryset(Publisher.objects.all(), 'acme')
+        self.assertEqual(matched.count(), 5)
+        self.assertEqual(len(search.filter_queryset(Publisher.objects.all(), 'acme', ranked=True)), 2)
+
+        # The in-memory backend filters through a subquery, not a list of ids
+        expected = list(matched)
+        found = search.InMemoryBackend().matches('publisher', 'acme', Publisher._meta.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertQuerySetEqual(Publisher.objects.filter(pk__in=found), expected, ordered=False)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('home_searchdocument', queries[0]['sql'])
+
+    @mock.patch.object(search, '_indexed_types', set())
+    def test_an_unbuilt_index_falls_back_to_the_model(self):
+        Author.objects.create(first_name='Ngugi', last_name='wa Thiongo')
+        Author.objects.create(first_name='Chinua', last_name='Achebe')
+        self.assertFalse(search.is_indexed('author'))
+        self.assertQuerySetEqual(
+            search.filter_queryset(Author.objects.all(), 'ngugi thiong').values_list('last_name', flat=True),
+            ['wa Thiongo'],
+        )
+        self.assertEqual(len(search.search_ids('author', 'achebe')), 1)
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_dashboard_list_counts_every_match(self):
+        self.client.force_login(User.objects.create(username='search-staff', is_staff=True))
+        response = self.client.get(reverse('publishers'), {'search': 'acme'})
+        self.assertEqual(response.context['total_publishers'], 5)
+        self.assertEqual(len(response.context['publishers']), 5)
+
+    @override_settings(ORDER_NUMBER_PREFIX='ORD')
+    def test_order_numbers_are_found_without_their_prefix(self):
+        customer = Customer.objects.create(user=User.objects.create(username='search-buyer'))
+        order = Order.objects.create(customer=customer, order_number='ORD4711',
+                                     subtotal=Decimal('1.00'), total_amount=Decimal('1.00'))
+        search.index_objects([order])
+        self.assertEqual(search.search_ids('order', '4711'), [order.pk])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='export-staff', is_staff=True)
+        customer = Customer.objects.create(user=User.objects.create(username='mallory'))
+        book = Book.objects.create(title='Exported', slug='exported', description='x', price=Decimal('10.00'))
+        Review.objects.create(book=book, customer=customer, rating=4, title='@SUM(A1:A9)',
+                              content='=HYPERLINK("http://example.com")')
+
+    def export(self, fmt):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_reviews'), {'format': fmt})
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_cells_cannot_run_as_formulas(self):
+        body = self.export('csv')
+        self.assertIn("'@SUM(A1:A9)", body)
+        self.assertIn('"\'=HYPERLINK(""http://example.com"")"', body)
+
+    def test_jsonl_is_left_as_is(self):
+        row = json.loads(self.export('jsonl'))
+        self.assertEqual(row['title'], '@SUM(A1:A9)')
+
+    async def test_asgi_exports_stream_from_an_async_iterator(self):
+        client = AsyncClient()
+        await client.aforce_login(self.staff)
+        with mock.patch.object(exports, 'ROWS_PER_WRITE', 1):
+            response = await client.get(reverse('export_reviews'), {'format': 'csv'})
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        # The header and the row are sent as they are produced, not joined up front
+        self.assertEqual(len(chunks), 2)
+        self.assertIn(b"'@SUM(A1:A9)", chunks[1])
+
+
+class RequestMetricsTests(TestCase):
+    def test_server_timing_is_only_sent_to_staff(self):
+        url = reverse('shop')
+        self.assertNotIn('Server-Timing', self.client.get(url).headers)
+        self.client.force_login(User.objects.create(username='timing-staff', is_staff=True))
+        self.assertRegex(self.client.get(url).headers['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    async def test_async_requests_check_staff_too(self):
+        client = AsyncClient()
+        self.assertNotIn('Server-Timing', (await client.get(reverse('cart_data'))).headers)
+        await client.aforce_login(await User.objects.acreate(username='async-staff', is_staff=True))
+        self.assertIn('Server-Timing', (await client.get(reverse('cart_data'))).headers)
+
+    def test_only_over_budget_requests_are_logged_by_default(self):
+        logger = logging.getLogger('buxta.requests')
+        self.assertFalse(logger.isEnabledFor(logging.INFO))
+        self.assertTrue(logger.isEnabledFor(logging.WARNING))
+
+
+class BenchmarkTests(SimpleTestCase):
+    def report(self, **results):
+        return {'results': {name: {'max_queries': queries, 'p95_ms': p95} for name, (queries, p95) in results.items()}}
+
+    def test_percentile_of_one_sample(self):
+        for pct in (1, 50, 95, 100):
+            self.assertEqual(benchmarks.percentile([7.5], pct), 7.5)
+
+    def test_percentile_between_samples_takes_the_nearest_rank_above(self):
+        samples = [40, 10, 30, 20]
+        self.assertEqual(benchmarks.percentile(samples, 50), 20)
+        self.assertEqual(benchmarks.percentile(samples, 60), 30)
+        self.assertEqual(benchmarks.percentile(samples, 95), 40)
+
+    def test_compare_within_the_thresholds(self):
+        baseline = self.report(shop=(5, 100.0), cart=(3, 10.0))
+        report = self.report(shop=(5, 125.0), cart=(2, 8.0), new_view=(9, 500.0))
+        self.assertEqual(benchmarks.compare(report, baseline), [])
+
+    def test_compare_over_the_thresholds(self):
+        baseline = self.report(shop=(5, 100.0))
+        report = self.report(shop=(6, 125.5))
+        self.assertEqual(benchmarks.compare(report, baseline), [
+            'shop: queries 5 -> 6',
+            'shop: p95 100.0ms -> 125.5ms',
+        ])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create([
+            Book(title=f'Tied {n}', slug=f'tied-{n}', description='x', price=Decimal('5.00')) for n in range(5)
+        ])
+        # Same created_at for every book, so only the id tiebreak orders them
+        cls.created_at = timezone.now().replace(microsecond=0)
+        Book.objects.update(created_at=cls.created_at)
+        cls.ids = sorted(Book.objects.values_list('id', flat=True), reverse=True)
+
+    def test_cursor_round_trips(self):
+        cursor = pagination.encode_cursor(self.created_at, 42)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_-]+$')
+        self.assertEqual(pagination.decode_cursor(cursor), (self.created_at, 42))
+
+    def test_ties_on_created_at_are_broken_by_id(self):
+        paginator = pagination.KeysetPaginator(Book.objects.all(), per_page=2)
+        seen, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            seen += [book.id for book in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.ids)
+
+    def test_bad_cursors_restart_from_the_first_page(self):
+        stamp = self.created_at.isoformat()
+        tampered = [
+            'garbage', '%%%', '\u00e9t\u00e9',
+            base64.urlsafe_b64encode(b'not|a|cursor').decode(),
+            base64.urlsafe_b64encode(f'{stamp}|abc'.encode()).decode(),
+            base64.urlsafe_b64encode(f'yesterday|{self.ids[0]}'.encode()).decode(),
+            base64.urlsafe_b64encode(f'{stamp}|{10 ** 30}'.encode()).decode(),
+            base64.urlsafe_b64encode(f'{stamp}|-5'.encode()).decode(),
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(pagination.InvalidCursor):
+                    pagination.decode_cursor(cursor)
+                response = self.client.get(reverse('shop_api'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([book['id'] for book in response.json()['books']], self.ids)
+                self.assertEqual(self.client.get(reverse('shop'), {'cursor': cursor}).status_code, 200)
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book, cls.other = Book.objects.bulk_create([
+            Book(title=f'Rated {n}', slug=f'rated-{n}', description='x', price=Decimal('5.00')) for n in range(2)
+        ])
+        cls.customers = [Customer.objects.create(user=User.objects.create(username=f'rater-{n}')) for n in range(4)]
+
+    def review(self, customer, rating, approved=True, book=None):
+        return Review.objects.create(book=book or self.book, customer=self.customers[customer], rating=rating,
+                                     title='t', content='c', is_approved=approved)
+
+    def assertAggregatesFresh(self):
+        for book in Book.objects.all():
+            fresh = Review.objects.filter(book=book, is_approved=True).aggregate(total=Sum('rating'), n=Count('id'))
+            with self.subTest(book=book.title):
+                self.assertEqual(book.rating_sum, fresh['total'] or 0)
+                self.assertEqual(book.review_count, fresh['n'])
+                self.assertEqual(book.average_rating, ratings.average(fresh['total'] or 0, fresh['n']))
+
+    def test_single_review_changes(self):
+        first = self.review(0, 5)
+        pending = self.review(1, 2, approved=False)
+        self.assertAggregatesFresh()
+
+        pending.is_approved = True
+        pending.save()
+        first.rating = 3
+        first.save()
+        self.assertAggregatesFresh()
+        self.assertEqual(Book.objects.get(pk=self.book.pk).average_rating, Decimal('2.50'))
+
+        first.book = self.other
+        first.save()
+        self.assertAggregatesFresh()
+
+        Review.objects.get(pk=pending.pk).delete()
+        first.is_approved = False
+        first.save()
+        self.assertAggregatesFresh()
+        self.assertEqual(Book.objects.get(pk=self.book.pk).review_count, 0)
+
+    def test_bulk_approval_and_deletion(self):
+        for n, rating in enumerate([5, 4, 1]):
+            self.review(n, rating, approved=False)
+        self.review(3, 2, book=self.other)
+
+        self.assertEqual(ratings.set_approval(Review.objects.all(), True), 3)
+        self.assertAggregatesFresh()
+        self.assertEqual(ratings.set_approval(Review.objects.filter(rating__gte=4), False), 2)
+        self.assertAggregatesFresh()
+        self.assertEqual(ratings.delete_reviews(Review.objects.filter(rating__lte=2)), 2)
+        self.assertAggregatesFresh()
+        self.assertEqual(Book.objects.get(pk=self.other.pk).review_count, 0)
+
+    def test_rebuild_ratings_check_reports_drift(self):
+        self.review(0, 4)
+        Book.objects.filter(pk=self.book.pk).update(rating_sum=40, rating_count=3)
+
+        out = io.StringIO()
+        with self.assertRaises(SystemExit) as exit:
+            call_command('rebuild_ratings', '--check', stdout=out)
+        self.assertEqual(exit.exception.code, 1)
+        self.assertIn(f'#{self.book.pk} Rated 0: stored 40/3', out.getvalue())
+        self.assertEqual(Book.objects.get(pk=self.book.pk).rating_sum, 40)
+
+        call_command('rebuild_ratings', stdout=io.StringIO())
+        self.assertAggregatesFresh()
+        out = io.StringIO()
+        call_command('rebuild_ratings', '--check', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        books = {
+            name: Book.objects.create(title=name.title(), slug=name, description='x', price=Decimal('5.00'))
+            for name in ('target', 'bought-with', 'same-category', 'unrelated')
+        }
+        books['retired'] = Book.objects.create(title='Retired', slug='retired', description='x',
+                                               price=Decimal('5.00'), is_active=False)
+        category = Category.objects.create(name='Niche', slug='niche')
+        category.books.add(books['target'], books['same-category'])
+
+        customer = Customer.objects.create(user=User.objects.create(username='co-buyer'))
+        for _ in range(2):
+            order = Order.objects.create(customer=customer, subtotal=Decimal('15.00'), total_amount=Decimal('15.00'))
+            for name in ('target', 'bought-with', 'retired'):
+                OrderItem.objects.create(order=order, book=books[name], quantity=1, price=Decimal('5.00'))
+        cls.books = books
+
+    def active_ids(self):
+        return set(Book.objects.filter(is_active=True).values_list('id', flat=True))
+
+    def test_co_purchased_books_rank_first(self):
+        recommendations.build()
+        self.assertEqual(
+            recommendations.related_books(self.books['target']),
+            [self.books['bought-with'], self.books['same-category']],
+        )
+
+    def test_books_never_relate_to_themselves_or_inactive_books(self):
+        retired = self.books['retired'].pk
+        for book_id, neighbours in recommendations.score_all(self.active_ids(), top_n=12):
+            related_ids = [related_id for related_id, _ in neighbours]
+            self.assertNotIn(book_id, related_ids)
+            self.assertNotIn(retired, related_ids)
+
+    def test_books_deactivated_since_the_build_are_left_out(self):
+        recommendations.build()
+        Book.objects.filter(pk=self.books['bought-with'].pk).update(is_active=False)
+        self.assertEqual(recommendations.related_books(self.books['target']), [self.books['same-category']])
+
+    def test_a_rebuild_replaces_stale_rows(self):
+        target, retired = self.books['target'], self.books['retired']
+        RelatedBook.objects.bulk_create([
+            RelatedBook(book=target, related=self.books['unrelated'], rank=0, score=99.0),
+            RelatedBook(book=retired, related=target, rank=0, score=1.0),
+        ])
+        call_command('build_related_books', stdout=io.StringIO())
+        self.assertFalse(RelatedBook.objects.filter(book=retired).exists())
+        self.assertEqual(
+            list(RelatedBook.objects.filter(book=target).values_list('related__slug', flat=True)),
+            ['bought-with', 'same-category'],
+        )
+
+
+@override_settings(TIME_ZONE='Africa/Nairobi')
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(user=User.objects.create(username='rollup-buyer'))
+        cls.book = Book.objects.create(title='Rolled up', slug='rolled-up', description='x', price=Decimal('10.00'))
+
+    def order(self, at, status='confirmed', quantity=2, price=Decimal('10.00')):
+        """An order placed at ``at`` (UTC), created without refreshing anything"""
+        order = Order.objects.create(customer=self.customer, status=status,
+                                     subtotal=quantity * price, total_amount=quantity * price)
+        OrderItem.objects.create(order=order, book=self.book, quantity=quantity, price=price)
+        Order.objects.filter(pk=order.pk).update(created_at=at)
+        order.refresh_from_db()
+        return order
+
+    def rollup(self, day):
+        return DailySalesRollup.objects.filter(date=day).values('revenue', 'order_count', 'units_sold').first()
+
+    def test_changes_refresh_the_local_day(self):
+        # 22:30 UTC is already the next day in Nairobi (UTC+3)
+        order = self.order(datetime(2026, 3, 1, 22, 30, tzinfo=dt_timezone.utc), status='pending')
+        local_day = date(2026, 3, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'confirmed'
+            order.save()
+        self.assertEqual(self.rollup(local_day), {'revenue': Decimal('20.00'), 'order_count': 1, 'units_sold': 2})
+        self.assertIsNone(self.rollup(date(2026, 3, 1)))
+
+        item = order.items.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.quantity = 5
+            item.save()
+        self.assertEqual(self.rollup(local_day)['units_sold'], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertEqual(self.rollup(local_day)['units_sold'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+        self.assertIsNone(self.rollup(local_day))
+
+    def test_one_refresh_per_day_per_transaction(self):
+        order = self.order(datetime(2026, 3, 1, 9, 0, tzinfo=dt_timezone.utc))
+        item = order.items.get()
+        with mock.patch.object(analytics, 'rebuild_rollups', wraps=analytics.rebuild_rollups) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.save()
+                item.save()
+                order.status = 'shipped'
+                order.save()
+        rebuild.assert_called_once_with(date(2026, 3, 1), date(2026, 3, 1))
+
+    def test_a_rolled_back_savepoint_does_not_drop_the_refresh(self):
+        order = self.order(datetime(2026, 3, 1, 9, 0, tzinfo=dt_timezone.utc), status='pending')
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'confirmed'
+            order.save()
+            # The last callback registered for the day is discarded with its savepoint
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    order.save()
+                    raise IntegrityError
+        self.assertEqual(self.rollup(date(2026, 3, 1))['order_count'], 1)
+
+    def test_the_migration_backfills_existing_orders(self):
+        self.order(datetime(2026, 3, 1, 9, 0, tzinfo=dt_timezone.utc))
+        self.order(datetime(2026, 3, 1, 23, 0, tzinfo=dt_timezone.utc), quantity=1)
+        DailySalesRollup.objects.all().delete()
+        backfill = importlib.import_module('home.migrations.0006_daily_sales_rollup').backfill_rollups
+        backfill(django_apps, None)
+        self.assertEqual(self.rollup(date(2026, 3, 1)), {'revenue': Decimal('20.00'), 'order_count': 1, 'units_sold': 2})
+        self.assertEqual(self.rollup(date(2026, 3, 2))['units_sold'], 1)
+
+    def test_sales_series_matches_the_order_table(self):
+        utc = dt_timezone.utc
+        placed = [
+            (datetime(2026, 2, 27, 12, 0, tzinfo=utc), 'confirmed', 1),
+            (datetime(2026, 2, 28, 21, 30, tzinfo=utc), 'delivered', 3),  # March 1st locally
+            (datetime(2026, 3, 1, 8, 0, tzinfo=utc), 'shipped', 2),
+            (datetime(2026, 3, 1, 9, 0, tzinfo=utc), 'cancelled', 4),
+            (datetime(2026, 3, 4, 10, 0, tzinfo=utc), 'pending', 1),
+            (datetime(2026, 3, 9, 10, 0, tzinfo=utc), 'processing', 6),
+        ]
+        for at, status, quantity in placed:
+            self.order(at, status, quantity)
+        analytics.rebuild_rollups()
+
+        start, end = date(2026, 2, 23), date(2026, 3, 10)
+        for granularity in analytics.GRANULARITIES:
+            expected = defaultdict(lambda: [0.0, 0, 0])
+            for order in Order.objects.filter(status__in=analytics.REVENUE_STATUSES).prefetch_related('items'):
+                bucket = expected[analytics.bucket_start(timezone.localdate(order.created_at), granularity)]
+                bucket[0] += float(order.total_amount)
+                bucket[1] += 1
+                bucket[2] += sum(item.quantity for item in order.items.all())
+            with self.subTest(granularity):
+                series = analytics.sales_series(start, end, granularity)
+                self.assertEqual(
+                    {point['date']: [point['sales'], point['orders'], point['units']]
+                     for point in series if point['orders']},
+                    {day.strftime('%Y-%m-%d'): values for day, values in expected.items()},
+                )
+                self.assertEqual(len(series), len({point['date'] for point in series}))
+
+
+ADDRESSES = {
+    f'{kind}_{field}': value
+    for kind in ('billing', 'shipping')
+    for field, value in [('first_name', 'Ada'), ('last_name', 'Buyer'), ('address_line_1', '1 Test Road'),
+                         ('city', 'Nairobi'), ('state', 'Nairobi'), ('postal_code', '00100'), ('country', 'Kenya')]
+}
+
+
+class PlaceOrderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(user=User.objects.create(username='checkout-buyer'))
+        cls.books = Book.objects.bulk_create([
+            Book(title=f'Stocked {n}', slug=f'stocked-{n}', description='x', price=Decimal('8.00'), stock_quantity=5)
+            for n in range(2)
+        ])
+
+    def setUp(self):
+        self.cart = Cart.objects.create(customer=self.customer)
+        for book, quantity in zip(self.books, (2, 3)):
+            CartItem.objects.create(cart=self.cart, book=book, quantity=quantity, price=book.price)
+        self.stamp = timezone.now() - timedelta(days=1)
+        Book.objects.update(updated_at=self.stamp)
+
+    def stock(self):
+        return dict(Book.objects.values_list('title', 'stock_quantity'))
+
+    def test_stock_is_taken_once_per_line(self):
+        order = order_service.place_order(self.cart, self.customer, **ADDRESSES)
+        self.assertEqual(self.stock(), {'Stocked 0': 3, 'Stocked 1': 2})
+        self.assertEqual(sorted(order.items.values_list('quantity', flat=True)), [2, 3])
+        self.assertEqual(order.total_amount, Decimal('40.00'))
+        self.assertFalse(self.cart.items.exists())
+        self.assertTrue(all(book.updated_at > self.stamp for book in Book.objects.all()))
+
+    def test_guarded_update_refuses_more_than_is_left(self):
+        # Another checkout took the stock after this one read it
+        self.assertEqual(order_service._decrement_stock({self.books[0].pk: 6, self.books[1].pk: 1}), 1)
+        Book.objects.update(stock_quantity=5, updated_at=self.stamp)
+
+        real = order_service._decrement_stock
+
+        def sold_out_meanwhile(quantities):
+            Book.objects.filter(pk=self.books[1].pk).update(stock_quantity=1)
+            return real(quantities)
+
+        with mock.patch.object(order_service, '_decrement_stock', sold_out_meanwhile):
+            with self.assertRaises(order_service.OrderError):
+                order_service.place_order(self.cart, self.customer, **ADDRESSES)
+        # Everything in the order's transaction is rolled back, the competing write with it
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(self.stock(), {'Stocked 0': 5, 'Stocked 1': 5})
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertTrue(all(book.updated_at == self.stamp for book in Book.objects.all()))
+
+    def test_short_stock_is_refused_up_front(self):
+        Book.objects.filter(pk=self.books[1].pk).update(stock_quantity=2)
+        with self.assertRaisesMessage(order_service.OrderError, "only 2 copies of 'Stocked 1'"):
+            order_service.place_order(self.cart, self.customer, **ADDRESSES)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), {'Stocked 0': 5, 'Stocked 1': 2})
+
+
+class OrderNumberTests(TransactionTestCase):
+    """Outside TestCase's wrapping transaction, so blocks can be reserved"""
+
+    def allocator(self, **kwargs):
+        return order_numbers.SequenceAllocator(name='test', prefix='T-', block_size=3, **kwargs)
+
+    def next_value(self):
+        return NumberSequence.objects.get(name='test').next_value
+
+    def test_numbers_come_from_reserved_blocks(self):
+        allocator = self.allocator()
+        self.assertEqual([allocator.next_number() for _ in range(4)],
+                         ['T-100000', 'T-100001', 'T-100002', 'T-100003'])
+        # Two blocks of three are reserved; the rest of the second is in memory
+        self.assertEqual(self.next_value(), 100006)
+        with CaptureQueriesContext(connection) as queries:
+            allocator.next_number()
+        self.assertEqual(len(queries), 0)
+
+    def test_allocators_sharing_a_sequence_never_collide(self):
+        first, second = self.allocator(), self.allocator()
+        numbers = {first: [], second: []}
+        for _ in range(5):
+            for allocator in (first, second):
+                numbers[allocator].append(int(allocator.next_number()[2:]))
+        # Interleaved blocks of three: 100000-100002 to the first, 100003-100005 to the second...
+        self.assertEqual(numbers[first], [100000, 100001, 100002, 100006, 100007])
+        self.assertEqual(numbers[second], [100003, 100004, 100005, 100009, 100010])
+
+    def test_a_forked_process_drops_its_parents_block(self):
+        allocator = self.allocator()
+        self.assertEqual(allocator.next_number(), 'T-100000')
+        with mock.patch.object(order_numbers.os, 'getpid', return_value=allocator._pid + 1):
+            self.assertEqual(allocator.next_number(), 'T-100003')
+            self.assertEqual(allocator.next_number(), 'T-100004')
+        self.assertEqual(self.next_value(), 100006)
+
+    def test_inside_a_transaction_a_single_number_is_taken(self):
+        allocator = self.allocator()
+        with transaction.atomic():
+            self.assertEqual(allocator.next_number(), 'T-100000')
+            self.assertEqual(allocator.next_number(), 'T-100001')
+            self.assertEqual(self.next_value(), 100002)
+
+        # A rolled back number is released with the transaction that took it
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.assertEqual(allocator.next_number(), 'T-100002')
+                raise IntegrityError
+        self.assertEqual(allocator.next_number(), 'T-100002')
+
+    def test_prefetch_reserves_before_the_transaction(self):
+        allocator = self.allocator()
+        allocator.prefetch()
+        self.assertEqual(self.next_value(), 100003)
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(allocator.next_number(), 'T-100000')
+        self.assertEqual(len(queries), 0)
+
+    def test_format_follows_the_settings(self):
+        self.assertEqual(order_numbers.SequenceAllocator(name='format').next_number(),
+                         f'BX{order_numbers.FIRST_ORDER_NUMBER}')
+        with override_settings(ORDER_NUMBER_PREFIX='ZZ'):
+            # A new allocator starts on the next block
+            self.assertEqual(order_numbers.SequenceAllocator(name='format').next_number(), 'ZZ100020')
+
+    def test_the_sequence_starts_above_legacy_numbers(self):
+        seed = importlib.import_module('home.migrations.0014_seed_order_number_sequence').seed_sequence
+        customer = Customer.objects.create(user=User.objects.create(username='legacy-buyer'))
+        for number in ('BX83920417', 'BX00012345', 'BXLEGACY01'):
+            Order.objects.create(customer=customer, order_number=number,
+                                 subtotal=Decimal('1.00'), total_amount=Decimal('1.00'))
+        NumberSequence.objects.filter(name='order').delete()
+        seed(django_apps, None)
+        self.assertEqual(NumberSequence.objects.get(name='order').next_value, 83920418)
+
+        # An existing sequence is only ever moved forwards
+        NumberSequence.objects.filter(name='order').update(next_value=90000000)
+        seed(django_apps, None)
+        self.assertEqual(NumberSequence.objects.get(name='order').next_value, 90000000)
+
+
+class StaleCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Abandoned', slug='abandoned', description='x', price=Decimal('3.00'))
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key='live', session_data='', expire_date=now + timedelta(days=1)),
+            Session(session_key='expired-1', session_data='', expire_date=now - timedelta(days=1)),
+            Session(session_key='expired-2', session_data='', expire_date=now - timedelta(days=1)),
+        ])
+        customer = Customer.objects.create(user=User.objects.create(username='cart-owner'))
+        cls.carts = {
+            key: Cart.objects.create(session_key=key)
+            for key in ('live', 'expired-1', 'expired-2', 'deleted')
+        }
+        cls.carts['customer'] = Cart.objects.create(customer=customer)
+        for cart in cls.carts.values():
+            CartItem.objects.create(cart=cart, book=cls.book, quantity=1, price=cls.book.price)
+
+    def stale(self):
+        return sorted(cart_service.stale_carts().values_list('session_key', flat=True))
+
+    def test_db_sessions_decide_which_carts_are_stale(self):
+        self.assertEqual(self.stale(), ['deleted', 'expired-1', 'expired-2'])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies', SESSION_COOKIE_AGE=3600)
+    def test_other_engines_go_by_last_activity(self):
+        old = timezone.now() - timedelta(hours=2)
+        Cart.objects.update(updated_at=old)
+        CartItem.objects.update(updated_at=old)
+        # Recent activity on the cart or on one of its items keeps it
+        Cart.objects.filter(pk=self.carts['live'].pk).update(updated_at=timezone.now())
+        CartItem.objects.filter(cart=self.carts['expired-1']).update(updated_at=timezone.now())
+        self.assertEqual(self.stale(), ['deleted', 'expired-2'])
+
+    def test_dry_run_counts_what_a_purge_deletes(self):
+        would = cart_service.purge_stale_carts(dry_run=True)
+        self.assertEqual(Cart.objects.count(), 5)
+        self.assertEqual(cart_service.purge_stale_carts(batch_size=2), would)
+        self.assertEqual(would, (3, 3))
+        self.assertEqual(sorted(Cart.objects.values_list('session_key', flat=True), key=str),
+                         sorted([None, 'live'], key=str))
+
+    def test_a_cart_revived_after_being_listed_is_kept(self):
+        listed = cart_service.stale_carts
+        calls = []
+
+        def stale_carts(now=None):
+            calls.append(now)
+            if len(calls) == 2:
+                # The visitor behind expired-2 comes back between listing the
+                # batch and deleting it
+                Session.objects.filter(session_key='expired-2').update(
+                    expire_date=timezone.now() + timedelta(days=1)
+                )
+            return listed(now)
+
+        with mock.patch.object(cart_service, 'stale_carts', stale_carts):
+            self.assertEqual(cart_service.purge_stale_carts(batch_size=3), (2, 2))
+        self.assertTrue(Cart.objects.filter(session_key='expired-2').exists())
+
+    def test_command_reports_counts(self):
+        out = io.StringIO()
+        call_command('purge_stale_carts', '--dry-run', stdout=out)
+        self.assertIn('Would delete 3 stale cart(s) and 3 item(s)', out.getvalue())
+        call_command('purge_stale_carts', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 3 stale cart(s) and 3 item(s)', out.getvalue())
+        self.assertEqual(Cart.objects.count(), 2)
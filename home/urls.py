@@ -5,7 +5,9 @@ urlpatterns = [
     # Main pages
     path('', views.home, name='home'),
     path('shop/', views.shop, name='shop'),
+    path('shop/api/', views.shop_api, name='shop_api'),
     path('book/<slug:slug>/', views.book_detail, name='book_detail'),
+    path('api/books/<slug:slug>/', views.catalog_book, name='catalog_book'),
     
     # Cart operations
     path('cart/data/', views.cart_data, name='cart_data'),
@@ -1,201 +1,278 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.cache import cache_control
 from django.contrib import messages
 from .models import Book, Category, Cart, CartItem, Customer, Order, OrderItem, Address
+from .pagination import KeysetPaginator, RankedPaginator, InvalidCursor, estimated_count
+from . import cart as cart_service
+from . import orders as order_service
+from . import caching, recommendations, search
 from decimal import Decimal
 from django.views.decorators.csrf import csrf_protect
 import json
+from urllib.parse import quote
 
 def home(request):
     """Homepage with trending books"""
-    trending_books = Book.objects.filter(
-        is_active=True,
-        is_featured=True
-    ).order_by('-created_at')[:8]
-    
     context = {
-        'trending_books': trending_books,
+        'trending_books': caching.trending_books(),
     }
     return render(request, 'home.html', context)
 
 
-def shop(request):
-    """Shop page with all books"""
-    books = Book.objects.filter(is_active=True).order_by('-created_at')
-    categories = Category.objects.filter(is_active=True, parent=None)
-    
+def _shop_books(request):
+    """Active books filtered by the shop's category/search query params"""
+    books = Book.objects.filter(is_active=True)
+
     # Filter by category if provided
     category_slug = request.GET.get('category')
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
         books = books.filter(categories=category)
-    
-    # Search functionality
+
     search_query = request.GET.get('search')
+    return books, category_slug, search_query
+
+
+def _shop_page(request, books, search_query):
+    """
+    Fetch the page requested by ?cursor=, restarting on a bad cursor.
+
+    Plain listings are keyset-paginated newest first; searches are paginated
+    over the ranked result list, best match first.
+    """
+    cards = books.select_related('cover').prefetch_related('authors')
     if search_query:
-        books = books.filter(title__icontains=search_query)
-    
+        ranked_ids = search.search_ids('book', search_query)
+        # Apply the category/active filters to the ranked ids in one query
+        matching = set(books.filter(id__in=ranked_ids).values_list('id', flat=True))
+        paginator = RankedPaginator(cards, [pk for pk in ranked_ids if pk in matching])
+    else:
+        paginator = KeysetPaginator(cards)
+    try:
+        return paginator.get_page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return paginator.get_page()
+
+
+def _shop_count(books, category_slug, page):
+    """Total for the listing: exact for searches, a cached count otherwise"""
+    if page.total is not None:
+        return page.total
+    return estimated_count(books, category_slug)
+
+
+def _book_card(book):
+    """Serialize a book for the shop's infinite scroll"""
+    authors = list(book.authors.all())
+    return {
+        'id': book.id,
+        'title': book.title,
+        'slug': book.slug,
+        'url': book.get_absolute_url(),
+        'author': authors[0].full_name if authors else '',
+        'price': str(book.price),
+        'compare_at_price': str(book.compare_at_price) if book.compare_at_price else '',
+        'discount_percentage': book.discount_percentage if book.is_on_sale else 0,
+        'is_in_stock': book.is_in_stock,
+        'is_low_stock': book.is_low_stock,
+        'image': book.cover.card_url if book.cover else '',
+    }
+
+
+def shop(request):
+    """Shop page with all books"""
+    books, category_slug, search_query = _shop_books(request)
+    categories = caching.root_categories()
+    page = _shop_page(request, books, search_query)
+
     context = {
-        'books': books,
+        'books': page,
+        'page': page,
+        'total_count': _shop_count(books, category_slug, page),
         'categories': categories,
         'current_category': category_slug,
+        'search_query': search_query,
     }
     return render(request, 'shop.html', context)
 
 
+def shop_api(request):
+    """JSON feed of shop pages for infinite scroll"""
+    books, category_slug, search_query = _shop_books(request)
+    page = _shop_page(request, books, search_query)
+
+    data = {
+        'books': [_book_card(book) for book in page],
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+    }
+    if request.GET.get('count'):
+        data['total_count'] = _shop_count(books, category_slug, page)
+    return JsonResponse(data)
+
+
 def book_detail(request, slug):
     """Book detail page"""
     book = get_object_or_404(Book, slug=slug, is_active=True)
-    related_books = Book.objects.filter(
-        categories__in=book.categories.all(),
-        is_active=True
-    ).exclude(id=book.id).distinct()[:4]
+    related_books = recommendations.related_books(book, limit=4)
+    if not related_books:
+        # Books added since the last build_related_books run have no
+        # precomputed neighbours yet
+        related_books = list(Book.objects.filter(
+            categories__in=book.categories.all(),
+            is_active=True
+        ).exclude(id=book.id).select_related('cover').distinct()[:4])
     
     context = {
         'book': book,
+        'reviews': book.reviews.filter(is_approved=True).select_related('customer__user'),
         'related_books': related_books,
     }
     return render(request, 'book_detail.html', context)
 
 
-def get_or_create_cart(request):
-    """Get or create cart for user/session"""
-    if request.user.is_authenticated:
-        try:
-            customer = Customer.objects.get(user=request.user)
-        except Customer.DoesNotExist:
-            # Create customer profile for the user
-            customer = Customer.objects.create(user=request.user)
-        cart, created = Cart.objects.get_or_create(customer=customer)
-    else:
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        cart, created = Cart.objects.get_or_create(session_key=session_key)
-    return cart
+@require_GET
+async def catalog_book(request, slug):
+    """
+    Read-only JSON for one book: the shop card plus the fields a quick
+    view needs
+    """
+    book = await aget_object_or_404(
+        Book.objects.select_related('cover', 'publisher').prefetch_related('authors', 'categories'),
+        slug=slug,
+        is_active=True,
+    )
+    return JsonResponse({
+        **_book_card(book),
+        'subtitle': book.subtitle,
+        'description': book.description,
+        'authors': [author.full_name for author in book.authors.all()],
+        'categories': [category.name for category in book.categories.all()],
+        'publisher': book.publisher.name if book.publisher else '',
+        'stock_quantity': book.stock_quantity,
+    })
 
 
 @require_POST
-def add_to_cart(request, book_id):
+async def add_to_cart(request, book_id):
     """Add book to cart via AJAX"""
-    book = get_object_or_404(Book, id=book_id, is_active=True)
-    
-    if not book.is_in_stock:
+    book = await aget_object_or_404(Book, id=book_id, is_active=True)
+    cart = await cart_service.aget_or_create_cart(request)
+
+    try:
+        await cart_service.aadd_book(cart, book)
+    except cart_service.CartError as e:
         return JsonResponse({
             'success': False,
-            'message': 'This book is out of stock'
+            'message': str(e)
         })
     
-    cart = get_or_create_cart(request)
-    
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        book=book,
-        defaults={'price': book.price}
-    )
-    
-    if not created:
-        if cart_item.quantity < book.stock_quantity:
-            cart_item.quantity += 1
-            cart_item.save()
-        else:
-            return JsonResponse({
-                'success': False,
-                'message': 'Maximum stock quantity reached'
-            })
-    
     return JsonResponse({
         'success': True,
         'message': 'Book added to cart',
-        'cart_count': cart.total_items,
-        'cart_subtotal': str(cart.subtotal)
+        **await cart_service.asummary_payload(cart)
     })
 
 
 @require_POST
-def update_cart_item(request, item_id):
+async def update_cart_item(request, item_id):
     """Update cart item quantity"""
     data = json.loads(request.body)
     quantity = int(data.get('quantity', 1))
     
-    cart = get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
+    # Without a cart there is no item to find, so this 404s without writing
+    cart = await cart_service.aget_cart(request)
+    cart_item = await aget_object_or_404(CartItem.objects.select_related('book'), id=item_id, cart=cart)
     
-    if quantity <= 0:
-        cart_item.delete()
+    try:
+        cart_item = await cart_service.aset_quantity(cart, cart_item, quantity)
+    except cart_service.CartError as e:
         return JsonResponse({
-            'success': True,
-            'message': 'Item removed from cart',
-            'cart_count': cart.total_items,
-            'cart_subtotal': str(cart.subtotal)
+            'success': False,
+            'message': str(e)
         })
-    
-    if quantity > cart_item.book.stock_quantity:
+
+    if cart_item is None:
         return JsonResponse({
-            'success': False,
-            'message': 'Quantity exceeds available stock'
+            'success': True,
+            'message': 'Item removed from cart',
+            **await cart_service.asummary_payload(cart)
         })
     
-    cart_item.quantity = quantity
-    cart_item.save()
-    
     return JsonResponse({
         'success': True,
         'message': 'Cart updated',
         'item_total': str(cart_item.total_price),
-        'cart_count': cart.total_items,
-        'cart_subtotal': str(cart.subtotal)
+        **await cart_service.asummary_payload(cart)
     })
 
 
 @require_POST
-def remove_from_cart(request, item_id):
+async def remove_from_cart(request, item_id):
     """Remove item from cart"""
-    cart = get_or_create_cart(request)
-    cart_item = get_object_or_404(CartItem, id=item_id, cart=cart)
-    cart_item.delete()
+    cart = await cart_service.aget_cart(request)
+    cart_item = await aget_object_or_404(CartItem, id=item_id, cart=cart)
+    await cart_service.aremove_item(cart, cart_item)
     
     return JsonResponse({
         'success': True,
         'message': 'Item removed from cart',
-        'cart_count': cart.total_items,
-        'cart_subtotal': str(cart.subtotal)
+        **await cart_service.asummary_payload(cart)
     })
 
 
-def cart_data(request):
-    """Get cart data for sidebar"""
-    cart = get_or_create_cart(request)
-    cart_items = cart.items.select_related('book').all()
-    
-    items_data = [{
-        'id': item.id,
-        'book_title': item.book.title,
-        'book_slug': item.book.slug,
-        'book_image': item.book.images.filter(is_primary=True).first().image.url if item.book.images.filter(is_primary=True).exists() else '',
-        'quantity': item.quantity,
-        'price': str(item.price),
-        'total': str(item.total_price),
-    } for item in cart_items]
-    
-    return JsonResponse({
-        'items': items_data,
-        'total_items': cart.total_items,
-        'subtotal': str(cart.subtotal),
-        'is_empty': cart.is_empty
-    })
+@cache_control(private=True, no_cache=True)
+async def cart_data(request):
+    """
+    Get cart data for sidebar.
+
+    The sidebar polls this on every page, so unchanged carts are answered
+    with 304 Not Modified straight from the ETag check. Visitors without a
+    cart get an empty one, and no cart or session is created for them.
+    The check is done here rather than with @condition, which calls its
+    etag_func synchronously.
+    """
+    cart = await cart_service.aget_cart(request)
+    summary = await cart_service.aget_summary(cart)
+    etag = quote_etag(cart_service.summary_etag(cart, summary))
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        items_data = [{
+            'id': item.id,
+            'book_title': item.book.title,
+            'book_slug': item.book.slug,
+            'book_image': item.book.cover.thumb_url if item.book.cover else '',
+            'quantity': item.quantity,
+            'price': str(item.price),
+            'total': str(item.total_price),
+        } async for item in cart_service.items_with_covers(cart)] if summary['line_count'] else []
+
+        response = JsonResponse({
+            'items': items_data,
+            'total_items': summary['total_items'],
+            'subtotal': str(summary['subtotal']),
+            'is_empty': summary['total_items'] == 0
+        })
+    response.headers.setdefault('ETag', etag)
+    return response
+
+
 def checkout(request):
     """Checkout page"""
-    cart = get_or_create_cart(request)
+    cart = cart_service.get_cart(request)
     
-    if cart.is_empty:
+    if cart is None or cart.is_empty:
         messages.warning(request, "Your cart is empty")
         return redirect('shop')
     
     # Check stock availability
-    for item in cart.items.all():
+    cart_items = list(cart.items.select_related('book__cover'))
+    for item in cart_items:
         if item.quantity > item.book.stock_quantity:
             messages.error(request, f"Sorry, only {item.book.stock_quantity} copies of '{item.book.title}' are available")
             return redirect('cart_detail')
@@ -212,6 +289,7 @@ def checkout(request):
     
     context = {
         'cart': cart,
+        'cart_items': cart_items,
         'customer': customer,
         'addresses': addresses,
     }
@@ -221,18 +299,11 @@ def checkout(request):
 @csrf_protect
 def place_order(request):
     """Place order and redirect to WhatsApp"""
-    cart = get_or_create_cart(request)
-    
-    if cart.is_empty:
-        messages.error(request, "Your cart is empty")
+    cart = cart_service.get_cart(request)
+    if cart is None:
+        messages.warning(request, "Your cart is empty")
         return redirect('shop')
     
-    # Validate cart items stock
-    for item in cart.items.all():
-        if item.quantity > item.book.stock_quantity:
-            messages.error(request, f"Sorry, only {item.book.stock_quantity} copies of '{item.book.title}' are available")
-            return redirect('checkout')
-    
     # Get form data
     billing_first_name = request.POST.get('billing_first_name')
     billing_last_name = request.POST.get('billing_last_name')
@@ -277,54 +348,40 @@ def place_order(request):
         except Customer.DoesNotExist:
             pass
     
-    # Create order
-    order = Order.objects.create(
-        customer=customer,
-        # Billing address
-        billing_first_name=billing_first_name,
-        billing_last_name=billing_last_name,
-        billing_address_line_1=billing_address_line_1,
-        billing_address_line_2=billing_address_line_2,
-        billing_city=billing_city,
-        billing_state=billing_state,
-        billing_postal_code=billing_postal_code,
-        billing_country=billing_country,
-        billing_phone=billing_phone,
-        # Shipping address
-        shipping_first_name=shipping_first_name,
-        shipping_last_name=shipping_last_name,
-        shipping_address_line_1=shipping_address_line_1,
-        shipping_address_line_2=shipping_address_line_2,
-        shipping_city=shipping_city,
-        shipping_state=shipping_state,
-        shipping_postal_code=shipping_postal_code,
-        shipping_country=shipping_country,
-        shipping_phone=shipping_phone,
-        # Order totals
-        subtotal=cart.subtotal,
-        shipping_cost=Decimal('0.00'),  # Free shipping for now
-        tax_amount=Decimal('0.00'),     # No tax for now
-        total_amount=cart.subtotal,
-        status='pending'
-    )
-    
-    # Create order items
-    for cart_item in cart.items.all():
-        OrderItem.objects.create(
-            order=order,
-            book=cart_item.book,
-            quantity=cart_item.quantity,
-            price=cart_item.price,
-            total=cart_item.total_price
+    # Create the order, reserve its stock and empty the cart in one transaction
+    try:
+        order = order_service.place_order(
+            cart,
+            customer,
+            # Billing address
+            billing_first_name=billing_first_name,
+            billing_last_name=billing_last_name,
+            billing_address_line_1=billing_address_line_1,
+            billing_address_line_2=billing_address_line_2,
+            billing_city=billing_city,
+            billing_state=billing_state,
+            billing_postal_code=billing_postal_code,
+            billing_country=billing_country,
+            billing_phone=billing_phone,
+            # Shipping address
+            shipping_first_name=shipping_first_name,
+            shipping_last_name=shipping_last_name,
+            shipping_address_line_1=shipping_address_line_1,
+            shipping_address_line_2=shipping_address_line_2,
+            shipping_city=shipping_city,
+            shipping_state=shipping_state,
+            shipping_postal_code=shipping_postal_code,
+            shipping_country=shipping_country,
+            shipping_phone=shipping_phone,
         )
-    
-    # Clear the cart
-    cart.items.all().delete()
+    except order_service.OrderError as e:
+        messages.error(request, str(e))
+        return redirect('checkout' if cart.items.exists() else 'shop')
     
     # Generate WhatsApp URL
     whatsapp_message = order.generate_whatsapp_message()
     whatsapp_number = "254712345678"  # Replace with your actual WhatsApp number
-    whatsapp_url = f"https://wa.me/{whatsapp_number}?text={whatsapp_message.replace(' ', '%20').replace('\n', '%0A')}"
+    whatsapp_url = f"https://wa.me/{whatsapp_number}?text={quote(whatsapp_message)}"
     
     # Store order ID in session for confirmation page
     request.session['last_order_id'] = str(order.id)
@@ -356,7 +413,7 @@ def order_confirmation(request):
 # Add this to your existing cart views if you don't have a cart detail page
 def cart_detail(request):
     """Cart detail page"""
-    cart = get_or_create_cart(request)
+    cart = cart_service.get_cart(request)
     context = {
         'cart': cart,
     }